@@ -1,47 +1,247 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from typing import Optional, Tuple
+from jose.exceptions import JWTError
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from database import get_db, User
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import DB_SHARD_DIR, get_read_db, read_session, enter_family, User
+from hashing import hash_password, verify_and_update, HASH_RETRY_AFTER
 
 # Security configuration
 SECRET_KEY = "your-secret-key-change-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+def _jwt():
+    # jose.jwt loads its cryptography backend on import (~50 ms); defer that to the first token
+    from jose import jwt
+    return jwt
+
+# Authenticated principals are cached per process so most requests skip the users table
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated caller, as carried in the token claims"""
+    id: int
+    username: str
+    role: str
+    parent_id: Optional[int]
+    child_ids: Tuple[int, ...]
+    version: int
+    family_id: Optional[int] = None  # Which family database holds the caller's data (DB_SHARD_DIR only)
+
+    @classmethod
+    def from_user(cls, user: User, child_ids=()):
+        return cls(
+            id=user.id,
+            username=user.username,
+            role=user.role,
+            parent_id=user.parent_id,
+            child_ids=tuple(sorted(child_ids)),
+            version=user.auth_version or 1,
+            family_id=user.family_id,
+        )
+
+class PrincipalCache:
+    """Bounded LRU of principals with a TTL, keyed by user id and auth version.
+
+    A token hits the cache unless it carries a newer version than the cached
+    principal, which means the principal went stale in another process. Tokens
+    with an older version get the cached principal, which was loaded after
+    their claims went stale, rather than missing until they expire. The TTL
+    bounds how long other processes can serve a principal that was
+    invalidated elsewhere.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, version: int) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            principal, expires = entry
+            if principal.version < version or expires < time.monotonic():
+                return None
+            self._entries.move_to_end(user_id)
+            return principal
+
+    def put(self, principal: Principal):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[principal.id] = (principal, time.monotonic() + self.ttl)
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
 
+    def invalidate(self, *user_ids: int):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+
+# Synchronous hashing for scripts; endpoints await hashing.password_hasher instead
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return verify_and_update(plain_password, hashed_password)[0]
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return hash_password(password)
+
+def hashing_busy_exception():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-ins in progress, please retry shortly",
+        headers={"Retry-After": str(HASH_RETRY_AFTER)},
+    )
+
+async def load_principal(db: AsyncSession, user: User) -> Principal:
+    child_ids = ()
+    if user.role == "parent":
+        child_ids = (await db.scalars(select(User.id).where(User.parent_id == user.id))).all()
+    return Principal.from_user(user, child_ids)
 
-def create_access_token(data: dict):
-    to_encode = data.copy()
+def create_access_token(principal: Principal):
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    to_encode = {
+        "sub": principal.username,
+        "uid": principal.id,
+        "role": principal.role,
+        "parent": principal.parent_id,
+        "children": list(principal.child_ids),
+        "fam": principal.family_id,
+        "ver": principal.version,
+        "exp": expire,
+    }
+    encoded_jwt = _jwt().encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
+async def invalidate_principals(db: AsyncSession, *user_ids: int):
+    """Retire cached principals and issued token claims for `user_ids`.
+
+    Call before committing any change to a user's role or parent/child links.
+    """
+    await db.execute(
+        update(User).where(User.id.in_(user_ids)).values(auth_version=User.auth_version + 1),
+        execution_options={"synchronize_session": False},
+    )
+    principal_cache.invalidate(*user_ids)
+
+def principal_from_claims(payload: dict) -> Optional[Principal]:
+    """The principal a token's claims describe, or None if the token predates some of them.
+
+    With DB_SHARD_DIR set, a token without a family predates split_shards.py,
+    which leaves auth versions alone, so its claims cannot say where the data is.
+    """
+    if DB_SHARD_DIR and payload.get("fam") is None:
+        return None
+    try:
+        return Principal(
+            id=payload["uid"],
+            username=payload["sub"],
+            role=payload["role"],
+            parent_id=payload["parent"],
+            child_ids=tuple(payload["children"]),
+            version=payload["ver"],
+            family_id=payload["fam"],
+        )
+    except (KeyError, TypeError):
+        return None
+
+def token_user_id(token: str) -> Optional[int]:
+    """The user id claimed by a validly signed, unexpired token, or None"""
+    try:
+        user_id = _jwt().decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("uid")
+    except JWTError:
+        return None
+    return user_id if isinstance(user_id, int) else None
+
+async def authenticate(token: Optional[str], db: AsyncSession) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    if not token:
+        raise credentials_exception
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = _jwt().decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
-    user = db.query(User).filter(User.username == username).first()
+
+    # Fast path: the token's version still matches a cached principal, no query needed
+    user_id, version = payload.get("uid"), payload.get("ver")
+    if user_id is not None and version is not None:
+        principal = principal_cache.get(user_id, version)
+        if principal is not None:
+            return principal
+
+    # Signed claims at the user's current version are as good as a fresh load: every change
+    # to a role, link or family bumps auth_version, so one primary-key lookup confirms them
+    claimed = principal_from_claims(payload)
+    if claimed is not None:
+        current_version = await db.scalar(select(User.auth_version).where(User.id == claimed.id))
+        if current_version is None:
+            raise credentials_exception
+        if (current_version or 1) == claimed.version:
+            principal_cache.put(claimed)
+            return claimed
+
+    user = await db.scalar(select(User).where(User.username == username))
     if user is None:
         raise credentials_exception
-    return user
\ No newline at end of file
+    principal = await load_principal(db, user)
+    principal_cache.put(principal)
+    return principal
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: AsyncSession = Depends(get_read_db)):
+    principal = await authenticate(credentials.credentials, db)
+    await enter_family(principal.family_id)
+    return principal
+
+async def get_stream_user(token: Optional[str] = None, credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)):
+    """get_current_user for long-lived streams.
+
+    Also accepts ?token=, since browsers' EventSource cannot send headers, and
+    uses its own short session so an open stream does not pin a pooled connection.
+    """
+    async with read_session() as db:
+        principal = await authenticate(credentials.credentials if credentials else token, db)
+    await enter_family(principal.family_id)
+    return principal
+
+def visible_owner_ids(user, child_id=None):
+    """Ids of the users whose folders and notes `user` may read.
+
+    Parents see all linked children, or just `child_id` if it is one of them;
+    children only ever see their own data.
+    """
+    if user.role == "parent":
+        child_ids = list(user.child_ids)
+        if child_id and child_id in child_ids:
+            return [child_id]
+        return child_ids
+    return [user.id]
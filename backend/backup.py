@@ -0,0 +1,384 @@
+"""
+Streaming account export (GET /export) and resumable import (POST /import).
+
+An export is either NDJSON or a zip of Markdown files. The NDJSON form is
+an `export` header line, one `user` line per owner, then every folder, then
+every note, each as one JSON object:
+
+    {"type": "export", "version": 1, "exported_at": "...", "owner_ids": [3]}
+    {"type": "user", "id": 3, "username": "ananya"}
+    {"type": "folder", "id": 7, "owner_id": 3, "name": "School", "created_at": "..."}
+    {"type": "note", "id": 42, "owner_id": 3, "folder_id": 7, "title": "...", ...}
+
+Rows come off a server-side cursor EXPORT_BATCH_SIZE at a time and are
+written out before the next batch is fetched, so memory does not grow with
+the account. The zip is produced the same way by ZipStream, which spools
+its central directory to a temporary file instead of keeping it in memory.
+The whole export reads from one snapshot; with the default rollback
+journal that holds off writers until it finishes, so serve large accounts
+with DB_PROFILE=production (WAL).
+
+An import reads NDJSON from the request body as it arrives and commits
+every IMPORT_BATCH_SIZE lines in its own transaction, together with the
+job's line count. If the upload fails, posting the same file again with
+?job_id= skips the lines already committed and carries on. Folders are
+recreated and notes keep their timestamps, but every id is new.
+"""
+import os
+import re
+import struct
+import tempfile
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, List, Literal, Optional
+
+import orjson
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from batch import create_notes
+from database import read_session, write_session, User, Folder, Note, ImportJob, ImportFolder
+from events import broker, batch_event
+from stats import apply_stats_delta
+
+EXPORT_VERSION = 1
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))  # Rows fetched per round trip
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))  # Lines committed per transaction
+MAX_IMPORT_LINE = int(os.getenv("MAX_IMPORT_LINE", str(16 * 1024 * 1024)))  # Bytes
+
+FOLDER_COLUMNS = (Folder.id, Folder.owner_id, Folder.name, Folder.created_at)
+NOTE_COLUMNS = (
+    Note.id, Note.owner_id, Note.folder_id, Note.title, Note.content, Note.tags,
+    Note.is_todo, Note.is_completed, Note.created_at, Note.updated_at,
+)
+
+class InvalidImportLine(ValueError):
+    """A line of the upload that cannot be imported; the job stops before it"""
+
+class ImportConflict(Exception):
+    """Another upload of the same job committed first"""
+
+# Export
+
+def _line(record: dict) -> bytes:
+    return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+
+async def _stream(db: AsyncSession, statement) -> AsyncIterator[list]:
+    """Batches of row mappings from a server-side cursor"""
+    result = await db.stream(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    async for rows in result.mappings().partitions():
+        yield rows
+
+async def export_ndjson(owner_ids: List[int]) -> AsyncIterator[bytes]:
+    # Its own session: the stream outlives the request's dependencies
+    async with read_session() as db:
+        yield _line({"type": "export", "version": EXPORT_VERSION, "exported_at": datetime.utcnow(), "owner_ids": owner_ids})
+        for user in await db.execute(select(User.id, User.username).where(User.id.in_(owner_ids)).order_by(User.id)):
+            yield _line({"type": "user", "id": user.id, "username": user.username})
+        for kind, columns, model in (("folder", FOLDER_COLUMNS, Folder), ("note", NOTE_COLUMNS, Note)):
+            async for rows in _stream(db, select(*columns).where(model.owner_id.in_(owner_ids), model.deleted_at.is_(None))):
+                yield b"".join(_line({"type": kind, **row}) for row in rows)
+
+def _path_part(name: Optional[str], fallback: str, limit: int = 60) -> str:
+    """`name` made safe as one component of a zip path"""
+    cleaned = re.sub(r'[\x00-\x1f/\\:*?"<>|]+', "-", name or "").strip(" .-")[:limit].strip(" .-")
+    return cleaned or fallback
+
+def note_markdown(note) -> bytes:
+    # JSON strings are valid YAML scalars, so the front matter needs no escaping rules of its own
+    front_matter = [
+        f"id: {note.id}",
+        f"title: {orjson.dumps(note.title or '').decode()}",
+        f"tags: {orjson.dumps(note.tags or '').decode()}",
+        f"todo: {'true' if note.is_todo else 'false'}",
+        f"completed: {'true' if note.is_completed else 'false'}",
+        f"created_at: {note.created_at.isoformat() if note.created_at else ''}",
+        f"updated_at: {note.updated_at.isoformat() if note.updated_at else ''}",
+    ]
+    return ("---\n" + "\n".join(front_matter) + f"\n---\n\n# {note.title or ''}\n\n{note.content or ''}\n").encode()
+
+async def export_zip(owner_ids: List[int]) -> AsyncIterator[bytes]:
+    """username/folder/title-id.md for every note; notes outside a folder go under Unfiled"""
+    archive = ZipStream()
+    statement = (
+        select(*NOTE_COLUMNS, User.username, Folder.name.label("folder_name"))
+        .join(User, User.id == Note.owner_id)
+        .outerjoin(Folder, Folder.id == Note.folder_id)
+        .where(Note.owner_id.in_(owner_ids), Note.deleted_at.is_(None))
+    )
+    try:
+        async with read_session() as db:
+            async for rows in _stream(db, statement):
+                for note in rows:
+                    folder = _path_part(note.folder_name, "Unfiled") if note.folder_id else "Unfiled"
+                    path = f"{_path_part(note.username, str(note.owner_id))}/{folder}/{_path_part(note.title, 'note')}-{note.id}.md"
+                    archive.add(path, note_markdown(note), note.updated_at or note.created_at)
+                yield archive.drain()
+        for chunk in archive.finish():
+            yield chunk
+    finally:
+        archive.close()
+
+class ZipStream:
+    """Zip writer for a non-seekable stream with constant memory.
+
+    Each entry is compressed whole (a note is small), so its local header can
+    carry the real sizes and no data descriptor is needed. Central directory
+    records are spooled to a temporary file until finish(). Zip64 records are
+    added once the archive passes 65535 entries or 4 GiB.
+    """
+
+    def __init__(self, level: int = 6):
+        self.level = level
+        self.buffer = bytearray()
+        self.offset = 0
+        self.entries = 0
+        self.central = tempfile.SpooledTemporaryFile(max_size=1 << 20)
+        self.central_size = 0
+
+    def add(self, name: str, data: bytes, modified: Optional[datetime] = None):
+        encoded_name = name.encode()
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        payload, method = compressor.compress(data) + compressor.flush(), 8
+        if len(payload) >= len(data):
+            payload, method = data, 0
+        crc = zlib.crc32(data)
+        time, date = _dos_time(modified or datetime.utcnow())
+        flags = 0x800  # UTF-8 names
+
+        self.buffer += struct.pack("<IHHHHHIIIHH", 0x04034B50, 20, flags, method, time, date, crc, len(payload), len(data), len(encoded_name), 0)
+        self.buffer += encoded_name
+        self.buffer += payload
+
+        extra, offset, version = b"", self.offset, 20
+        if offset >= 0xFFFFFFFF:
+            extra, offset, version = struct.pack("<HHQ", 1, 8, self.offset), 0xFFFFFFFF, 45
+        record = struct.pack(
+            "<IHHHHHHIIIHHHHHII", 0x02014B50, 0x0300 | version, version, flags, method, time, date, crc, len(payload), len(data),
+            len(encoded_name), len(extra), 0, 0, 0, 0o644 << 16, offset,
+        ) + encoded_name + extra
+        self.central.write(record)
+        self.central_size += len(record)
+        self.offset += 30 + len(encoded_name) + len(payload)
+        self.entries += 1
+
+    def drain(self) -> bytes:
+        data, self.buffer = bytes(self.buffer), bytearray()
+        return data
+
+    def finish(self):
+        """Yield what is buffered, the central directory and the end records"""
+        yield self.drain()
+        self.central.seek(0)
+        while chunk := self.central.read(1 << 16):
+            yield chunk
+
+        start, size, entries = self.offset, self.central_size, self.entries
+        end = b""
+        if entries >= 0xFFFF or start >= 0xFFFFFFFF or size >= 0xFFFFFFFF:
+            zip64_end = start + size
+            end += struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, entries, entries, size, start)
+            end += struct.pack("<IIQI", 0x07064B50, 0, zip64_end, 1)
+            entries, size, start = min(entries, 0xFFFF), min(size, 0xFFFFFFFF), min(start, 0xFFFFFFFF)
+        end += struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, entries, entries, size, start, 0)
+        yield end
+
+    def close(self):
+        self.central.close()
+
+def _dos_time(moment: datetime):
+    moment = max(moment, datetime(1980, 1, 1))
+    return (moment.hour << 11) | (moment.minute << 5) | (moment.second // 2), ((moment.year - 1980) << 9) | (moment.month << 5) | moment.day
+
+# Import
+
+class ImportedFolder(BaseModel):
+    type: Literal["folder"]
+    id: int
+    name: str
+    created_at: Optional[datetime] = None
+
+class ImportedNote(BaseModel):
+    type: Literal["note"]
+    title: str
+    content: str = ""
+    tags: Optional[str] = ""
+    is_todo: bool = False
+    is_completed: bool = False
+    folder_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+def parse_line(line: bytes):
+    """An ImportedFolder or ImportedNote, or None for lines that carry nothing to import"""
+    try:
+        record = orjson.loads(line)
+    except orjson.JSONDecodeError as error:
+        raise InvalidImportLine(f"invalid JSON ({error})")
+    if not isinstance(record, dict):
+        raise InvalidImportLine("expected a JSON object")
+    kind = record.get("type")
+    if kind == "export":
+        if record.get("version") != EXPORT_VERSION:
+            raise InvalidImportLine(f"unsupported export version {record.get('version')!r}")
+        return None
+    if kind == "user":
+        return None
+    model = {"folder": ImportedFolder, "note": ImportedNote}.get(kind)
+    if model is None:
+        raise InvalidImportLine(f"unknown record type {kind!r}")
+    try:
+        return model.model_validate(record)
+    except ValidationError as error:
+        raise InvalidImportLine("; ".join(f"{'.'.join(map(str, item['loc']))}: {item['msg']}" for item in error.errors()))
+
+async def read_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Split a byte stream into lines without holding more than one line at a time"""
+    pending = bytearray()
+    async for chunk in chunks:
+        pending += chunk
+        start = 0
+        while (end := pending.find(b"\n", start)) != -1:
+            yield bytes(pending[start:end])
+            start = end + 1
+        del pending[:start]
+        if len(pending) > MAX_IMPORT_LINE:
+            raise InvalidImportLine(f"line longer than {MAX_IMPORT_LINE} bytes")
+    if pending:
+        yield bytes(pending)
+
+async def start_import(owner_id: int, job_id: Optional[int] = None) -> Optional[ImportJob]:
+    """A new job, or `job_id` reopened for resuming; None if the owner has no such job"""
+    async with write_session() as db:
+        if job_id is None:
+            job = ImportJob(owner_id=owner_id)
+            db.add(job)
+        else:
+            job = await db.get(ImportJob, job_id)
+            if job is None or job.owner_id != owner_id:
+                return None
+            if job.status != "complete":
+                job.status, job.error, job.updated_at = "running", None, datetime.utcnow()
+        await db.commit()
+        return job
+
+async def _folder_ids(db: AsyncSession, job: ImportJob, source_ids) -> dict:
+    """Source folder id -> imported folder, for folders that still exist"""
+    if not source_ids:
+        return {}
+    rows = await db.execute(
+        select(ImportFolder.source_id, ImportFolder.folder_id)
+        .join(Folder, Folder.id == ImportFolder.folder_id)
+        .where(ImportFolder.job_id == job.id, ImportFolder.source_id.in_(source_ids), Folder.owner_id == job.owner_id, Folder.deleted_at.is_(None))
+    )
+    return dict(rows.all())
+
+async def _commit_batch(db: AsyncSession, job: ImportJob, records: list, lines: int):
+    """Write one batch and advance the job by `lines` in the same transaction"""
+    folders = [record for record in records if record.type == "folder"]
+    notes = [record for record in records if record.type == "note"]
+    results = []
+    if folders:
+        now = datetime.utcnow()
+        rows = [{"name": folder.name, "owner_id": job.owner_id, "created_at": folder.created_at or now} for folder in folders]
+        # Rowids follow VALUES order within the transaction (see batch.create_notes)
+        created = sorted((await db.scalars(insert(Folder).returning(Folder.id), rows)).all())
+        await db.execute(insert(ImportFolder), [
+            {"job_id": job.id, "source_id": folder.id, "folder_id": folder_id} for folder, folder_id in zip(folders, created)
+        ])
+        await apply_stats_delta(db, job.owner_id, folder_count=len(created))
+    if notes:
+        folder_ids = await _folder_ids(db, job, {note.folder_id for note in notes if note.folder_id})
+        now = datetime.utcnow()
+        results = await create_notes(db, job.owner_id, [
+            {
+                "title": note.title,
+                "content": note.content,
+                "tags": note.tags,
+                "is_todo": note.is_todo,
+                "is_completed": note.is_completed,
+                "folder_id": folder_ids.get(note.folder_id),
+                "created_at": note.created_at or now,
+                "updated_at": note.updated_at or note.created_at or now,
+            }
+            for note in notes
+        ])
+
+    # Conditional on the line count we started from, so two uploads of one job cannot both commit
+    advanced = await db.execute(
+        update(ImportJob)
+        .where(ImportJob.id == job.id, ImportJob.lines_done == job.lines_done)
+        .values(
+            lines_done=ImportJob.lines_done + lines,
+            folders_imported=ImportJob.folders_imported + len(folders),
+            notes_imported=ImportJob.notes_imported + len(notes),
+            updated_at=datetime.utcnow(),
+        ),
+        execution_options={"synchronize_session": False},
+    )
+    if advanced.rowcount != 1:
+        await db.rollback()
+        raise ImportConflict()
+    await db.commit()
+    job.lines_done += lines
+    job.folders_imported += len(folders)
+    job.notes_imported += len(notes)
+    event = batch_event(job.owner_id, results)
+    if event:
+        await broker.publish(event)
+
+async def run_import(job: ImportJob, chunks: AsyncIterator[bytes]) -> ImportJob:
+    """Import the upload into `job`'s owner, skipping the lines it already committed.
+
+    Returns the job, complete or failed. Raises ImportConflict if another
+    upload of the job got ahead of this one.
+    """
+    skip = job.lines_done
+    line_number, records, batch_lines = 0, [], 0
+    async with write_session() as db:
+        try:
+            async for line in read_lines(chunks):
+                line_number += 1
+                if line_number <= skip:
+                    continue
+                batch_lines += 1
+                if line.strip():
+                    try:
+                        record = parse_line(line)
+                    except InvalidImportLine as error:
+                        raise InvalidImportLine(f"line {line_number}: {error}")
+                    if record is not None:
+                        records.append(record)
+                if batch_lines >= IMPORT_BATCH_SIZE:
+                    await _commit_batch(db, job, records, batch_lines)
+                    records, batch_lines = [], 0
+            if batch_lines:
+                await _commit_batch(db, job, records, batch_lines)
+            if line_number < skip:
+                raise InvalidImportLine(f"the upload has {line_number} lines but {skip} were already imported")
+            job.status, job.error = "complete", None
+        except ImportConflict:
+            raise
+        except InvalidImportLine as error:
+            job.status, job.error = "failed", str(error)
+        except BaseException:
+            # Client went away or the server is shutting down: the committed batches stand
+            job.status, job.error = "failed", "upload interrupted"
+            await _finish(db, job)
+            raise
+        await _finish(db, job)
+    return job
+
+async def _finish(db: AsyncSession, job: ImportJob):
+    await db.rollback()
+    await db.execute(
+        update(ImportJob).where(ImportJob.id == job.id).values(status=job.status, error=job.error, updated_at=datetime.utcnow()),
+        execution_options={"synchronize_session": False},
+    )
+    await db.commit()
+
+async def import_status(owner_id: int, job_id: int) -> Optional[ImportJob]:
+    async with read_session() as db:
+        job = await db.get(ImportJob, job_id)
+        return job if job is not None and job.owner_id == owner_id else None
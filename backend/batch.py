@@ -0,0 +1,161 @@
+"""
+Set-based bulk create, patch and delete of one owner's notes.
+
+Each batch runs in a single transaction with a fixed number of statements:
+one ownership query for all ids, then grouped UPDATEs, executemany INSERTs or
+an `id IN (...)` soft delete, with user_stats maintained in bulk and one
+note_tags job queued for the notes whose tags need updating.
+Every call returns one result per input item, in input order. Deleting a
+folder soft-deletes its notes the same way.
+"""
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import and_, bindparam, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer
+from sqlalchemy.orm.attributes import set_committed_value
+
+from database import Folder, Note
+from jobs import enqueue_tag_sync
+from stats import apply_stats_delta, note_counters, total_delta
+from tags import parse_tags
+
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
+
+def _error(note_id, status, detail):
+    return {"id": note_id, "status": status, "detail": detail}
+
+async def _owned_folder_ids(db: AsyncSession, owner_id: int, items):
+    folder_ids = {item["folder_id"] for item in items if item.get("folder_id")}
+    if not folder_ids:
+        return set()
+    return set(await db.scalars(select(Folder.id).where(Folder.id.in_(folder_ids), Folder.owner_id == owner_id, Folder.deleted_at.is_(None))))
+
+def _missing_folder(item, folder_ids):
+    return bool(item.get("folder_id")) and item["folder_id"] not in folder_ids
+
+async def create_notes(db: AsyncSession, owner_id: int, items: List[dict]):
+    folder_ids = await _owned_folder_ids(db, owner_id, items)
+    rows = [{**item, "owner_id": owner_id} for item in items if not _missing_folder(item, folder_ids)]
+    notes = iter([])
+    if rows:
+        # sort_by_parameter_order would make SQLite insert row by row. Rowids are
+        # assigned in VALUES order and the transaction holds the write lock, so
+        # ordering by id recovers the input order from one multi-row INSERT.
+        statement = insert(Note).returning(Note).options(undefer(Note.content))
+        notes = iter(sorted((await db.scalars(statement, rows)).all(), key=lambda note: note.id))
+
+    results, created = [], []
+    for item in items:
+        if _missing_folder(item, folder_ids):
+            results.append(_error(None, 404, "Folder not found"))
+            continue
+        note = next(notes)
+        created.append(note)
+        results.append({"id": note.id, "status": 200, "note": note})
+
+    if created:
+        enqueue_tag_sync(db, owner_id, [note.id for note in created if parse_tags(note.tags)])
+        await apply_stats_delta(db, owner_id, **total_delta((None, note_counters(note)) for note in created))
+    return results
+
+async def _apply_changes(db: AsyncSession, changes, updated_at: datetime):
+    """UPDATE notes from {note_id: {column: value}} in as few statements as possible.
+
+    Notes receiving identical changes (the usual "tick off these todos" batch)
+    share one `UPDATE ... WHERE id IN (...)`; the rest go through executemany,
+    one statement per set of changed columns.
+    """
+    by_columns = defaultdict(dict)
+    for note_id, fields in changes.items():
+        by_columns[tuple(sorted(fields))][note_id] = fields
+
+    table = Note.__table__
+    for columns, group in by_columns.items():
+        stamps = {"updated_at": updated_at}
+        if "content" in columns:
+            stamps["content_version"] = table.c.content_version + 1
+        if len({tuple(fields[column] for column in columns) for fields in group.values()}) == 1:
+            values = next(iter(group.values()))
+            await db.execute(update(table).where(table.c.id.in_(list(group))).values(**values, **stamps))
+        else:
+            statement = (
+                update(table)
+                .where(table.c.id == bindparam("note"))
+                .values({**{column: bindparam(column) for column in columns}, **stamps})
+            )
+            await db.execute(statement, [{"note": note_id, **fields} for note_id, fields in group.items()])
+
+async def patch_notes(db: AsyncSession, owner_id: int, items: List[dict]):
+    ids = {item["id"] for item in items}
+    statement = select(Note).where(Note.id.in_(ids), Note.owner_id == owner_id, Note.deleted_at.is_(None)).options(undefer(Note.content))
+    notes = {note.id: note for note in await db.scalars(statement)}
+    folder_ids = await _owned_folder_ids(db, owner_id, items)
+
+    changes, results = {}, []
+    for item in items:
+        fields = {field: value for field, value in item.items() if field != "id"}
+        if item["id"] not in notes:
+            results.append(_error(item["id"], 404, "Note not found"))
+        elif _missing_folder(fields, folder_ids):
+            results.append(_error(item["id"], 404, "Folder not found"))
+        else:
+            changes.setdefault(item["id"], {}).update(fields)
+            results.append({"id": item["id"], "status": 200, "note": notes[item["id"]]})
+    if not changes:
+        return results
+
+    before = {note_id: (notes[note_id].tags, note_counters(notes[note_id])) for note_id in changes}
+    updated_at = datetime.utcnow()
+    await _apply_changes(db, changes, updated_at)
+
+    # Bring the loaded objects up to date without marking them dirty
+    for note_id, fields in changes.items():
+        for field, value in {**fields, "updated_at": updated_at}.items():
+            set_committed_value(notes[note_id], field, value)
+    rewritten = [note_id for note_id, fields in changes.items() if "content" in fields]
+    if rewritten:
+        versions = await db.execute(select(Note.id, Note.content_version).where(Note.id.in_(rewritten)))
+        for note_id, version in versions:
+            set_committed_value(notes[note_id], "content_version", version)
+
+    enqueue_tag_sync(db, owner_id, [
+        note_id for note_id, (previous_tags, _) in before.items() if notes[note_id].tags != previous_tags
+    ])
+    await apply_stats_delta(db, owner_id, **total_delta(
+        (counters, note_counters(notes[note_id])) for note_id, (_, counters) in before.items()
+    ))
+    return results
+
+async def delete_notes(db: AsyncSession, owner_id: int, ids: List[int]):
+    statement = select(Note).where(Note.id.in_(set(ids)), Note.owner_id == owner_id, Note.deleted_at.is_(None))
+    notes = {note.id: note for note in await db.scalars(statement)}
+    if notes:
+        enqueue_tag_sync(db, owner_id, [note.id for note in notes.values() if parse_tags(note.tags)])
+        await db.execute(
+            update(Note).where(Note.id.in_(list(notes))).values(deleted_at=datetime.utcnow()),
+            execution_options={"synchronize_session": False},
+        )
+        await apply_stats_delta(db, owner_id, **total_delta((note_counters(note), None) for note in notes.values()))
+    return [{"id": note_id, "status": 200} if note_id in notes else _error(note_id, 404, "Note not found") for note_id in ids]
+
+async def soft_delete_folder(db: AsyncSession, folder: Folder):
+    """Soft-delete `folder` and the owner's live notes in it.
+
+    One UPDATE marks every note, however many there are, and returns what
+    the stats need. Returns a result per deleted note, for batch_event.
+    """
+    deleted_at = datetime.utcnow()
+    folder.deleted_at = deleted_at
+    in_folder = and_(Note.folder_id == folder.id, Note.owner_id == folder.owner_id, Note.deleted_at.is_(None))
+    notes = (await db.execute(
+        update(Note).where(in_folder).values(deleted_at=deleted_at).returning(Note.id, Note.tags, Note.is_todo, Note.is_completed),
+        execution_options={"synchronize_session": False},
+    )).all()
+    enqueue_tag_sync(db, folder.owner_id, [note.id for note in notes if parse_tags(note.tags)])
+    delta = total_delta((note_counters(note), None) for note in notes)
+    await apply_stats_delta(db, folder.owner_id, **{**delta, "folder_count": -1})
+    return [{"id": note.id, "status": 200} for note in notes]
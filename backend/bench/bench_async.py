@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Side-by-side throughput of the sync and async data layers.
+
+Serves the same paginated note listing from two minimal apps that differ only
+in the data layer. sync_app uses `def` endpoints with a blocking Session on the
+anyio threadpool. async_app uses `async def` endpoints with an AsyncSession from
+the pooled async engine. Each app runs under uvicorn against the same seeded
+database and is driven by an increasing number of concurrent clients.
+
+    python bench/bench_async.py --clients 50 100 250 500 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# database.py binds its engines on import, so point it at a scratch database first
+if __name__ == "__main__" and "DATABASE_URL" not in os.environ:
+    os.chdir(tempfile.mkdtemp())
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(os.getcwd(), 'bench.db')}"
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from fastapi import Depends, FastAPI
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session, undefer
+
+from database import get_read_db, engine, dispose_engines, SessionLocal, User, Note
+from pagination import paginate, page_statement, page_result
+
+OWNERS = 100
+NOTES_PER_OWNER = 200
+
+def get_sync_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+sync_app = FastAPI()
+async_app = FastAPI()
+
+@sync_app.get("/notes")
+def list_notes_sync(owner_id: int, db: Session = Depends(get_sync_db)):
+    statement = page_statement(select(Note).where(Note.owner_id == owner_id).options(undefer(Note.content)), Note.updated_at, Note.id)
+    return page_result(db.scalars(statement).all(), Note.updated_at, Note.id)
+
+@async_app.on_event("shutdown")
+async def dispose_async_engine():
+    await dispose_engines()
+
+@async_app.get("/notes")
+async def list_notes_async(owner_id: int, db=Depends(get_read_db)):
+    return await paginate(db, select(Note).where(Note.owner_id == owner_id).options(undefer(Note.content)), Note.updated_at, Note.id)
+
+def seed():
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"id": i, "username": f"user{i}", "email": f"user{i}@example.com", "role": "child"}
+            for i in range(1, OWNERS + 1)
+        ])
+        conn.execute(insert(Note), [
+            {"title": f"Note {n}", "content": "Body " * 40, "tags": "bench", "owner_id": owner}
+            for owner in range(1, OWNERS + 1) for n in range(NOTES_PER_OWNER)
+        ])
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def drive(base_url, clients, duration):
+    import httpx
+
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def client_loop(client):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            began = time.perf_counter()
+            try:
+                response = await client.get("/notes", params={"owner_id": random.randint(1, OWNERS)})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - began)
+            except httpx.HTTPError:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        for _ in range(100):
+            try:
+                await client.get("/docs")
+                break
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+        began = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(clients)))
+        elapsed = time.perf_counter() - began
+    return latencies, errors, elapsed
+
+def run(app_name, data_dir, clients, duration):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"bench_async:{app_name}", "--port", str(port), "--log-level", "warning"],
+        cwd=data_dir, env=dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.dirname(os.path.abspath(__file__)), BACKEND_DIR])),
+    )
+    try:
+        return asyncio.run(drive(f"http://127.0.0.1:{port}", clients, duration))
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[50, 100, 250, 500])
+    parser.add_argument("--duration", type=float, default=10, help="seconds per run")
+    args = parser.parse_args()
+
+    data_dir = os.getcwd()
+    seed()
+    print(f"{'stack':>6} {'clients':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for clients in args.clients:
+        for app_name, label in (("sync_app", "sync"), ("async_app", "async")):
+            latencies, errors, elapsed = run(app_name, data_dir, clients, args.duration)
+            latencies.sort()
+            p99 = latencies[int(len(latencies) * 0.99)] if latencies else 0
+            p50 = statistics.median(latencies) if latencies else 0
+            print(f"{label:>6} {clients:>8} {len(latencies) / elapsed:>8.0f} {p50 * 1000:>8.1f} {p99 * 1000:>8.1f} {errors:>7}")
+
+if __name__ == "__main__":
+    main()
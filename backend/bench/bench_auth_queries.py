@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Count SQL statements per authenticated request with and without the principal cache.
+
+Runs the app in-process against a throwaway database in a temporary directory.
+
+    python bench/bench_auth_queries.py --requests 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    # database.py opens ./notes_new.db on import, so import the app from a scratch directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(tempfile.mkdtemp())
+    # Every request comes from one client, which the rate limits would throttle
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from database import async_engine, read_engine
+    from auth import principal_cache, PRINCIPAL_CACHE_SIZE
+    from main import app
+
+    statements = []
+    for counted_engine in {async_engine, read_engine}:
+        event.listen(counted_engine.sync_engine, "before_cursor_execute", lambda *a, **kw: statements.append(1))
+
+    with TestClient(app) as client:
+        run(client, args.requests, statements, principal_cache, PRINCIPAL_CACHE_SIZE)
+
+def run(client, requests, statements, principal_cache, cache_size_on):
+    client.post("/signup", json={"username": "child", "email": "child@example.com", "password": "pw"})
+    client.post("/signup", json={"username": "parent", "email": "parent@example.com", "password": "pw", "role": "parent", "child_ids": [1]})
+    tokens = {}
+    for username in ("child", "parent"):
+        response = client.post("/login", json={"username": username, "password": "pw"})
+        tokens[username] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    client.post("/notes", json={"title": "Note", "content": "Body"}, headers=tokens["child"])
+
+    print(f"{'caller':>8} {'cache':>6} {'queries/request':>16} {'ms/request':>11}")
+    for cache_size in (0, cache_size_on):
+        principal_cache.max_size = cache_size
+        for username in ("child", "parent"):
+            principal_cache.clear()
+            statements.clear()
+            began = time.perf_counter()
+            for _ in range(requests):
+                client.get("/notes", headers=tokens[username])
+            elapsed = time.perf_counter() - began
+            label = "on" if cache_size else "off"
+            print(f"{username:>8} {label:>6} {len(statements) / requests:>16.2f} {elapsed * 1000 / requests:>11.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Compare the batch note endpoints with the per-item ones.
+
+For each batch size, creates, completes and deletes that many notes once
+through POST/PUT/DELETE /notes/{id} and once through /notes/batch, and
+prints wall time and SQL statements per operation. Runs the app in-process
+against a throwaway database in a temporary directory.
+
+    python bench/bench_batch.py --sizes 1 10 100 1000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    args = parser.parse_args()
+
+    # database.py opens ./notes_new.db on import, so import the app from a scratch directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(tempfile.mkdtemp())
+    # Every request comes from one client, which the rate limits would throttle
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from database import async_engine, read_engine
+    from main import app
+
+    statements = []
+    for counted_engine in {async_engine, read_engine}:
+        event.listen(counted_engine.sync_engine, "before_cursor_execute", lambda *a, **kw: statements.append(1))
+
+    with TestClient(app) as client:
+        client.post("/signup", json={"username": "writer", "email": "writer@example.com", "password": "pw"})
+        token = client.post("/login", json={"username": "writer", "password": "pw"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        print(f"{'size':>6} {'op':>7} {'mode':>6} {'ms/op':>8} {'queries/op':>11}")
+        for size in args.sizes:
+            for mode in ("single", "batch"):
+                for op, run in ((("create", create), ("patch", patch), ("delete", remove))):
+                    statements.clear()
+                    began = time.perf_counter()
+                    run(client, headers, size, mode)
+                    elapsed = time.perf_counter() - began
+                    print(f"{size:>6} {op:>7} {mode:>6} {elapsed * 1000 / size:>8.2f} {len(statements) / size:>11.2f}")
+
+created_ids = []
+
+def create(client, headers, size, mode):
+    notes = [{"title": f"Note {i}", "content": "Body " * 20, "tags": "bench, todo", "is_todo": True} for i in range(size)]
+    if mode == "batch":
+        created_ids[:] = [item["id"] for item in client.post("/notes/batch", json={"notes": notes}, headers=headers).json()]
+    else:
+        created_ids[:] = [client.post("/notes", json=note, headers=headers).json()["id"] for note in notes]
+
+def patch(client, headers, size, mode):
+    if mode == "batch":
+        client.patch("/notes/batch", json={"notes": [{"id": note_id, "is_completed": True} for note_id in created_ids]}, headers=headers)
+    else:
+        for note_id in created_ids:
+            client.put(f"/notes/{note_id}", json={"is_completed": True}, headers=headers)
+
+def remove(client, headers, size, mode):
+    if mode == "batch":
+        client.request("DELETE", "/notes/batch", json={"ids": created_ids}, headers=headers)
+    else:
+        for note_id in created_ids:
+            client.delete(f"/notes/{note_id}", headers=headers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Measure what compressing note bodies does to database size, page cache hit
+ratio and GET /notes latency.
+
+Generates a dataset into a scratch database with compression off and
+measures it, then compresses the existing notes with compress_notes.py,
+vacuums and measures again:
+
+- size of the database file and of the notes table (from dbstat)
+- page cache hit ratio of the GET /notes query over --rounds passes through
+  the sampled owners, under a --cache-kb page cache with mmap off, read
+  from sqlite3_db_status (n/a where the handle cannot be reached)
+- mean and p95 GET /notes?limit=50 latency through the app in-process, for
+  full notes and for ?fields=title
+
+    python bench/bench_compression.py --users 200 --content-size 2000 --cache-kb 2048
+"""
+import argparse
+import asyncio
+import ctypes
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+CACHE_HIT, CACHE_MISS = 7, 8  # SQLITE_DBSTATUS_CACHE_HIT / _MISS
+
+LIST_SQL = "SELECT id, title, note_text(content), tags, is_todo, is_completed, folder_id, owner_id, created_at, updated_at FROM notes WHERE owner_id = ? ORDER BY updated_at DESC, id DESC LIMIT 50"
+
+def cache_counter(conn):
+    """Read-and-reset function for conn's page cache (hits, misses), or None if unavailable"""
+    try:
+        import _sqlite3
+        db_status = ctypes.CDLL(_sqlite3.__file__).sqlite3_db_status
+        # CPython's sqlite3.Connection keeps its sqlite3* right after the object header
+        handle = ctypes.c_void_p.from_address(id(conn) + object.__basicsize__)
+    except (AttributeError, OSError):
+        return None
+
+    def read():
+        values = []
+        for op in (CACHE_HIT, CACHE_MISS):
+            current, highwater = ctypes.c_int(), ctypes.c_int()
+            if db_status(handle, op, ctypes.byref(current), ctypes.byref(highwater), 1) != 0:
+                return None
+            values.append(current.value)
+        return tuple(values)
+    return read
+
+def storage(path):
+    """(file bytes, notes table bytes or None)"""
+    conn = sqlite3.connect(path)
+    try:
+        table = conn.execute("SELECT sum(pgsize) FROM dbstat WHERE name = 'notes'").fetchone()[0]
+    except sqlite3.OperationalError:
+        table = None
+    conn.close()
+    return os.path.getsize(path), table
+
+def hit_ratio(path, owners, rounds, cache_kb):
+    from compression import decompress
+    conn = sqlite3.connect(path)
+    conn.create_function("note_text", 1, decompress, deterministic=True)
+    conn.execute(f"PRAGMA cache_size=-{cache_kb}")
+    conn.execute("PRAGMA mmap_size=0")
+    read = cache_counter(conn)
+    if read is None or read() is None:
+        conn.close()
+        return None
+    for _ in range(rounds):
+        for owner_id in owners:
+            conn.execute(LIST_SQL, (owner_id,)).fetchall()
+    hits, misses = read()
+    conn.close()
+    return hits / max(hits + misses, 1)
+
+async def list_latency(owners, rounds):
+    """{label: (mean ms, p95 ms)} for GET /notes through the app"""
+    import httpx
+    from main import app, shutdown
+    from auth import create_access_token, Principal
+
+    headers = {owner_id: {"Authorization": f"Bearer {create_access_token(Principal(owner_id, f'child{owner_id}', 'child', None, (), 1))}"} for owner_id in owners}
+    samples = {"full": [], "fields=title": []}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for _ in range(rounds):
+            for owner_id in owners:
+                for label, params in (("full", {"limit": 50}), ("fields=title", {"limit": 50, "fields": "title"})):
+                    began = time.perf_counter()
+                    response = await client.get("/notes", params=params, headers=headers[owner_id])
+                    samples[label].append((time.perf_counter() - began) * 1000)
+                    assert response.status_code == 200, response.text
+    await shutdown()
+    return {label: (statistics.mean(values), statistics.quantiles(values, n=20)[-1]) for label, values in samples.items()}
+
+def measure(path, owners, args):
+    file_size, table_size = storage(path)
+    return {
+        "file_mb": file_size / 1e6,
+        "notes_mb": table_size / 1e6 if table_size is not None else None,
+        "hit_ratio": hit_ratio(path, owners, args.rounds, args.cache_kb),
+        "latency": asyncio.run(list_latency(owners, args.rounds)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--notes-per-folder", type=int, default=25)
+    parser.add_argument("--content-size", type=int, default=2000, help="median note length in characters")
+    parser.add_argument("--min-size", type=int, default=1024, help="compress bodies of at least this many bytes")
+    parser.add_argument("--cache-kb", type=int, default=2048, help="page cache per connection")
+    parser.add_argument("--owners", type=int, default=50, help="children whose notes are listed")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    # database.py opens ./notes_new.db, so work from a scratch directory; write
+    # the dataset uncompressed and give the app a small cache and no mmap
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(tempfile.mkdtemp())
+    # Every request comes from one client, which the rate limits would throttle
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    os.environ.update(NOTE_COMPRESS_MIN_SIZE="0", DB_PROFILE="production", DB_CACHE_SIZE_KB=str(args.cache_kb), DB_MMAP_SIZE="0")
+
+    from create_demo_data import generate_data
+    from compress_notes import compress_notes
+    from database import engine, dispose_engines, User
+
+    generate_data(users=args.users, notes_per_folder=args.notes_per_folder, content_size=args.content_size, password="bench")
+    with engine.connect() as conn:
+        children = [row.id for row in conn.execute(User.__table__.select().where(User.role == "child"))]
+    owners = random.Random(1).sample(children, min(args.owners, len(children)))
+
+    before = measure("notes_new.db", owners, args)
+    compressed, size_before, size_after = compress_notes(engine, min_size=args.min_size)
+    with engine.connect() as conn:
+        conn.exec_driver_sql("VACUUM")
+    engine.dispose()
+    asyncio.run(dispose_engines())
+    after = measure("notes_new.db", owners, args)
+
+    print(f"\ncompressed {compressed} notes: content {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB")
+    print(f"{'':>32} {'before':>10} {'after':>10}")
+    print(f"{'database file (MB)':>32} {before['file_mb']:>10.1f} {after['file_mb']:>10.1f}")
+    if before["notes_mb"] is not None:
+        print(f"{'notes table (MB)':>32} {before['notes_mb']:>10.1f} {after['notes_mb']:>10.1f}")
+    ratios = [f"{run['hit_ratio']:.1%}" if run["hit_ratio"] is not None else "n/a" for run in (before, after)]
+    print(f"{'cache hit ratio':>32} {ratios[0]:>10} {ratios[1]:>10}")
+    for label in before["latency"]:
+        for index, stat in enumerate(("mean", "p95")):
+            name = f"GET /notes {label} {stat} ms"
+            print(f"{name:>32} {before['latency'][label][index]:>10.1f} {after['latency'][label][index]:>10.1f}")
+
+if __name__ == "__main__":
+    main()
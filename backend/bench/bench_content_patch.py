@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Compare saving a one-character edit with PUT /notes/{id} (the whole body)
+and with PATCH /notes/{id}/content (just the edit).
+
+For each note size, creates a note of that many characters and makes
+--rounds single-character insertions at random positions, once saving each
+through PUT and once through PATCH, and prints the request and response
+bytes per save and the mean and p95 latency. Runs the app in-process
+against a throwaway database in a temporary directory.
+
+    python bench/bench_content_patch.py --sizes 1000 100000 1000000 --rounds 50
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+WORDS = "the quick brown fox jumps over a lazy dog while notes pile up in folders of homework and todos".split()
+
+def body(size, rng):
+    words, length = [], 0
+    while length < size:
+        words.append(rng.choice(WORDS))
+        length += len(words[-1]) + 1
+    return " ".join(words)[:size]
+
+def save_put(client, headers, note, position, char):
+    note["content"] = note["content"][:position] + char + note["content"][position:]
+    payload = {"content": note["content"]}
+    response = client.put(f"/notes/{note['id']}", json=payload, headers=headers)
+    return payload, response
+
+def save_patch(client, headers, note, position, char):
+    note["content"] = note["content"][:position] + char + note["content"][position:]
+    payload = {"base_version": note["content_version"], "edits": [{"start": position, "end": position, "text": char}]}
+    response = client.patch(f"/notes/{note['id']}/content", json=payload, headers=headers)
+    return payload, response
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000], help="note lengths in characters")
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    # database.py opens ./notes_new.db, so import the app from a scratch directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(tempfile.mkdtemp())
+    # Every request comes from one client, which the rate limits would throttle
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+    from fastapi.testclient import TestClient
+    from main import app
+
+    rng = random.Random(1)
+    with TestClient(app) as client:
+        client.post("/signup", json={"username": "writer", "email": "writer@example.com", "password": "pw"})
+        token = client.post("/login", json={"username": "writer", "password": "pw"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        print(f"{'size':>9} {'mode':>6} {'request B':>10} {'response B':>11} {'mean ms':>8} {'p95 ms':>8}")
+        for size in args.sizes:
+            for mode, save in (("put", save_put), ("patch", save_patch)):
+                note = client.post("/notes", json={"title": f"{size} chars", "content": body(size, rng)}, headers=headers).json()
+                sent, received, latencies = [], [], []
+                for _ in range(args.rounds):
+                    position = rng.randrange(len(note["content"]) + 1)
+                    began = time.perf_counter()
+                    payload, response = save(client, headers, note, position, rng.choice("abcdefghij"))
+                    latencies.append((time.perf_counter() - began) * 1000)
+                    assert response.status_code == 200, response.text
+                    note["content_version"] = response.json()["content_version"]
+                    sent.append(len(json.dumps(payload, separators=(",", ":"))))
+                    received.append(len(response.content))
+
+                stored = client.get("/notes", params={"limit": 1}, headers=headers).json()["items"][0]
+                assert stored["id"] == note["id"] and stored["content"] == note["content"], "saved content diverged"
+                p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+                print(f"{size:>9} {mode:>6} {statistics.mean(sent):>10.0f} {statistics.mean(received):>11.0f} {statistics.mean(latencies):>8.2f} {p95:>8.2f}")
+                client.delete(f"/notes/{note['id']}", headers=headers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Measure GET /export throughput and server memory for one large account.
+
+Generates a scratch database holding a single child with --notes notes,
+starts uvicorn on it, and downloads the account once per format, reading
+the response as it arrives without keeping it. Reports bytes, seconds,
+notes per second and MB per second, plus the server's resident memory
+after start-up and its peak (VmHWM) after each export. The server is
+restarted for every format, so each peak belongs to one export.
+
+With --import, the NDJSON export is also uploaded to POST /import for a
+second child, and the import's rate and peak memory are reported the same
+way.
+
+    python bench/bench_export.py --notes 1000000 --content-size 200 --import
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def memory_mb(pid):
+    """(current RSS, peak RSS) in MB, from /proc"""
+    fields = {}
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            name, _, value = line.partition(":")
+            fields[name] = value.split()
+    return int(fields["VmRSS"][0]) / 1024, int(fields["VmHWM"][0]) / 1024
+
+class Server:
+    """uvicorn serving main:app from `directory` until the block exits"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        env = dict(os.environ, PYTHONPATH=BACKEND_DIR, RATE_LIMIT_ENABLED="false")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(self.port), "--log-level", "warning"],
+            cwd=self.directory, env=env,
+        )
+        for _ in range(200):
+            try:
+                # Opens the engines, so the baseline includes them
+                httpx.get(f"{self.base_url}/available-children", timeout=5)
+                return self
+            except httpx.TransportError:
+                time.sleep(0.1)
+        raise RuntimeError("server did not start")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.wait()
+
+def timed_export(server, headers, format, save_to=None):
+    began, size = time.perf_counter(), 0
+    with httpx.stream("GET", f"{server.base_url}/export", params={"format": format}, headers=headers, timeout=None) as response:
+        response.raise_for_status()
+        sink = open(save_to, "wb") if save_to else None
+        for chunk in response.iter_raw():
+            size += len(chunk)
+            if sink:
+                sink.write(chunk)
+        if sink:
+            sink.close()
+    return size, time.perf_counter() - began
+
+def timed_import(server, headers, path):
+    def body():
+        with open(path, "rb") as source:
+            while chunk := source.read(1 << 16):
+                yield chunk
+    began = time.perf_counter()
+    response = httpx.post(f"{server.base_url}/import", content=body(), headers={**headers, "Content-Type": "application/x-ndjson"}, timeout=None)
+    response.raise_for_status()
+    return response.json(), time.perf_counter() - began
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=1000000)
+    parser.add_argument("--folders", type=int, default=50)
+    parser.add_argument("--content-size", type=int, default=200, help="median note length in characters")
+    parser.add_argument("--formats", nargs="+", default=["ndjson", "zip"], choices=["ndjson", "zip"])
+    parser.add_argument("--import", dest="run_import", action="store_true", help="also time POST /import of the NDJSON export")
+    args = parser.parse_args()
+
+    # database.py opens ./notes_new.db, so generate the account in a scratch directory
+    sys.path.insert(0, BACKEND_DIR)
+    directory = tempfile.mkdtemp()
+    os.chdir(directory)
+
+    from create_demo_data import generate_data
+    from auth import create_access_token, Principal
+    from database import engine, User
+
+    began = time.perf_counter()
+    generate_data(users=2, children_per_parent=1, folders_per_child=args.folders,
+                  notes_per_folder=max(1, args.notes // args.folders), content_size=args.content_size, password="bench")
+    with engine.connect() as conn:
+        child = conn.execute(User.__table__.select().where(User.role == "child")).first()
+    engine.dispose()
+    print(f"generated {args.notes} notes in {time.perf_counter() - began:.0f} s; database {os.path.getsize('notes_new.db') / 1e6:.0f} MB\n")
+    headers = {"Authorization": f"Bearer {create_access_token(Principal(child.id, child.username, 'child', None, (), 1))}"}
+    export_path = os.path.join(directory, "export.ndjson")
+
+    print(f"{'operation':>14} {'MB':>8} {'seconds':>8} {'notes/s':>9} {'MB/s':>7} {'RSS start':>10} {'RSS peak':>9}")
+    for format in args.formats:
+        with Server(directory) as server:
+            start_rss, _ = memory_mb(server.process.pid)
+            size, elapsed = timed_export(server, headers, format, export_path if format == "ndjson" and args.run_import else None)
+            _, peak_rss = memory_mb(server.process.pid)
+        print(f"{'export ' + format:>14} {size / 1e6:>8.1f} {elapsed:>8.1f} {args.notes / elapsed:>9.0f} {size / 1e6 / elapsed:>7.1f} {start_rss:>10.0f} {peak_rss:>9.0f}")
+
+    if args.run_import and os.path.exists(export_path):
+        with Server(directory) as server:
+            httpx.post(f"{server.base_url}/signup", json={"username": "importer", "email": "importer@example.com", "password": "bench"})
+            token = httpx.post(f"{server.base_url}/login", json={"username": "importer", "password": "bench"}).json()["access_token"]
+            start_rss, _ = memory_mb(server.process.pid)
+            job, elapsed = timed_import(server, {"Authorization": f"Bearer {token}"}, export_path)
+            _, peak_rss = memory_mb(server.process.pid)
+        size = os.path.getsize(export_path)
+        print(f"{'import ndjson':>14} {size / 1e6:>8.1f} {elapsed:>8.1f} {job['notes_imported'] / elapsed:>9.0f} {size / 1e6 / elapsed:>7.1f} {start_rss:>10.0f} {peak_rss:>9.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Measure background job throughput for different numbers of workers.
+
+Generates a scratch database with --jobs tagged notes, empties the tag index
+and queues one note_tags job per note, as --jobs single-note writes would.
+Then, for each count in --workers, drains a fresh copy of that queue with a
+JobWorkers pool of that size and prints jobs per second. Every run checks
+that the tag index was rebuilt exactly.
+
+A claimed batch of note_tags jobs runs as one handler call. --io-ms makes
+each call wait that long before touching the database, like a handler
+calling out to another service; that is where more workers help, since
+SQLite runs one write transaction at a time whatever the pool size.
+DB_PROFILE applies as it does for the API.
+
+    python bench/bench_jobs.py --jobs 5000 --workers 1 2 4 8 --claim-size 10 --io-ms 20
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUEUE_JOBS = """
+    INSERT INTO jobs (kind, owner_id, payload, attempts, run_after, created_at)
+    SELECT 'note_tags', owner_id, json_object('note_ids', json_array(id)), 0, :now, :now
+    FROM notes ORDER BY id LIMIT :count
+"""
+
+def restore(pristine, path):
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    shutil.copy(pristine, path)
+
+async def drain(workers, claim_size, io_ms):
+    import jobs
+    from database import Job, NoteTag, dispose_engines, read_session
+    from sqlalchemy import func, select
+
+    handler = jobs.HANDLERS["note_tags"]
+    async def slow_handler(db, **payload):
+        await asyncio.sleep(io_ms / 1000)
+        await handler(db, **payload)
+    jobs.HANDLERS["note_tags"] = slow_handler if io_ms else handler
+
+    pool = jobs.JobWorkers(workers=workers, claim_size=claim_size, poll=0.05)
+    began = time.perf_counter()
+    pool.start()
+    try:
+        while True:
+            await asyncio.sleep(0.02)
+            async with read_session() as db:
+                if not await db.scalar(select(func.count()).select_from(Job)):
+                    break
+        elapsed = time.perf_counter() - began
+    finally:
+        await pool.stop()
+        jobs.HANDLERS["note_tags"] = handler
+    async with read_session() as db:
+        tagged = await db.scalar(select(func.count()).select_from(NoteTag))
+    await dispose_engines()
+    return elapsed, tagged
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--claim-size", type=int, default=50, help="JOB_CLAIM_SIZE")
+    parser.add_argument("--io-ms", type=float, default=0, help="simulated I/O per handler call, before its first statement")
+    args = parser.parse_args()
+
+    # database.py opens ./notes_new.db, so generate the data in a scratch directory
+    sys.path.insert(0, BACKEND_DIR)
+    directory = tempfile.mkdtemp()
+    os.chdir(directory)
+
+    from create_demo_data import generate_data
+    from database import engine, NoteTag
+    from sqlalchemy import func, select, text
+
+    generate_data(users=2, children_per_parent=1, folders_per_child=10, notes_per_folder=max(1, args.jobs // 10), password="bench")
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM note_tags WHERE note_id NOT IN (SELECT id FROM notes ORDER BY id LIMIT :count)"), {"count": args.jobs})
+        expected = conn.scalar(select(func.count()).select_from(NoteTag))
+        conn.execute(NoteTag.__table__.delete())
+        queued = conn.execute(text(QUEUE_JOBS), {"now": "2000-01-01 00:00:00.000000", "count": args.jobs}).rowcount
+    engine.dispose()
+    path = os.path.join(directory, "notes_new.db")
+    pristine = path + ".pristine"
+    shutil.copy(path, pristine)
+
+    print(f"{queued} note_tags jobs, claim size {args.claim_size}, {args.io_ms:g} ms simulated I/O, DB_PROFILE={os.getenv('DB_PROFILE', 'default')}\n")
+    print(f"{'workers':>8} {'seconds':>8} {'jobs/s':>8} {'index':>6}")
+    for workers in args.workers:
+        restore(pristine, path)
+        elapsed, tagged = asyncio.run(drain(workers, args.claim_size, args.io_ms))
+        print(f"{workers:>8} {elapsed:>8.2f} {queued / elapsed:>8.0f} {'ok' if tagged == expected else 'WRONG':>6}")
+    shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Load test: note-read latency while a storm of logins hits bcrypt.
+
+Starts uvicorn once per HASH_WORKERS setting against a scratch database.
+It measures GET /notes latency first on an idle server, then while
+--storm concurrent clients log in as fast as they can. HASH_WORKERS=0
+hashes on the request threadpool, which was the old behaviour.
+
+    python bench/bench_login_storm.py --workers 0 4 --storm 64 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+async def wait_until_up(client):
+    for _ in range(100):
+        try:
+            await client.get("/")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+async def read_loop(client, headers, stop, latencies):
+    while not stop.is_set():
+        began = time.perf_counter()
+        await client.get("/notes", headers=headers)
+        latencies.append(time.perf_counter() - began)
+
+async def login_loop(client, stop, outcomes):
+    while not stop.is_set():
+        response = await client.post("/login", json={"username": "reader", "password": "password123"})
+        outcomes[response.status_code] = outcomes.get(response.status_code, 0) + 1
+        if response.status_code == 503:
+            await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+
+async def measure(base_url, storm, duration):
+    limits = httpx.Limits(max_connections=storm + 8)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await wait_until_up(client)
+        await client.post("/signup", json={"username": "reader", "email": "reader@example.com", "password": "password123"})
+        token = (await client.post("/login", json={"username": "reader", "password": "password123"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        for i in range(50):
+            await client.post("/notes", json={"title": f"Note {i}", "content": "Body " * 50}, headers=headers)
+
+        results = {}
+        for phase, logins in (("idle", 0), ("storm", storm)):
+            stop = asyncio.Event()
+            latencies, outcomes = [], {}
+            tasks = [asyncio.create_task(read_loop(client, headers, stop, latencies))]
+            tasks += [asyncio.create_task(login_loop(client, stop, outcomes)) for _ in range(logins)]
+            await asyncio.sleep(duration)
+            stop.set()
+            await asyncio.gather(*tasks)
+            results[phase] = (latencies, outcomes)
+        return results
+
+def run(hash_workers, storm, duration):
+    port = free_port()
+    # The storm all comes from one address, which the /login rate limit would stop at once
+    env = dict(os.environ, HASH_WORKERS=str(hash_workers), RATE_LIMIT_ENABLED="false", PYTHONPATH=BACKEND_DIR)
+    with tempfile.TemporaryDirectory() as tmp:
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=tmp, env=env,
+        )
+        try:
+            return asyncio.run(measure(f"http://127.0.0.1:{port}", storm, duration))
+        finally:
+            server.terminate()
+            server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 4], help="HASH_WORKERS values to compare")
+    parser.add_argument("--storm", type=int, default=64, help="concurrent login clients")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per phase")
+    args = parser.parse_args()
+
+    print(f"{'workers':>8} {'phase':>6} {'reads':>6} {'p50 ms':>8} {'p99 ms':>8}  logins")
+    for hash_workers in args.workers:
+        results = run(hash_workers, args.storm, args.duration)
+        for phase, (latencies, outcomes) in results.items():
+            p50 = statistics.median(latencies) * 1000
+            p99 = percentile(latencies, 99) * 1000
+            print(f"{hash_workers:>8} {phase:>6} {len(latencies):>6} {p50:>8.1f} {p99:>8.1f}  {outcomes or '-'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Measure GET /notes latency while a backlog of deleted notes is purged.
+
+Generates a scratch database holding a single child with --notes notes and
+soft-deletes --deleted of them, dated past the retention window. Each mode
+then runs uvicorn on its own copy while --clients clients list notes, with
+--think-ms between requests, for --seconds:
+
+- idle: maintenance is off and nothing is purged
+- scheduler: the background scheduler purges and vacuums in batches of
+  --batch-size within --budget-ms per pass, whenever no request has been in
+  flight for --quiet-ms
+- one-shot: maintenance is off and another connection deletes the whole
+  backlog in one transaction, as a hard-delete cleanup would
+
+Prints p50, p95 and max latency per mode and how many deleted notes were
+left at the end.
+
+    python bench/bench_maintenance.py --notes 200000 --deleted 50000 --clients 4 --seconds 20
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class Server:
+    """uvicorn serving main:app from `directory` until the block exits"""
+
+    def __init__(self, directory, env):
+        self.directory = directory
+        self.env = env
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        env = dict(os.environ, PYTHONPATH=BACKEND_DIR, RATE_LIMIT_ENABLED="false", LOAD_SHED_MAX_CONCURRENCY="0", **self.env)
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(self.port), "--log-level", "warning"],
+            cwd=self.directory, env=env,
+        )
+        for _ in range(200):
+            try:
+                httpx.get(f"{self.base_url}/available-children", timeout=5)
+                return self
+            except httpx.TransportError:
+                time.sleep(0.1)
+        raise RuntimeError("server did not start")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.wait()
+
+async def list_notes(client, headers, deadline, think, latencies):
+    while time.perf_counter() < deadline:
+        began = time.perf_counter()
+        response = await client.get("/notes", params={"limit": 50}, headers=headers)
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - began) * 1000)
+        await asyncio.sleep(think)
+
+async def measure(server, headers, clients, seconds, think):
+    latencies = []
+    async with httpx.AsyncClient(base_url=server.base_url, timeout=60) as client:
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(*(list_notes(client, headers, deadline, think, latencies) for _ in range(clients)))
+    return latencies
+
+def purge_all(path):
+    """Delete every soft-deleted note in one transaction"""
+    from database import create_sync_engine
+    from sqlalchemy import text
+    purge_engine = create_sync_engine("sqlite:///" + path)
+    with purge_engine.begin() as conn:
+        conn.execute(text("DELETE FROM notes WHERE deleted_at IS NOT NULL"))
+    purge_engine.dispose()
+
+def deleted_left(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT count(*) FROM notes WHERE deleted_at IS NOT NULL").fetchone()[0]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=200000)
+    parser.add_argument("--deleted", type=int, default=50000, help="notes soft-deleted before the run")
+    parser.add_argument("--content-size", type=int, default=400)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--think-ms", type=float, default=100, help="pause between a client's requests")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--batch-size", type=int, default=100, help="PURGE_BATCH_SIZE for the scheduler")
+    parser.add_argument("--budget-ms", type=float, default=100, help="MAINTENANCE_TIME_BUDGET_MS for the scheduler")
+    parser.add_argument("--quiet-ms", type=float, default=50, help="MAINTENANCE_QUIET_MS for the scheduler")
+    parser.add_argument("--modes", nargs="+", default=["idle", "scheduler", "one-shot"], choices=["idle", "scheduler", "one-shot"])
+    args = parser.parse_args()
+
+    # database.py opens ./notes_new.db, so generate the account in a scratch directory
+    sys.path.insert(0, BACKEND_DIR)
+    directory = tempfile.mkdtemp()
+    os.chdir(directory)
+
+    from create_demo_data import generate_data
+    from auth import create_access_token, Principal
+    from database import engine, User
+    from sqlalchemy import text
+
+    began = time.perf_counter()
+    generate_data(users=2, children_per_parent=1, folders_per_child=10, notes_per_folder=max(1, args.notes // 10),
+                  content_size=args.content_size, password="bench")
+    with engine.begin() as conn:
+        child = conn.execute(User.__table__.select().where(User.role == "child")).first()
+        conn.execute(text("UPDATE notes SET deleted_at = '2000-01-01' WHERE id IN (SELECT id FROM notes ORDER BY random() LIMIT :count)"), {"count": args.deleted})
+    engine.dispose()
+    print(f"generated {args.notes} notes, {args.deleted} deleted, in {time.perf_counter() - began:.0f} s\n")
+    headers = {"Authorization": f"Bearer {create_access_token(Principal(child.id, child.username, 'child', None, (), 1))}"}
+
+    print(f"{'mode':>10} {'requests':>9} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'deleted left':>13}")
+    for mode in args.modes:
+        run_directory = tempfile.mkdtemp()
+        path = os.path.join(run_directory, "notes_new.db")
+        shutil.copy(os.path.join(directory, "notes_new.db"), path)
+        env = {"MAINTENANCE_ENABLED": "true" if mode == "scheduler" else "false", "MAINTENANCE_INTERVAL_SECONDS": "1",
+               "PURGE_BATCH_SIZE": str(args.batch_size), "MAINTENANCE_TIME_BUDGET_MS": str(args.budget_ms),
+               "MAINTENANCE_QUIET_MS": str(args.quiet_ms)}
+        with Server(run_directory, env) as server:
+            # Starts a second in, once the clients have settled
+            purge = threading.Timer(1, purge_all, args=(path,)) if mode == "one-shot" else None
+            if purge:
+                purge.start()
+            latencies = asyncio.run(measure(server, headers, args.clients, args.seconds, args.think_ms / 1000))
+            if purge:
+                purge.join()
+        p95 = statistics.quantiles(latencies, n=20)[-1]
+        print(f"{mode:>10} {len(latencies):>9} {statistics.median(latencies):>8.1f} {p95:>8.1f} {max(latencies):>8.1f} {deleted_left(path):>13}")
+        shutil.rmtree(run_directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Measure the overhead of the metrics middleware and SQL statement hooks.
+
+Sends --requests GET /notes and GET /folders requests through the app
+in-process with instrumentation off, on, and on with Server-Timing headers,
+rotating the order every round, and prints the best mean time per request
+for each. Request times vary by more than the overhead, so it also times the
+middleware around a no-op app and the statement hooks on their own. Runs
+against a throwaway database in a temporary directory.
+
+    python bench/bench_metrics.py --requests 2000 --rounds 6
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+async def run(args):
+    import httpx
+    from main import app, shutdown
+    from metrics import metrics, MetricsMiddleware
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        await client.post("/signup", json={"username": "writer", "email": "writer@example.com", "password": "pw"})
+        token = (await client.post("/login", json={"username": "writer", "password": "pw"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        notes = [{"title": f"Note {n}", "content": "Lorem ipsum dolor sit amet. " * 10, "tags": "bench"} for n in range(50)]
+        await client.post("/notes/batch", json={"notes": notes}, headers=headers)
+        await client.post("/folders", json={"name": "Bench"}, headers=headers)
+
+        middleware = app.middleware_stack
+        while not isinstance(middleware, MetricsMiddleware):
+            middleware = middleware.app
+
+        modes = {"off": (False, False), "on": (True, False), "server-timing": (True, True)}
+        best = dict.fromkeys(modes, float("inf"))
+        for round in range(args.rounds):
+            labels = list(modes)[round % len(modes):] + list(modes)[:round % len(modes)]
+            for label in labels:
+                enabled, server_timing = modes[label]
+                metrics.enabled, middleware.server_timing = enabled, server_timing
+                began = time.perf_counter()
+                for n in range(args.requests):
+                    await client.get("/folders" if n % 2 else "/notes", params={"limit": 20}, headers=headers)
+                best[label] = min(best[label], (time.perf_counter() - began) / args.requests)
+    await shutdown()
+    return best
+
+async def isolated(iterations):
+    """Seconds per call of the middleware (around a no-op app) and of one statement's hooks"""
+    from metrics import metrics, MetricsMiddleware, _before_cursor_execute, _after_cursor_execute
+
+    async def noop(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    class Route:
+        path = "/bench"
+
+    metrics.enabled = True
+    results = {}
+    for label, app in (("bare app", noop), ("middleware", MetricsMiddleware(noop)), ("+ server-timing", MetricsMiddleware(noop, server_timing=True))):
+        began = time.perf_counter()
+        for _ in range(iterations):
+            await app({"type": "http", "method": "GET", "route": Route, "headers": []}, None, send)
+        results[label] = (time.perf_counter() - began) / iterations
+
+    class Connection:
+        info = {}
+
+    began = time.perf_counter()
+    for _ in range(iterations):
+        _before_cursor_execute(Connection, None, "SELECT 1", (), None, False)
+        _after_cursor_execute(Connection, None, "SELECT 1", (), None, False)
+    results["statement hooks"] = (time.perf_counter() - began) / iterations
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=6)
+    args = parser.parse_args()
+
+    # database.py opens ./notes_new.db on import, so import the app from a scratch directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(tempfile.mkdtemp())
+    # Every request comes from one client, which the rate limits would throttle
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+    best = asyncio.run(run(args))
+    parts = asyncio.run(isolated(args.requests * 10))
+    print(f"{'mode':>14} {'us/request':>11} {'overhead':>9}")
+    for label, seconds in best.items():
+        print(f"{label:>14} {seconds * 1e6:>11.0f} {(seconds / best['off'] - 1) * 100:>8.1f}%")
+
+    print(f"\n{'in isolation':>16} {'us/call':>8}")
+    for label, seconds in parts.items():
+        print(f"{label:>16} {seconds * 1e6:>8.1f}")
+
+if __name__ == "__main__":
+    main()
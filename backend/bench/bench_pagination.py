@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark keyset pagination of GET /notes as the notes table grows.
+
+Seeds a throwaway SQLite database per size and times the first page and a
+page deep into the listing. With the composite indexes both should stay flat.
+
+    python bench/bench_pagination.py --sizes 1000 10000 100000 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Benchmarks live in bench/; the modules they measure are one directory up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, User, Folder, Note
+from pagination import page_statement, page_result, encode_cursor
+
+OWNER_ID = 1
+FOLDERS = 10
+BATCH = 10000
+
+def seed(engine, size):
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"id": OWNER_ID, "username": "bench", "email": "bench@example.com", "role": "child"}])
+        conn.execute(insert(Folder), [{"id": i + 1, "name": f"Folder {i}", "owner_id": OWNER_ID} for i in range(FOLDERS)])
+        for offset in range(0, size, BATCH):
+            conn.execute(insert(Note), [{
+                "title": f"Note {i}",
+                "content": "x" * 200,
+                "tags": "bench",
+                "folder_id": i % FOLDERS + 1,
+                "owner_id": OWNER_ID,
+                "created_at": start + timedelta(seconds=i),
+                "updated_at": start + timedelta(seconds=i),
+            } for i in range(offset, min(offset + BATCH, size))])
+
+def time_page(session, folder_id, cursor, limit, repeat):
+    best = None
+    page = None
+    for _ in range(repeat):
+        statement = select(Note).where(Note.owner_id == OWNER_ID)
+        if folder_id:
+            statement = statement.where(Note.folder_id == folder_id)
+        began = time.perf_counter()
+        rows = session.scalars(page_statement(statement, Note.updated_at, Note.id, cursor, limit)).all()
+        page = page_result(rows, Note.updated_at, Note.id, limit)
+        elapsed = time.perf_counter() - began
+        best = elapsed if best is None else min(best, elapsed)
+        session.expunge_all()
+    return best, page
+
+def run(size, limit, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        seed(engine, size)
+        session = sessionmaker(bind=engine)()
+        try:
+            first, page = time_page(session, None, None, limit, repeat)
+            # Jump straight to a page halfway through the listing
+            mid = session.query(Note).filter(Note.id == size // 2).first()
+            deep, _ = time_page(session, None, encode_cursor(mid.updated_at, mid.id), limit, repeat)
+            folder, _ = time_page(session, 1, None, limit, repeat)
+        finally:
+            session.close()
+            engine.dispose()
+    return first, deep, folder
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'notes':>10} {'first page':>12} {'deep page':>12} {'folder page':>12}")
+    for size in args.sizes:
+        first, deep, folder = run(size, args.limit, args.repeat)
+        print(f"{size:>10} {first * 1000:>10.2f}ms {deep * 1000:>10.2f}ms {folder * 1000:>10.2f}ms")
+
+if __name__ == "__main__":
+    main()
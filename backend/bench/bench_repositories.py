@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Compare the in-memory and SQLite repositories, on their own and behind the API.
+
+Seeds both backends with the same --notes notes spread over --owners owners
+and 10 folders each, then times, best of --rounds:
+  repository  calls on a Repository, a fresh session per call for SQLite as
+              in a request
+  http        the same operations as in-process requests through the app,
+              with authentication stubbed out
+The memory column is the application's own overhead: routing, validation,
+serialization and the page logic, without a database. The difference to the
+SQLite column is what the data layer costs. DB_PROFILE applies as it does for
+the API. Runs against a throwaway database in a temporary directory.
+
+    python bench/bench_repositories.py --notes 10000 --owners 10 --calls 500
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FOLDERS = 10
+
+async def seed(memory, notes, owners):
+    from sqlalchemy import insert
+    from database import write_session, User, Folder, Note
+
+    users = [{"id": owner, "username": f"bench{owner}", "email": f"bench{owner}@example.com", "role": "child"} for owner in range(1, owners + 1)]
+    folders = [{"id": (owner - 1) * FOLDERS + n + 1, "name": f"Folder {n}", "owner_id": owner} for owner in range(1, owners + 1) for n in range(FOLDERS)]
+    rows = [{
+        "title": f"Note {n}",
+        "content": "Lorem ipsum dolor sit amet. " * 10,
+        "tags": "bench, school" if n % 2 else "bench",
+        "is_todo": n % 3 == 0,
+        "folder_id": (n % owners) * FOLDERS + n % FOLDERS + 1,
+        "owner_id": n % owners + 1,
+    } for n in range(notes)]
+
+    async with write_session() as db:
+        await db.execute(insert(User), users)
+        await db.execute(insert(Folder), folders)
+        await db.execute(insert(Note), rows)
+        await db.commit()
+    for user in users:
+        await memory.add_user(user["username"], user["email"], "", role="child")
+    for folder in folders:
+        await memory.add_folder(folder["owner_id"], folder["name"])
+    for row in rows:
+        await memory.add_note(**row)
+
+async def best(operation, calls, rounds):
+    """Best mean seconds per call of `operation(n)` over `rounds` rounds"""
+    fastest = float("inf")
+    for _ in range(rounds):
+        began = time.perf_counter()
+        for n in range(calls):
+            await operation(n)
+        fastest = min(fastest, (time.perf_counter() - began) / calls)
+    return fastest
+
+def repository_operations(use, owners):
+    """name -> async operation(n), where use(fn) runs fn(repository) on a repository"""
+    async def create(repository, n):
+        await repository.add_note(1, f"Bench {n}", "Body", tags="bench")
+
+    async def update(repository, n):
+        note = await repository.get_note(n % 100 + 1)
+        await repository.update_note(note, title=f"Renamed {n}")
+
+    return {
+        "page of 50": lambda n: use(lambda repository: repository.note_page([n % owners + 1], limit=50)),
+        "page, 5 owners": lambda n: use(lambda repository: repository.note_page(list(range(1, min(owners, 5) + 1)), limit=50)),
+        "folder page": lambda n: use(lambda repository: repository.note_page([1], folder_id=n % FOLDERS + 1, limit=50)),
+        "get note": lambda n: use(lambda repository: repository.get_note(n % 100 + 1)),
+        "create note": lambda n: use(lambda repository: create(repository, n)),
+        "update note": lambda n: use(lambda repository: update(repository, n)),
+    }
+
+def http_operations(client):
+    return {
+        "GET /notes": lambda n: client.get("/notes", params={"limit": 50}),
+        "GET /notes?folder_id": lambda n: client.get("/notes", params={"limit": 50, "folder_id": n % FOLDERS + 1}),
+        "GET /folders": lambda n: client.get("/folders"),
+        "POST /notes": lambda n: client.post("/notes", json={"title": f"Bench {n}", "content": "Body", "tags": "bench"}),
+        "PUT /notes/{id}": lambda n: client.put(f"/notes/{n % 100 + 1}", json={"title": f"Renamed {n}"}),
+    }
+
+async def run(args):
+    import httpx
+    from auth import Principal, get_current_user
+    from database import dispose_engines, write_session
+    from main import app
+    from repositories import MemoryRepository, SqlRepository, get_repository, get_read_repository
+
+    memory = MemoryRepository()
+    await seed(memory, args.notes, args.owners)
+
+    async def use_memory(fn):
+        return await fn(memory)
+
+    async def use_sql(fn):
+        async with write_session() as db:
+            return await fn(SqlRepository(db))
+
+    results = {}
+    memory_operations = repository_operations(use_memory, args.owners)
+    sql_operations = repository_operations(use_sql, args.owners)
+    for name in memory_operations:
+        results[("repository", name)] = (
+            await best(memory_operations[name], args.calls, args.rounds),
+            await best(sql_operations[name], args.calls, args.rounds),
+        )
+
+    principal = Principal(id=1, username="bench1", role="child", parent_id=None, child_ids=(), version=1)
+    app.dependency_overrides[get_current_user] = lambda: principal
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        operations = http_operations(client)
+        for name, operation in operations.items():
+            app.dependency_overrides[get_repository] = app.dependency_overrides[get_read_repository] = lambda: memory
+            in_memory = await best(operation, args.calls, args.rounds)
+            del app.dependency_overrides[get_repository], app.dependency_overrides[get_read_repository]
+            results[("http", name)] = (in_memory, await best(operation, args.calls, args.rounds))
+    app.dependency_overrides.clear()
+    await dispose_engines()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=10000)
+    parser.add_argument("--owners", type=int, default=10)
+    parser.add_argument("--calls", type=int, default=500, help="calls per operation and round")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    # database.py opens ./notes_new.db, so seed a scratch directory
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(tempfile.mkdtemp())
+    # One client sends everything, which the rate limits would throttle; tag jobs just queue up
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    os.environ.setdefault("JOB_WORKERS", "0")
+
+    results = asyncio.run(run(args))
+    print(f"{args.notes} notes, {args.owners} owners, DB_PROFILE={os.getenv('DB_PROFILE', 'default')}\n")
+    print(f"{'':>11} {'operation':<22} {'memory us':>10} {'sqlite us':>10} {'ratio':>6}")
+    for (layer, name), (in_memory, sql) in results.items():
+        print(f"{layer:>11} {name:<22} {in_memory * 1e6:>10.1f} {sql * 1e6:>10.1f} {sql / in_memory:>5.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Measure the cost of serializing a large note listing.
+
+Loads --notes notes from a scratch database and compares:
+  before      jsonable_encoder over ORM instances, rendered by JSONResponse
+  after       NotePage response model, rendered by ORJSONResponse
+  projection  ?fields=title,tags,is_todo,is_completed (no content column)
+
+    python bench/bench_serialization.py --notes 10000 --repeat 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# database.py binds its engines on import, so point it at a scratch database first
+if __name__ == "__main__" and "DATABASE_URL" not in os.environ:
+    os.chdir(tempfile.mkdtemp())
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(os.getcwd(), 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import insert, select
+from sqlalchemy.orm import undefer
+
+from database import engine, SessionLocal, User, Note
+from schemas import NotePage, parse_fields
+
+def seed(count):
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{"id": 1, "username": "writer", "email": "writer@example.com", "role": "child"}])
+        conn.execute(insert(Note), [
+            {"title": f"Note {n}", "content": "Lorem ipsum dolor sit amet. " * 40, "tags": "school, bench", "is_todo": n % 3 == 0, "owner_id": 1}
+            for n in range(count)
+        ])
+
+def before(db):
+    notes = db.scalars(select(Note).options(undefer(Note.content)).order_by(Note.updated_at.desc(), Note.id.desc())).all()
+    began = time.perf_counter()
+    body = JSONResponse(jsonable_encoder({"items": notes, "next_cursor": None})).body
+    return began, body
+
+def after(db, page_adapter):
+    notes = db.scalars(select(Note).options(undefer(Note.content)).order_by(Note.updated_at.desc(), Note.id.desc())).all()
+    began = time.perf_counter()
+    page = page_adapter.validate_python({"items": notes, "next_cursor": None}, from_attributes=True)
+    body = ORJSONResponse(page_adapter.dump_python(page, mode="json", exclude_unset=True)).body
+    return began, body
+
+def projection(db, page_adapter):
+    columns = [getattr(Note, name) for name in parse_fields("title,tags,is_todo,is_completed")]
+    rows = db.execute(select(*columns).order_by(Note.updated_at.desc(), Note.id.desc())).all()
+    began = time.perf_counter()
+    rows = [row._asdict() for row in rows]  # As pagination.paginate hands them over
+    page = page_adapter.validate_python({"items": rows, "next_cursor": None}, from_attributes=True)
+    body = ORJSONResponse(page_adapter.dump_python(page, mode="json", exclude_unset=True)).body
+    return began, body
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    seed(args.notes)
+    page_adapter = TypeAdapter(NotePage)
+    runs = (("before", before), ("after", lambda db: after(db, page_adapter)), ("projection", lambda db: projection(db, page_adapter)))
+
+    print(f"{'mode':>10} {'fetch ms':>9} {'serialize ms':>13} {'bytes':>10}")
+    for label, run in runs:
+        fetch, serialize = [], []
+        for _ in range(args.repeat):
+            with SessionLocal() as db:
+                started = time.perf_counter()
+                began, body = run(db)
+                finished = time.perf_counter()
+            fetch.append(began - started)
+            serialize.append(finished - began)
+        print(f"{label:>10} {min(fetch) * 1000:>9.1f} {min(serialize) * 1000:>13.1f} {len(body):>10}")
+
+if __name__ == "__main__":
+    main()
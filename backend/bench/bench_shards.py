@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Measure concurrent note writes with one database and with one database per
+family (DB_SHARD_DIR).
+
+For each layout, starts uvicorn in a scratch directory, signs up --families
+children (each a family of their own) and then, for each count in --active,
+lets that many families write at once: --writers clients per family, each
+creating notes through POST /notes for --seconds. Prints notes per second
+and p50/p95 latency per layout and number of active families. DB_PROFILE
+applies to both layouts; the production profile (the default here) gives
+each database a single writer connection per process. With --workers,
+uvicorn runs that many processes, which contend for a single database's
+write lock but not for separate families' databases.
+
+    python bench/bench_shards.py --families 8 --active 1 2 4 8 --writers 4 --seconds 10
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class Server:
+    """uvicorn serving main:app from a new scratch directory until the block exits"""
+
+    def __init__(self, env, workers=1):
+        self.env = env
+        self.workers = workers
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        env = dict(os.environ, PYTHONPATH=BACKEND_DIR, RATE_LIMIT_ENABLED="false", LOAD_SHED_MAX_CONCURRENCY="0", **self.env)
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(self.port), "--workers", str(self.workers), "--log-level", "warning"],
+            cwd=tempfile.mkdtemp(), env=env,
+        )
+        for _ in range(200):
+            try:
+                httpx.get(f"{self.base_url}/available-children", timeout=5)
+                return self
+            except httpx.TransportError:
+                time.sleep(0.1)
+        raise RuntimeError("server did not start")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.wait()
+
+def sign_up(server, count):
+    headers = []
+    for i in range(count):
+        account = {"username": f"writer{i}", "password": "bench"}
+        httpx.post(f"{server.base_url}/signup", json={**account, "email": f"writer{i}@example.com"}).raise_for_status()
+        token = httpx.post(f"{server.base_url}/login", json=account).json()["access_token"]
+        headers.append({"Authorization": f"Bearer {token}"})
+    return headers
+
+async def write_notes(client, headers, deadline, latencies):
+    while time.perf_counter() < deadline:
+        began = time.perf_counter()
+        response = await client.post("/notes", json={"title": "bench", "content": "x" * 200, "tags": "bench"}, headers=headers)
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - began) * 1000)
+
+async def run(server, families, writers, seconds):
+    latencies = []
+    async with httpx.AsyncClient(base_url=server.base_url, limits=httpx.Limits(max_connections=None), timeout=60) as client:
+        # Warm up every family's engines before timing
+        await asyncio.gather(*(client.get("/notes", params={"limit": 1}, headers=headers) for headers in families))
+        began = time.perf_counter()
+        deadline = began + seconds
+        await asyncio.gather(*(write_notes(client, headers, deadline, latencies) for headers in families for _ in range(writers)))
+        elapsed = time.perf_counter() - began
+    return len(latencies) / elapsed, statistics.median(latencies), statistics.quantiles(latencies, n=20)[-1]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--families", type=int, default=8)
+    parser.add_argument("--active", type=int, nargs="+", default=[1, 2, 4, 8], help="numbers of families writing at once")
+    parser.add_argument("--writers", type=int, default=4, help="concurrent clients per family")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--profile", default="production", choices=["default", "production"])
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    args = parser.parse_args()
+
+    layouts = [("single", {}), ("family", {"DB_SHARD_DIR": "shards"})]
+    print(f"{'layout':>8} {'families':>9} {'writers':>8} {'notes/s':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for layout, env in layouts:
+        with Server({"DB_PROFILE": args.profile, **env}, args.workers) as server:
+            families = sign_up(server, max(args.families, *args.active))
+            for active in args.active:
+                rate, p50, p95 = asyncio.run(run(server, families[:active], args.writers, args.seconds))
+                print(f"{layout:>8} {active:>9} {active * args.writers:>8} {rate:>9.0f} {p50:>8.1f} {p95:>8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Compare steady-state delta sync with reloading the full note list.
+
+Creates an account with --notes notes, takes an initial GET /sync snapshot,
+then for each change count edits and deletes that many notes and measures
+one GET /sync?since=<cursor> against paging through all of GET /notes.
+Runs the app in-process against a throwaway database in a temporary directory.
+
+    python bench/bench_sync.py --notes 10000 --changes 1 10 100
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=10000)
+    parser.add_argument("--changes", type=int, nargs="+", default=[1, 10, 100])
+    args = parser.parse_args()
+
+    # database.py opens ./notes_new.db on import, so import the app from a scratch directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(tempfile.mkdtemp())
+    # Every request comes from one client, which the rate limits would throttle
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+    from fastapi.testclient import TestClient
+    from batch import MAX_BATCH_SIZE
+    from main import app
+    from pagination import MAX_PAGE_SIZE
+    from sync import MAX_SYNC_LIMIT
+
+    with TestClient(app) as client:
+        client.post("/signup", json={"username": "writer", "email": "writer@example.com", "password": "pw"})
+        token = client.post("/login", json={"username": "writer", "password": "pw"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        note_ids = []
+        for start in range(0, args.notes, MAX_BATCH_SIZE):
+            notes = [{"title": f"Note {n}", "content": "Lorem ipsum dolor sit amet. " * 40, "tags": "bench"} for n in range(start, min(start + MAX_BATCH_SIZE, args.notes))]
+            note_ids += [item["id"] for item in client.post("/notes/batch", json={"notes": notes}, headers=headers).json()]
+
+        cursor = None
+        while True:
+            page = client.get("/sync", params={"since": cursor, "limit": MAX_SYNC_LIMIT}, headers=headers).json()
+            cursor = page["cursor"]
+            if not page["has_more"]:
+                break
+
+        print(f"{'changes':>8} {'mode':>5} {'ms':>9} {'bytes':>11} {'requests':>9}")
+        for changes in args.changes:
+            edited, deleted = note_ids[:changes], note_ids[changes:2 * changes]
+            del note_ids[changes:2 * changes]
+            client.patch("/notes/batch", json={"notes": [{"id": note_id, "title": "Edited"} for note_id in edited]}, headers=headers)
+            client.request("DELETE", "/notes/batch", json={"ids": deleted}, headers=headers)
+
+            began = time.perf_counter()
+            response = client.get("/sync", params={"since": cursor}, headers=headers)
+            elapsed = time.perf_counter() - began
+            cursor = response.json()["cursor"]
+            print(f"{changes:>8} {'sync':>5} {elapsed * 1000:>9.1f} {len(response.content):>11} {1:>9}")
+
+            size, requests, page_cursor = 0, 0, None
+            began = time.perf_counter()
+            while True:
+                response = client.get("/notes", params={"cursor": page_cursor, "limit": MAX_PAGE_SIZE}, headers=headers)
+                size, requests = size + len(response.content), requests + 1
+                page_cursor = response.json()["next_cursor"]
+                if not page_cursor:
+                    break
+            elapsed = time.perf_counter() - began
+            print(f"{changes:>8} {'full':>5} {elapsed * 1000:>9.1f} {size:>11} {requests:>9}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Mixed read/write benchmark for the SQLite engine profiles.
+
+For each DB_PROFILE, readers page through notes on the read engine while
+writers create and update notes on the write engine, like create_note and
+update_note do. Reports reader latency (p50/p99/max stall) and write
+throughput. Under the default rollback journal every commit blocks readers;
+under the production WAL profile they should not stall.
+
+    python bench/bench_wal.py --profiles default production --readers 16 --writers 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Benchmarks live in bench/; the modules they measure are one directory up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SEED_NOTES = 5000
+OWNERS = 20
+
+async def reader(stop, latencies):
+    from sqlalchemy import select
+    from sqlalchemy.orm import undefer
+    from database import ReadSessionLocal, Note
+    from pagination import paginate
+
+    while not stop.is_set():
+        owner_id = random.randint(1, OWNERS)
+        began = time.perf_counter()
+        async with ReadSessionLocal() as db:
+            await paginate(db, select(Note).where(Note.owner_id == owner_id).options(undefer(Note.content)), Note.updated_at, Note.id)
+        latencies.append(time.perf_counter() - began)
+
+async def writer(stop, counts):
+    from database import AsyncSessionLocal, Note
+
+    while not stop.is_set():
+        owner_id = random.randint(1, OWNERS)
+        async with AsyncSessionLocal() as db:
+            note = Note(title="Written", content="Body " * 40, tags="bench", owner_id=owner_id)
+            db.add(note)
+            await db.commit()
+            note.is_completed = True
+            note.updated_at = datetime.utcnow()
+            await db.commit()
+        counts["writes"] += 2
+
+async def measure(readers, writers, duration):
+    from database import dispose_engines
+
+    stop = asyncio.Event()
+    latencies, counts = [], {"writes": 0}
+    tasks = [asyncio.create_task(reader(stop, latencies)) for _ in range(readers)]
+    tasks += [asyncio.create_task(writer(stop, counts)) for _ in range(writers)]
+    await asyncio.sleep(duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+    await dispose_engines()
+
+    latencies.sort()
+    return {
+        "reads": len(latencies),
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+        "max_ms": latencies[-1] * 1000,
+        "writes_per_s": counts["writes"] / duration,
+    }
+
+def run_profile(args):
+    from sqlalchemy import insert
+    from database import engine, User, Note
+
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"id": i, "username": f"user{i}", "email": f"user{i}@example.com", "role": "child"}
+            for i in range(1, OWNERS + 1)
+        ])
+        conn.execute(insert(Note), [
+            {"title": f"Note {n}", "content": "Body " * 40, "tags": "bench", "owner_id": n % OWNERS + 1}
+            for n in range(SEED_NOTES)
+        ])
+    engine.dispose()
+    print(json.dumps(asyncio.run(measure(args.readers, args.writers, args.duration))))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", default=["default", "production"])
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--run", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_profile(args)
+        return
+
+    print(f"{'profile':>10} {'reads':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'writes/s':>9}")
+    for profile in args.profiles:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, DB_PROFILE=profile, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run",
+                 "--readers", str(args.readers), "--writers", str(args.writers), "--duration", str(args.duration)],
+                env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), capture_output=True, text=True, check=True,
+            ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{profile:>10} {result['reads']:>7} {result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['max_ms']:>8.1f} {result['writes_per_s']:>9.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Script to recompute user_stats from the notes and folders tables and report drift.
+
+Run with --fix to overwrite drifted or missing rows; this also backfills the
+table for users created before the dashboard existed. last_activity_at is
+only filled in where it is missing, because deletes leave no trace to
+recompute it from.
+
+    python check_stats.py [--fix]
+"""
+import argparse
+import sys
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert
+from database import engine, UserStats
+from stats import COUNTERS, computed_stats
+
+def check_stats(fix=False):
+    with engine.begin() as conn:
+        stored = {row.user_id: row for row in conn.execute(select(UserStats))}
+        drifted = []
+        for expected in conn.execute(computed_stats()):
+            actual = stored.get(expected.user_id)
+            if actual is None:
+                if any(getattr(expected, name) for name in COUNTERS):
+                    drifted.append(expected)
+                    print(f"user {expected.user_id}: no stats row")
+                continue
+            for name in COUNTERS:
+                if getattr(actual, name) != getattr(expected, name):
+                    drifted.append(expected)
+                    print(f"user {expected.user_id}: {name} is {getattr(actual, name)}, expected {getattr(expected, name)}")
+            if actual.last_activity_at is None and expected.last_activity_at is not None:
+                drifted.append(expected)
+
+        if fix and drifted:
+            statement = insert(UserStats)
+            statement = statement.on_conflict_do_update(
+                index_elements=[UserStats.user_id],
+                set_={
+                    **{name: statement.excluded[name] for name in COUNTERS},
+                    "last_activity_at": func.coalesce(UserStats.last_activity_at, statement.excluded.last_activity_at),
+                },
+            )
+            conn.execute(statement, [dict(row._mapping) for row in {row.user_id: row for row in drifted}.values()])
+
+    users = len({row.user_id for row in drifted})
+    if not drifted:
+        print("user_stats is consistent")
+    elif fix:
+        print(f"Fixed stats for {users} users")
+    else:
+        print(f"Stats drifted for {users} users; run with --fix to repair")
+    return not drifted or fix
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fix", action="store_true", help="overwrite drifted rows with the recomputed counters")
+    args = parser.parse_args()
+    sys.exit(0 if check_stats(args.fix) else 1)
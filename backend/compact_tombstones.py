@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Script to purge soft-deleted notes and folders and drop sync tombstones older
+than TOMBSTONE_RETENTION_DAYS.
+
+The API does this in the background while it is quiet (see maintenance.py);
+run this where no long-lived process does, e.g. from cron on serverless
+deployments. Clients whose sync cursor predates the purged rows get a full
+snapshot on their next GET /sync. With DB_SHARD_DIR set it purges every
+family's database in turn.
+
+--vacuum then rebuilds each database with a full VACUUM, which also switches
+databases created before incremental vacuuming to auto_vacuum=INCREMENTAL.
+It holds the write lock for the whole rebuild, so stop the app first.
+
+    python compact_tombstones.py [--days 30] [--vacuum]
+"""
+import argparse
+import asyncio
+from sqlalchemy import text
+from database import AsyncSessionLocal, DB_SHARD_DIR, Folder, Note, create_sync_engine, dispose_engines, enter_family, family_ids, shard_url, SQLALCHEMY_DATABASE_URL
+from maintenance import PURGE_BATCH_SIZE
+from sync import compact_tombstones, purge_deleted, TOMBSTONE_RETENTION_DAYS
+
+async def purge(days):
+    """{"notes": n, "folders": n, "tombstones": n} removed from the current database"""
+    steps = {
+        "notes": lambda db: purge_deleted(db, Note, days, PURGE_BATCH_SIZE),
+        "folders": lambda db: purge_deleted(db, Folder, days, PURGE_BATCH_SIZE),
+        "tombstones": lambda db: compact_tombstones(db, days, PURGE_BATCH_SIZE),
+    }
+    removed = dict.fromkeys(steps, 0)
+    async with AsyncSessionLocal() as db:
+        for name, step in steps.items():
+            # One transaction per batch keeps the write lock short for other writers
+            while True:
+                count = await step(db)
+                await db.commit()
+                removed[name] += count
+                if count < PURGE_BATCH_SIZE:
+                    break
+    return removed
+
+def vacuum(url):
+    vacuum_engine = create_sync_engine(url)
+    try:
+        with vacuum_engine.connect() as conn:
+            conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+            conn.execute(text("VACUUM"))
+    finally:
+        vacuum_engine.dispose()
+
+async def main(days, full_vacuum):
+    removed = {}
+    for family_id in await family_ids() if DB_SHARD_DIR else [None]:
+        await enter_family(family_id)
+        for name, count in (await purge(days)).items():
+            removed[name] = removed.get(name, 0) + count
+        if full_vacuum:
+            await dispose_engines()
+            vacuum(shard_url(family_id) if family_id is not None else SQLALCHEMY_DATABASE_URL)
+    await dispose_engines()
+    print(f"Removed {removed.get('notes', 0)} notes, {removed.get('folders', 0)} folders and {removed.get('tombstones', 0)} tombstones older than {days:g} days")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=float, default=TOMBSTONE_RETENTION_DAYS)
+    parser.add_argument("--vacuum", action="store_true", help="rebuild each database with a full VACUUM afterwards")
+    args = parser.parse_args()
+    asyncio.run(main(args.days, args.vacuum))
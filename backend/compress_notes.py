@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Script to compress existing note bodies in place, one batch per transaction.
+
+Notes are compressed when they are written, so bodies stored before
+compression existed (or under a higher NOTE_COMPRESS_MIN_SIZE) stay plain
+text until this rewrites them. The app keeps serving between batches.
+--decompress rewrites every compressed body as plain text, for rolling back
+to a build without CompressedText.
+
+Only the stored form changes, so each note keeps its change_seq and clients
+of GET /sync do not download every rewritten note again. Pass --vacuum to
+hand the freed pages back to the filesystem afterwards.
+
+    python compress_notes.py [--batch-size 500] [--min-size 1024] [--decompress] [--vacuum]
+"""
+import argparse
+from sqlalchemy import text
+from compression import compress, decompress, COMPRESS_MIN_SIZE
+from database import engine
+
+BATCH_SIZE = 500
+
+def _stored_size(value):
+    return len(value) if isinstance(value, bytes) else len(value.encode())
+
+def compress_notes(bind, batch_size=BATCH_SIZE, min_size=COMPRESS_MIN_SIZE, restore=False):
+    """Rewrite note bodies compressed (or, with restore, as plain text).
+
+    Returns (notes rewritten, bytes before, bytes after).
+    """
+    if restore:
+        candidates = "typeof(content) = 'blob'"
+    else:
+        candidates = "typeof(content) = 'text' AND length(CAST(content AS BLOB)) >= :min_size"
+    select_batch = text(f"SELECT id, content FROM notes WHERE id > :last_id AND {candidates} ORDER BY id LIMIT :limit")
+    # The change-tracking trigger skips updates that change change_seq, so
+    # negating it around the rewrite leaves the note's sequence number alone
+    rewrite = text("UPDATE notes SET content = :content, change_seq = -change_seq WHERE id = :note_id")
+    restore_seq = text("UPDATE notes SET change_seq = -change_seq WHERE id = :note_id")
+    
+    rewritten = size_before = size_after = 0
+    last_id = 0
+    while True:
+        with bind.begin() as conn:
+            rows = conn.execute(select_batch, {"last_id": last_id, "min_size": min_size, "limit": batch_size}).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            
+            updates = []
+            for note_id, stored in rows:
+                content = decompress(stored) if restore else compress(stored, min_size)
+                if content is stored:  # Did not shrink
+                    continue
+                updates.append({"note_id": note_id, "content": content})
+                size_before += _stored_size(stored)
+                size_after += _stored_size(content)
+            if updates:
+                conn.execute(rewrite, updates)
+                conn.execute(restore_seq, [{"note_id": update["note_id"]} for update in updates])
+            rewritten += len(updates)
+    return rewritten, size_before, size_after
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--min-size", type=int, default=COMPRESS_MIN_SIZE, help="compress bodies of at least this many bytes")
+    parser.add_argument("--decompress", action="store_true", help="store every body as plain text again")
+    parser.add_argument("--vacuum", action="store_true", help="run VACUUM afterwards to shrink the file")
+    args = parser.parse_args()
+    
+    rewritten, size_before, size_after = compress_notes(engine, args.batch_size, args.min_size, restore=args.decompress)
+    print(f"{'Decompressed' if args.decompress else 'Compressed'} {rewritten} notes: {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB of content")
+    if args.vacuum:
+        with engine.connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+        print("Vacuumed")
+
+if __name__ == "__main__":
+    main()
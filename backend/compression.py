@@ -0,0 +1,62 @@
+"""
+Transparent compression of note bodies at rest.
+
+CompressedText stores text of COMPRESS_MIN_SIZE bytes or more as a BLOB: one
+marker byte naming the codec, then the compressed payload. Shorter text, and
+text that would not shrink, stays plain TEXT, so rows written before
+compression existed read back unchanged and compression can be rolled out (or
+back) a batch at a time with compress_notes.py.
+
+SQL that reads notes.content directly must go through note_text(), which
+every connection registers (see database.py); the search index does.
+"""
+import os
+import zlib
+
+from sqlalchemy import Text
+from sqlalchemy.types import TypeDecorator
+
+COMPRESS_MIN_SIZE = int(os.getenv("NOTE_COMPRESS_MIN_SIZE", "1024"))  # Bytes of UTF-8; 0 disables compression
+COMPRESS_LEVEL = int(os.getenv("NOTE_COMPRESS_LEVEL", "6"))
+
+# Marker byte -> decompressor. Compressed bodies are the only BLOBs in the
+# column, so plain text needs no escaping; a new codec gets a new marker.
+ZLIB = b"\x01"
+CODECS = {ZLIB[0]: zlib.decompress}
+
+def compress(value, min_size=None):
+    """The stored form of `value`: compressed bytes, or `value` itself if it is short or incompressible"""
+    min_size = COMPRESS_MIN_SIZE if min_size is None else min_size
+    if value is None or isinstance(value, bytes) or min_size <= 0:
+        return value
+    encoded = value.encode()
+    if len(encoded) < min_size:
+        return value
+    packed = ZLIB + zlib.compress(encoded, COMPRESS_LEVEL)
+    return packed if len(packed) < len(encoded) else value
+
+def decompress(value):
+    """The text of a stored value, compressed or not"""
+    if not isinstance(value, bytes):
+        return value
+    try:
+        decompressor = CODECS[value[0]]
+    except (IndexError, KeyError):
+        raise ValueError(f"Unknown compression marker {value[:1]!r}")
+    return decompressor(value[1:]).decode()
+
+class CompressedText(TypeDecorator):
+    """Text column stored through compress() and read back through decompress()"""
+
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return compress(value)
+
+    def process_result_value(self, value, dialect):
+        return decompress(value)
+
+def register_functions(dbapi_connection, connection_record):
+    """Connect listener: make note_text(content) available to SQL and triggers"""
+    dbapi_connection.create_function("note_text", 1, decompress, deterministic=True)
@@ -2,18 +2,37 @@
 """
 Script to create demo data with Indian names
 5 parents with 7 children total (3 parents have 1 child each, 2 parents have 2 children each)
+
+With --users it generates a synthetic dataset of that size instead, for
+benchmarks and load tests. The output depends only on the arguments and
+--seed, so runs with the same arguments produce identical databases.
+
+    python create_demo_data.py --users 100000 --children-per-parent 2 \
+        --folders-per-child 5 --notes-per-folder 20 --seed 1
 """
-from database import SessionLocal, User, Folder, Note
-from auth import get_password_hash
+import argparse
+import math
 import random
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+
+from sqlalchemy import delete, insert, select, text, update
+
+from database import engine, SessionLocal, User, Folder, Note, Tag, NoteTag, UserStats, Tombstone, ChangeSequence, Job, ImportJob, ImportFolder, NOTES_FTS_DDL, CHANGE_TRACKING_DDL
+from auth import get_password_hash
+
+DEMO_PASSWORD = "password123"
+SYNTHETIC_TAGS = ["school", "homework", "math", "science", "reading", "art", "music", "sports", "family", "friends", "ideas", "exams", "projects", "weekend", "games", "movies"]
+SYNTHETIC_FOLDERS = ["School", "Personal", "Projects", "Ideas", "To-Do", "Reading", "Sports", "Music", "Art", "Science"]
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo consequat".split()
+EPOCH = datetime(2024, 1, 1)  # Fixed so timestamps are reproducible too
 
 def create_demo_data():
     db = SessionLocal()
     
     # Clear existing data
-    db.query(Note).delete()
-    db.query(Folder).delete()
-    db.query(User).delete()
+    clear_data(db.connection())
     db.commit()
     
     # Indian names for parents and children
@@ -41,7 +60,7 @@ def create_demo_data():
         parent = User(
             username=name.lower(),
             email=email,
-            hashed_password=get_password_hash("password123"),
+            hashed_password=get_password_hash(DEMO_PASSWORD),
             role="parent"
         )
         db.add(parent)
@@ -64,7 +83,7 @@ def create_demo_data():
         child = User(
             username=name.lower(),
             email=email,
-            hashed_password=get_password_hash("password123"),
+            hashed_password=get_password_hash(DEMO_PASSWORD),
             role="child",
             parent_id=parent_id
         )
@@ -152,5 +171,173 @@ def create_demo_data():
     print("5. vikram (password: password123) - Children: diya, aarav")
     print("\nAll children also have username/password combinations (password: password123)")
 
+def clear_data(conn):
+    """Delete every user with their notes, folders, derived rows and jobs"""
+    # Ids are reused after the wipe, so a new user must not inherit an old import or job
+    for model in (Job, ImportFolder, ImportJob, NoteTag, Tag, UserStats, Note, Folder, Tombstone, User):
+        conn.execute(delete(model))
+    # Sync cursors issued before the wipe must not resume into the new data
+    conn.execute(update(ChangeSequence).values(horizon=ChangeSequence.value))
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+class BulkWriter:
+    """Buffers generated rows per table and inserts them executemany-style in batches"""
+
+    def __init__(self, conn, batch_size):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.buffers = {}
+        self.counts = {}
+        self.started = time.perf_counter()
+        self.reported = 0
+
+    def add(self, model, row):
+        buffer = self.buffers.setdefault(model, [])
+        buffer.append(row)
+        if len(buffer) >= self.batch_size:
+            self.flush(model)
+
+    def flush(self, model=None):
+        for model in [model] if model else list(self.buffers):
+            if self.buffers.get(model):
+                self.conn.execute(insert(model), self.buffers[model])
+                self.counts[model.__tablename__] = self.counts.get(model.__tablename__, 0) + len(self.buffers[model])
+                self.buffers[model] = []
+        total = sum(self.counts.values())
+        if total - self.reported >= 1_000_000:
+            self.reported = total
+            print(f"  {total:,} rows, {total / (time.perf_counter() - self.started):,.0f} rows/s")
+
+def _content_sizes(rng, median, spread, maximum):
+    """Lognormal note lengths: mostly short, with a long tail of long notes"""
+    while True:
+        yield max(1, min(maximum, int(median * math.exp(rng.gauss(0, spread)))))
+
+def generate_data(users=1000, children_per_parent=2, folders_per_child=3, notes_per_folder=10, content_size=400, content_spread=1.0, content_max=20000, todo_ratio=0.3, seed=1, batch_size=10000, password=DEMO_PASSWORD):
+    """Replace the database contents with a synthetic dataset.
+
+    `users` is split into families of one parent and `children_per_parent`
+    children. Every child gets `folders_per_child` folders of
+    `notes_per_folder` notes each. Rows are produced lazily and inserted with
+    Core in `batch_size` batches inside one transaction. The notes and folders
+    triggers are dropped for the load; their work (FTS index, change_seq) is
+    done in bulk afterwards and the triggers are recreated before commit.
+    Returns a dict of row counts per table.
+    """
+    rng = random.Random(seed)
+    password_hash = get_password_hash(password)
+    # Note bodies are slices of one long random text
+    corpus = " ".join(rng.choices(WORDS, k=content_max // 3 + 1000))
+    sizes = _content_sizes(rng, content_size, content_spread, content_max)
+    families = max(1, users // (children_per_parent + 1))
+    children_each, extra_children = divmod(users - families, families)
+
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA cache_size=-262144")
+        conn.commit()
+        with conn.begin():
+            for statement in NOTES_FTS_DDL + CHANGE_TRACKING_DDL:
+                if statement.startswith("CREATE TRIGGER"):
+                    conn.exec_driver_sql("DROP TRIGGER IF EXISTS " + statement.split()[5])
+            clear_data(conn)
+            conn.exec_driver_sql("INSERT INTO notes_fts(notes_fts) VALUES ('delete-all')")
+            seq = conn.scalar(select(ChangeSequence.value).where(ChangeSequence.id == 1))
+
+            writer = BulkWriter(conn, batch_size)
+            for tag_id, name in enumerate(SYNTHETIC_TAGS, start=1):
+                writer.add(Tag, {"id": tag_id, "name": name})
+
+            user_id = folder_id = note_id = 0
+            for family in range(families):
+                user_id += 1
+                parent_id = user_id
+                writer.add(User, {"id": parent_id, "username": f"parent{parent_id}", "email": f"parent{parent_id}@example.com", "hashed_password": password_hash, "role": "parent", "parent_id": None, "auth_version": 1, "created_at": EPOCH})
+                for _ in range(children_each + (family < extra_children)):
+                    user_id += 1
+                    writer.add(User, {"id": user_id, "username": f"child{user_id}", "email": f"child{user_id}@example.com", "hashed_password": password_hash, "role": "child", "parent_id": parent_id, "auth_version": 1, "created_at": EPOCH})
+                    stats = {"user_id": user_id, "note_count": 0, "folder_count": folders_per_child, "open_todo_count": 0, "completed_todo_count": 0, "last_activity_at": EPOCH, "collection_version": 1}
+                    for name in rng.sample(SYNTHETIC_FOLDERS * math.ceil(folders_per_child / len(SYNTHETIC_FOLDERS)), folders_per_child):
+                        folder_id += 1
+                        seq += 1
+                        created_at = EPOCH + timedelta(seconds=rng.randrange(365 * 86400))
+                        writer.add(Folder, {"id": folder_id, "name": name, "owner_id": user_id, "created_at": created_at, "change_seq": seq})
+                        for _ in range(notes_per_folder):
+                            note_id += 1
+                            seq += 1
+                            size = next(sizes)
+                            start = rng.randrange(len(corpus) - size)
+                            tag_ids = rng.sample(range(1, len(SYNTHETIC_TAGS) + 1), rng.choice((0, 1, 1, 2, 2, 3)))
+                            is_todo = rng.random() < todo_ratio
+                            is_completed = is_todo and rng.random() < 0.5
+                            updated_at = created_at + timedelta(seconds=rng.randrange(30 * 86400))
+                            writer.add(Note, {
+                                "id": note_id,
+                                "title": " ".join(rng.choices(WORDS, k=rng.randint(2, 6))).capitalize(),
+                                "content": corpus[start:start + size],
+                                "tags": ", ".join(SYNTHETIC_TAGS[tag_id - 1] for tag_id in tag_ids),
+                                "is_todo": is_todo,
+                                "is_completed": is_completed,
+                                "folder_id": folder_id,
+                                "owner_id": user_id,
+                                "created_at": created_at,
+                                "updated_at": updated_at,
+                                "change_seq": seq,
+                            })
+                            for tag_id in tag_ids:
+                                writer.add(NoteTag, {"note_id": note_id, "tag_id": tag_id, "owner_id": user_id})
+                            stats["note_count"] += 1
+                            stats["open_todo_count"] += is_todo and not is_completed
+                            stats["completed_todo_count"] += is_completed
+                            stats["last_activity_at"] = max(stats["last_activity_at"], updated_at)
+                    writer.add(UserStats, stats)
+            writer.flush()
+
+            conn.execute(update(ChangeSequence).where(ChangeSequence.id == 1).values(value=seq))
+            conn.exec_driver_sql("INSERT INTO notes_fts(notes_fts) VALUES ('rebuild')")
+            for statement in NOTES_FTS_DDL + CHANGE_TRACKING_DDL:
+                conn.execute(text(statement))
+    return writer.counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, help="generate this many synthetic users instead of the demo families")
+    parser.add_argument("--children-per-parent", type=int, default=2)
+    parser.add_argument("--folders-per-child", type=int, default=3)
+    parser.add_argument("--notes-per-folder", type=int, default=10)
+    parser.add_argument("--content-size", type=int, default=400, help="median note length in characters")
+    parser.add_argument("--content-spread", type=float, default=1.0, help="lognormal sigma of note lengths; 0 makes every note --content-size long")
+    parser.add_argument("--content-max", type=int, default=20000, help="longest note in characters")
+    parser.add_argument("--todo-ratio", type=float, default=0.3, help="fraction of notes that are todos; half of those are completed")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=10000, help="rows per INSERT executemany")
+    args = parser.parse_args()
+
+    if args.users is None:
+        create_demo_data()
+        return
+
+    started = time.perf_counter()
+    counts = generate_data(
+        users=args.users,
+        children_per_parent=args.children_per_parent,
+        folders_per_child=args.folders_per_child,
+        notes_per_folder=args.notes_per_folder,
+        content_size=args.content_size,
+        content_spread=args.content_spread,
+        content_max=args.content_max,
+        todo_ratio=args.todo_ratio,
+        seed=args.seed,
+        batch_size=args.batch_size,
+    )
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    for table, count in counts.items():
+        print(f"{table:>12} {count:>12,}")
+    print(f"Generated {total:,} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s); every password is {DEMO_PASSWORD}")
+
 if __name__ == "__main__":
-    create_demo_data()
\ No newline at end of file
+    main()
\ No newline at end of file
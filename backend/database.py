@@ -1,12 +1,204 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, ForeignKey
+from sqlalchemy import create_engine, event, inspect, select, text, Column, Integer, String, DateTime, Boolean, ForeignKey, Index
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import Session, sessionmaker, relationship, deferred
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+from sqlalchemy.sql.util import find_tables
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from datetime import datetime
+import asyncio
+import os
+import threading
+import time
+
+from compression import CompressedText, register_functions
 
 # SQLite database setup
-SQLALCHEMY_DATABASE_URL = "sqlite:///./notes_new.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./notes_new.db")
+ASYNC_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+
+# Pool sizing for the async engines used by the API
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # Seconds to wait for a pooled connection
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "5"))  # Seconds SQLite waits on a locked database
+
+# Engine profile: "default" keeps SQLite's rollback journal and one shared engine.
+# "production" switches to WAL with tuned pragmas, a pooled read-only engine for
+# reads and a single-connection engine that serializes all writes.
+DB_PROFILE = os.getenv("DB_PROFILE", "default")
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "65536"))  # Page cache per connection
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+PRODUCTION_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",  # Durable across app crashes; WAL fsyncs at checkpoints
+    f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}",
+    f"PRAGMA mmap_size={DB_MMAP_SIZE}",
+    "PRAGMA temp_store=MEMORY",
+]
+
+# Family-partitioned storage: with DB_SHARD_DIR set, DATABASE_URL holds only the
+# directory (users and the family each belongs to) and every family's folders
+# and notes live in their own SQLite file under DB_SHARD_DIR. Empty keeps the
+# single database.
+DB_SHARD_DIR = os.getenv("DB_SHARD_DIR", "")
+DB_SHARD_POOL_SIZE = int(os.getenv("DB_SHARD_POOL_SIZE", "2"))  # Per family; overflow is DB_MAX_OVERFLOW
+DB_SHARD_CACHE_SIZE = int(os.getenv("DB_SHARD_CACHE_SIZE", "64"))  # Families with open engines
+DB_SHARD_IDLE_SECONDS = float(os.getenv("DB_SHARD_IDLE_SECONDS", "300"))
+
+def _pragma_listener(*pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT * 1000)}")
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+    return set_pragmas
+
+def _connection_pragmas(read_only=False):
+    if DB_PROFILE != "production":
+        return []
+    return PRODUCTION_PRAGMAS + (["PRAGMA query_only=ON"] if read_only else [])
+
+class Database:
+    """The engines and session factories, built on first use rather than on import"""
+
+    def __init__(self):
+        # Synchronous engine for scripts and schema setup
+        self.engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+        event.listen(self.engine, "connect", _pragma_listener(*_connection_pragmas()))
+        event.listen(self.engine, "connect", register_functions)
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        
+        self.async_engine, self.read_engine = _create_async_engines(ASYNC_DATABASE_URL, DB_POOL_SIZE)
+        
+        # Objects stay usable after commit; endpoints serialize them once the transaction is done
+        options = dict(class_=AsyncSession, autoflush=False, expire_on_commit=False)
+        if DB_SHARD_DIR:
+            self.shard_engines = ShardEngines(DB_SHARD_CACHE_SIZE, DB_SHARD_IDLE_SECONDS)
+            options["sync_session_class"] = FamilySession
+        self.AsyncSessionLocal = async_sessionmaker(self.async_engine, **options)
+        self.ReadSessionLocal = async_sessionmaker(self.read_engine, info={"read_only": True}, **options)
+
+def _create_async_engines(url, pool_size):
+    """(writer, reader) for one database file; the same engine unless DB_PROFILE is production"""
+    if DB_PROFILE == "production":
+        # One writer connection: SQLite allows a single writer anyway, so queue
+        # writers in the pool instead of letting them fight over the file lock
+        return (_create_async_engine(url, pool_size=1, max_overflow=0),
+                _create_async_engine(url, pool_size, DB_MAX_OVERFLOW, read_only=True))
+    async_engine = _create_async_engine(url, pool_size, DB_MAX_OVERFLOW)
+    return async_engine, async_engine
+
+def _create_async_engine(url, pool_size, max_overflow, read_only=False):
+    async_engine = create_async_engine(
+        url,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=DB_POOL_TIMEOUT,
+        connect_args={"timeout": DB_BUSY_TIMEOUT},
+    )
+    event.listen(async_engine.sync_engine, "connect", _pragma_listener(*_connection_pragmas(read_only)))
+    event.listen(async_engine.sync_engine, "connect", register_functions)
+    return async_engine
+
+def shard_path(family_id: int) -> str:
+    return os.path.join(DB_SHARD_DIR, f"family-{family_id}.db")
+
+def shard_url(family_id: int) -> str:
+    return "sqlite:///" + shard_path(family_id)
+
+def create_sync_engine(url: str = SQLALCHEMY_DATABASE_URL):
+    """Unpooled synchronous engine, for schema setup and maintenance on one file"""
+    sync_engine = create_engine(url, poolclass=NullPool, connect_args={"check_same_thread": False})
+    event.listen(sync_engine, "connect", _pragma_listener(*_connection_pragmas()))
+    event.listen(sync_engine, "connect", register_functions)
+    return sync_engine
+
+class ShardEngines:
+    """Bounded LRU of per-family (writer, reader) engines.
+
+    Engines idle for longer than `idle_seconds` are disposed on the next
+    lookup, and at most `max_size` are kept; an engine with connections
+    checked out is never disposed, so a long request keeps its family open.
+    """
+
+    def __init__(self, max_size: int, idle_seconds: float):
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self._engines = OrderedDict()  # family id -> (writer, reader, last used)
+        self._closing = set()
+
+    def get(self, family_id: int):
+        """(writer, reader) for `family_id`; call from the event loop"""
+        now = time.monotonic()
+        writer, reader, _ = self._engines.pop(family_id, None) or _create_async_engines(
+            shard_url(family_id).replace("sqlite://", "sqlite+aiosqlite://", 1), DB_SHARD_POOL_SIZE) + (now,)
+        self._engines[family_id] = (writer, reader, now)
+        self._evict(now)
+        return writer, reader
+
+    def _evict(self, now: float):
+        # Least recently used first; busy engines are skipped and stay cached
+        for family_id, (writer, reader, last) in list(self._engines.items()):
+            if len(self._engines) <= self.max_size and now - last < self.idle_seconds:
+                break
+            if writer.pool.checkedout() or reader.pool.checkedout():
+                continue
+            del self._engines[family_id]
+            task = asyncio.get_running_loop().create_task(_dispose(writer, reader))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    async def close(self):
+        engines, self._engines = list(self._engines.values()), OrderedDict()
+        for writer, reader, _ in engines:
+            await _dispose(writer, reader)
+
+    def __len__(self):
+        return len(self._engines)
+
+async def _dispose(writer, reader):
+    await writer.dispose()
+    if reader is not writer:
+        await reader.dispose()
+
+# The family whose database this request's sessions use, set by enter_family()
+current_family: ContextVar = ContextVar("current_family", default=None)
+
+class FamilySession(Session):
+    """Session that sends users-only statements to the directory and the rest to the current family's database"""
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if clause is not None:
+            tables = {table.name for table in find_tables(clause, include_crud=True, include_joins=True)}
+            directory = tables == {"users"}
+        else:
+            directory = mapper is not None and mapper.class_ is User
+        if directory:
+            return super().get_bind(mapper, clause=clause, **kw)
+        
+        family_id = current_family.get()
+        if family_id is None:
+            raise RuntimeError("No family selected for this session; call enter_family() first")
+        writer, reader = get_database().shard_engines.get(family_id)
+        return (reader if self.info.get("read_only") else writer).sync_engine
+
+_database = None
+_database_lock = threading.Lock()
+
+def get_database() -> Database:
+    global _database
+    if _database is None:
+        with _database_lock:
+            if _database is None:
+                _database = Database()
+    return _database
+
 Base = declarative_base()
 
 # Database models
@@ -19,14 +211,17 @@ class User(Base):
     hashed_password = Column(String)
     role = Column(String, default="child")  # "child" or "parent"
     parent_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # For child users
+    auth_version = Column(Integer, default=1, nullable=False)  # Bumped whenever token claims go stale
+    family_id = Column(Integer, index=True)  # Family database holding this user's data (DB_SHARD_DIR only)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Self-referential relationship
-    parent = relationship("User", remote_side=[id], back_populates="children")
-    children = relationship("User", back_populates="parent")
+    # Relationships never lazy-load; query explicitly or use selectinload()
+    parent = relationship("User", remote_side=[id], back_populates="children", lazy="raise")
+    children = relationship("User", back_populates="parent", lazy="raise")
     
-    folders = relationship("Folder", back_populates="owner")
-    notes = relationship("Note", back_populates="owner")
+    folders = relationship("Folder", back_populates="owner", lazy="raise")
+    notes = relationship("Note", back_populates="owner", lazy="raise")
 
 class Folder(Base):
     __tablename__ = "folders"
@@ -35,16 +230,30 @@ class Folder(Base):
     name = Column(String, index=True)
     owner_id = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime, default=datetime.utcnow)
+    change_seq = Column(Integer)  # Set by the change-tracking triggers
+    deleted_at = Column(DateTime)  # Soft delete; the row is purged once it passes TOMBSTONE_RETENTION_DAYS
     
-    owner = relationship("User", back_populates="folders")
-    notes = relationship("Note", back_populates="folder")
+    owner = relationship("User", back_populates="folders", lazy="raise")
+    notes = relationship("Note", back_populates="folder", lazy="raise", passive_deletes=True)
+    
+    __table_args__ = (
+        # Keyset pagination of an owner's live folders, newest first
+        Index("ix_folders_live_owner_created", "owner_id", "created_at", sqlite_where=deleted_at.is_(None)),
+        # Delta sync: an owner's folders changed (or deleted) after a sequence number
+        Index("ix_folders_owner_change_seq", "owner_id", "change_seq"),
+        # Purging: soft-deleted folders in the order they were deleted
+        Index("ix_folders_deleted_change_seq", "change_seq", sqlite_where=deleted_at.isnot(None)),
+    )
 
 class Note(Base):
     __tablename__ = "notes"
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
-    content = Column(Text)
+    # Large bodies are stored compressed. Deferred: listings and sync load it with
+    # undefer(Note.content); deletes and tag updates never read or decompress it.
+    content = deferred(Column(CompressedText))
+    content_version = Column(Integer, default=1, nullable=False)  # Bumped by every write to content
     tags = Column(String)  # Comma-separated tags
     is_todo = Column(Boolean, default=False)
     is_completed = Column(Boolean, default=False)
@@ -52,17 +261,330 @@ class Note(Base):
     owner_id = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    change_seq = Column(Integer)  # Set by the change-tracking triggers
+    deleted_at = Column(DateTime)  # Soft delete; the row is purged once it passes TOMBSTONE_RETENTION_DAYS
+    
+    owner = relationship("User", back_populates="notes", lazy="raise")
+    folder = relationship("Folder", back_populates="notes", lazy="raise")
+    
+    __table_args__ = (
+        # Keyset pagination of an owner's live notes, optionally within one folder.
+        # Partial, so deleted rows waiting to be purged never enter a listing's range scan.
+        Index("ix_notes_live_owner_folder_updated", "owner_id", "folder_id", "updated_at", "id", sqlite_where=deleted_at.is_(None)),
+        Index("ix_notes_live_owner_updated", "owner_id", "updated_at", "id", sqlite_where=deleted_at.is_(None)),
+        Index("ix_notes_owner_change_seq", "owner_id", "change_seq"),
+        Index("ix_notes_deleted_change_seq", "change_seq", sqlite_where=deleted_at.isnot(None)),
+    )
+
+class Tag(Base):
+    __tablename__ = "tags"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, index=True)  # Normalized: trimmed and lowercased
+
+class NoteTag(Base):
+    __tablename__ = "note_tags"
+    
+    note_id = Column(Integer, ForeignKey("notes.id"), primary_key=True)
+    tag_id = Column(Integer, ForeignKey("tags.id"), primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id"))  # Copied from the note so counts never touch notes
+    
+    __table_args__ = (
+        # Per-owner tag counts and tag -> notes lookups
+        Index("ix_note_tags_owner_tag_note", "owner_id", "tag_id", "note_id"),
+    )
+
+class UserStats(Base):
+    __tablename__ = "user_stats"
+    
+    # Counters kept up to date by the write endpoints, in the same transaction as the write
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    note_count = Column(Integer, default=0, nullable=False)
+    folder_count = Column(Integer, default=0, nullable=False)
+    open_todo_count = Column(Integer, default=0, nullable=False)
+    completed_todo_count = Column(Integer, default=0, nullable=False)
+    last_activity_at = Column(DateTime)
+    collection_version = Column(Integer, default=0, nullable=False)  # Bumped by every write; feeds ETags
+
+class ChangeSequence(Base):
+    __tablename__ = "change_sequence"
     
-    owner = relationship("User", back_populates="notes")
-    folder = relationship("Folder", back_populates="notes")
+    # Single row (id = 1) handing out change_seq numbers to the triggers below
+    id = Column(Integer, primary_key=True)
+    value = Column(Integer, default=0, nullable=False)
+    horizon = Column(Integer, default=0, nullable=False)  # Highest change_seq whose tombstones were compacted away
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+class Tombstone(Base):
+    __tablename__ = "tombstones"
+    
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)  # "note" or "folder"
+    object_id = Column(Integer, nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id"))
+    change_seq = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, nullable=False)
+    
+    __table_args__ = (
+        Index("ix_tombstones_owner_change_seq", "owner_id", "change_seq"),
+    )
+
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+    
+    # One POST /import upload; a failed upload is resumed by posting it again with ?job_id=
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    status = Column(String, nullable=False, default="running")  # "running", "failed" or "complete"
+    lines_done = Column(Integer, nullable=False, default=0)  # Input lines committed; a resumed upload skips them
+    folders_imported = Column(Integer, nullable=False, default=0)
+    notes_imported = Column(Integer, nullable=False, default=0)
+    error = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class ImportFolder(Base):
+    __tablename__ = "import_folders"
+    
+    # Folder id in the export -> the folder the import created for it, so notes
+    # committed by a resumed upload still land in the right folder
+    job_id = Column(Integer, ForeignKey("import_jobs.id"), primary_key=True)
+    source_id = Column(Integer, primary_key=True)
+    folder_id = Column(Integer, ForeignKey("folders.id"), nullable=False)
+
+class Job(Base):
+    __tablename__ = "jobs"
+    
+    # Background work on derived data, enqueued in the write's own transaction
+    # and deleted in the transaction that applies it (see jobs.py)
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id"))  # Whose data it derives from, for GET /jobs
+    payload = Column(String, nullable=False)  # JSON arguments for the handler
+    attempts = Column(Integer, nullable=False, default=0)  # Claims so far; a claim's attempt number is its lease
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)  # Ready, lease expiry or retry time
+    error = Column(String)  # Last failure
+    dead_at = Column(DateTime)  # Set once it has failed JOB_MAX_ATTEMPTS times; never claimed again
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Claiming: live jobs whose time has come, oldest first
+        Index("ix_jobs_ready", "run_after", "id", sqlite_where=dead_at.is_(None)),
+        Index("ix_jobs_owner_created", "owner_id", "created_at"),
+        # Ids are never reused, so a stale lease (id, attempts) cannot match a newer job
+        {"sqlite_autoincrement": True},
+    )
+
+# Full-text search over notes. notes_fts is an external-content FTS5 table:
+# it stores only the index and reads title/content/tags back through the
+# notes_fts_source view, which decompresses content with note_text(). The
+# triggers keep it in step with every insert, update and delete.
+NOTES_FTS_DDL = [
+    """CREATE VIEW IF NOT EXISTS notes_fts_source AS
+        SELECT id, title, note_text(content) AS content, tags FROM notes""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+        title, content, tags,
+        content='notes_fts_source', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS notes_fts_ai AFTER INSERT ON notes BEGIN
+        INSERT INTO notes_fts(rowid, title, content, tags) VALUES (new.id, new.title, note_text(new.content), new.tags);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS notes_fts_ad AFTER DELETE ON notes BEGIN
+        INSERT INTO notes_fts(notes_fts, rowid, title, content, tags) VALUES ('delete', old.id, old.title, note_text(old.content), old.tags);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS notes_fts_au AFTER UPDATE OF title, content, tags ON notes BEGIN
+        INSERT INTO notes_fts(notes_fts, rowid, title, content, tags) VALUES ('delete', old.id, old.title, note_text(old.content), old.tags);
+        INSERT INTO notes_fts(rowid, title, content, tags) VALUES (new.id, new.title, note_text(new.content), new.tags);
+    END""",
+]
+
+def create_search_index(bind):
+    """Create the FTS index and its triggers, backfilling it if it is new.
+
+    An index built before content was compressed reads the notes table directly;
+    it is dropped and rebuilt from notes_fts_source.
+    """
+    with bind.begin() as conn:
+        existing = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'notes_fts'")).scalar()
+        is_new = existing is None or "notes_fts_source" not in existing
+        if existing is not None and is_new:
+            for trigger in ("notes_fts_ai", "notes_fts_ad", "notes_fts_au"):
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+            conn.execute(text("DROP TABLE notes_fts"))
+        for statement in NOTES_FTS_DDL:
+            conn.execute(text(statement))
+    if is_new:
+        rebuild_search_index(bind)
+
+def rebuild_search_index(bind):
+    """Re-read every note into the FTS index"""
+    with bind.begin() as conn:
+        conn.execute(text("INSERT INTO notes_fts(notes_fts) VALUES ('rebuild')"))
+
+# Change tracking for delta sync. Every insert or update of a note or folder
+# stamps the row with the next change_seq, soft deletes included, and every
+# hard delete of a live row leaves a tombstone carrying one. Purging a
+# soft-deleted row leaves none: sync already reported it, and the purge moves
+# the horizon instead. SQLite runs one writer at a time, so sequence numbers
+# become visible in commit order and a client can resume from the last one it
+# saw. The update triggers skip their own stamping UPDATE (change_seq changed).
+def _change_tracking_ddl(table, kind):
+    next_seq = "UPDATE change_sequence SET value = value + 1 WHERE id = 1"
+    stamp = f"UPDATE {table} SET change_seq = (SELECT value FROM change_sequence WHERE id = 1) WHERE id = new.id"
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_change_ai AFTER INSERT ON {table} BEGIN
+            {next_seq};
+            {stamp};
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_change_au AFTER UPDATE ON {table} WHEN new.change_seq IS old.change_seq BEGIN
+            {next_seq};
+            {stamp};
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_change_ad AFTER DELETE ON {table} WHEN old.deleted_at IS NULL BEGIN
+            {next_seq};
+            INSERT INTO tombstones(kind, object_id, owner_id, change_seq, deleted_at)
+            VALUES ('{kind}', old.id, old.owner_id, (SELECT value FROM change_sequence WHERE id = 1), strftime('%Y-%m-%d %H:%M:%f', 'now'));
+        END""",
+    ]
+
+CHANGE_TRACKING_DDL = _change_tracking_ddl("notes", "note") + _change_tracking_ddl("folders", "folder")
+
+def create_change_tracking(bind):
+    """Create the change-tracking triggers and stamp rows written before they existed"""
+    with bind.begin() as conn:
+        conn.execute(text("INSERT OR IGNORE INTO change_sequence (id, value, horizon) VALUES (1, 0, 0)"))
+        # Delete triggers from before soft deletes would tombstone every purged row
+        for table in ("folders", "notes"):
+            existing = conn.execute(text(f"SELECT sql FROM sqlite_master WHERE name = '{table}_change_ad'")).scalar()
+            if existing is not None and "old.deleted_at" not in existing:
+                conn.execute(text(f"DROP TRIGGER {table}_change_ad"))
+        for statement in CHANGE_TRACKING_DDL:
+            conn.execute(text(statement))
+        # A no-op update fires the update trigger, which hands each row a sequence number
+        for table in ("folders", "notes"):
+            conn.execute(text(f"UPDATE {table} SET change_seq = change_seq WHERE change_seq IS NULL"))
+
+def add_missing_columns(bind):
+    """Add columns declared since a table was created (create_all never alters tables)"""
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=bind.dialect)}"
+                default = column.default.arg if column.default is not None and column.default.is_scalar else None
+                if default is not None:
+                    ddl += f" NOT NULL DEFAULT {int(default) if isinstance(default, bool) else repr(default)}"
+                conn.execute(text(ddl))
+
+# Indexes replaced by the partial ones above
+OBSOLETE_INDEXES = ["ix_folders_owner_created", "ix_notes_owner_folder_updated", "ix_notes_owner_updated"]
+
+def create_schema(bind):
+    """Create missing tables, columns and indexes, the search index and change tracking"""
+    with bind.connect() as conn:
+        # Lets maintenance return freed pages to the filesystem a few at a time
+        # (PRAGMA incremental_vacuum). Only takes effect on a new database, so it is
+        # set on the connection that creates the tables; existing databases switch
+        # with one full VACUUM (compact_tombstones.py --vacuum).
+        conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+        Base.metadata.create_all(bind=conn)
+        conn.commit()
+    add_missing_columns(bind)
+    
+    # create_all skips tables that already exist, so add indexes declared since
+    with bind.begin() as conn:
+        for name in OBSOLETE_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+    
+    create_search_index(bind)
+    create_change_tracking(bind)
+
+# The schema is checked once per process, on first use. Doing it at import time
+# made every cold start pay for the DDL before it could answer a request.
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+def ensure_schema():
+    global _schema_ready
+    if not _schema_ready:
+        with _schema_lock:
+            if not _schema_ready:
+                create_schema(get_database().engine)
+                _schema_ready = True
+
+# Scripts import these directly and expect the tables to exist, as they did
+# when the schema was created on import
+_LAZY_ATTRIBUTES = {"engine", "SessionLocal", "async_engine", "read_engine", "AsyncSessionLocal", "ReadSessionLocal"}
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        ensure_schema()
+        return getattr(get_database(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+async def ready_database() -> Database:
+    """get_database for the event loop; runs the schema check off the loop the first time"""
+    if not _schema_ready:
+        await asyncio.to_thread(ensure_schema)
+    return get_database()
+
+# Each family database gets the same check, once per process, before its first session
+_family_schema_ready = set()
+
+def ensure_family_schema(family_id: int):
+    if family_id not in _family_schema_ready:
+        with _schema_lock:
+            if family_id not in _family_schema_ready:
+                os.makedirs(DB_SHARD_DIR, exist_ok=True)
+                family_engine = create_sync_engine(shard_url(family_id))
+                create_schema(family_engine)
+                family_engine.dispose()
+                _family_schema_ready.add(family_id)
+
+async def enter_family(family_id):
+    """Route this task's sessions to `family_id`'s database; a no-op without DB_SHARD_DIR"""
+    if not DB_SHARD_DIR:
+        return
+    if family_id is not None and family_id not in _family_schema_ready:
+        await asyncio.to_thread(ensure_family_schema, family_id)
+    current_family.set(family_id)
+
+async def family_ids():
+    """Every family in the directory, for maintenance that runs per family database"""
+    async with read_session() as db:
+        return (await db.scalars(select(User.family_id).where(User.family_id != None).distinct())).all()
+
+async def dispose_engines():
+    if _database is None:
+        return
+    await _dispose(_database.async_engine, _database.read_engine)
+    if DB_SHARD_DIR:
+        await _database.shard_engines.close()
+
+# Sessions for code outside a request's dependencies
+@asynccontextmanager
+async def write_session():
+    async with (await ready_database()).AsyncSessionLocal() as db:
+        yield db
+
+@asynccontextmanager
+async def read_session():
+    async with (await ready_database()).ReadSessionLocal() as db:
+        yield db
+
+# Database dependencies: get_db for endpoints that write, get_read_db for read-only ones
+async def get_db():
+    async with write_session() as db:
+        yield db
 
-# Database dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_read_db():
+    async with read_session() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""
+Range edits to a note's content, for editors that autosave.
+
+Instead of resending the whole body, a client sends the edits it made since
+the content_version it last saw. Each edit replaces [start, end) of that
+base version with `text`. Offsets count UTF-16 code units, the way
+JavaScript indexes strings; edits must be sorted and must not overlap.
+The write only lands if the note is still at the base version, so two tabs
+autosaving the same note cannot silently overwrite each other.
+"""
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+from database import Note
+
+MAX_EDITS = 1000
+
+Edit = Tuple[int, int, str]
+
+def _splice(sequence, edits, empty):
+    pieces, position = [], 0
+    for start, end, text in edits:
+        if not position <= start <= end <= len(sequence):
+            raise ValueError("Edits must be sorted, must not overlap and must lie within the content")
+        pieces += [sequence[position:start], text]
+        position = end
+    pieces.append(sequence[position:])
+    return empty.join(pieces)
+
+def apply_edits(content: str, edits: List[Edit]) -> str:
+    """Apply `edits` (offsets in UTF-16 code units) to `content`"""
+    if content.isascii():
+        # One code unit per character, so Python indexes agree with JavaScript's
+        return _splice(content, edits, "")
+    try:
+        units = content.encode("utf-16-le")
+        spliced = _splice(units, [(start * 2, end * 2, text.encode("utf-16-le")) for start, end, text in edits], b"")
+        return spliced.decode("utf-16-le")
+    except UnicodeError:
+        raise ValueError("Edits must not split a surrogate pair")
+
+async def patch_content(db: AsyncSession, note: Note, base_version: int, edits: List[Edit]) -> Optional[int]:
+    """Apply `edits` to `note` if its content is still at `base_version`.
+
+    Returns the new content_version, or None if another write got there first.
+    Raises ValueError for edits that do not fit the base content.
+    """
+    content = apply_edits(note.content or "", edits)
+    updated_at = datetime.utcnow()
+    # Conditional on the version, not just on what was read: a concurrent save
+    # that committed after our read makes this match nothing
+    result = await db.execute(
+        update(Note)
+        .where(Note.id == note.id, Note.content_version == base_version, Note.deleted_at.is_(None))
+        .values(content=content, content_version=base_version + 1, updated_at=updated_at),
+        execution_options={"synchronize_session": False},
+    )
+    if result.rowcount != 1:
+        return None
+    for field, value in (("content", content), ("content_version", base_version + 1), ("updated_at", updated_at)):
+        set_committed_value(note, field, value)
+    return base_version + 1
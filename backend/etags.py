@@ -0,0 +1,40 @@
+"""
+Strong ETags for the collection endpoints.
+
+Every note or folder write bumps its owner's user_stats.collection_version
+(see stats.apply_stats_delta), as does the background job that indexes
+their tags for ?tag= listings (tags.sync_note_tags), so the versions of the owners a request can
+see, plus the query string, identify the response body. A matching
+If-None-Match is answered with 304 after a single primary-key lookup,
+before any note or folder rows are read.
+"""
+import hashlib
+from typing import Dict, List
+
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import UserStats
+
+def make_etag(*parts) -> str:
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+async def collection_versions(db: AsyncSession, owner_ids: List[int]) -> Dict[int, int]:
+    return dict((await db.execute(
+        select(UserStats.user_id, UserStats.collection_version).where(UserStats.user_id.in_(owner_ids))
+    )).all())
+
+def collection_etag(request: Request, owner_ids: List[int], versions: Dict[int, int]) -> str:
+    """ETag of a collection response, from Repository.collection_versions"""
+    # Parent views combine the versions of every child in scope
+    return make_etag(request.url.path, str(request.url.query), [(owner_id, versions.get(owner_id, 0)) for owner_id in sorted(owner_ids)])
+
+def conditional_response(request: Request, response: Response, etag: str):
+    """Raise 304 if the client already has `etag`, otherwise attach it to `response`"""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]):
+        raise HTTPException(status_code=304, headers=headers)
+    response.headers.update(headers)
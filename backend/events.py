@@ -0,0 +1,168 @@
+"""
+Live note and folder events for GET /events.
+
+Write endpoints publish an Event after their transaction commits; the broker
+fans it out to every subscriber watching the event's owner. Each subscriber
+has a bounded queue. A subscriber that falls EVENT_QUEUE_SIZE events behind
+is evicted instead of slowing publishers down or growing without bound; its
+stream ends with an `evicted` event and the client catches up with GET /sync.
+
+InProcessBroker only reaches subscribers in the same process. A multi-worker
+deployment sets EVENT_BROKER to "package.module:ClassName" for a broker that
+relays publishes through a shared transport (Redis pub/sub, Postgres
+LISTEN/NOTIFY) and hands what it receives to InProcessBroker.deliver.
+"""
+import asyncio
+import importlib
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set
+
+import orjson
+
+from schemas import FolderOut, NoteOut
+
+EVENT_BROKER = os.getenv("EVENT_BROKER", "memory")
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "256"))
+EVENT_HEARTBEAT = float(os.getenv("EVENT_HEARTBEAT", "15"))  # Seconds between keep-alive comments
+
+@dataclass(frozen=True)
+class Event:
+    type: str  # e.g. "note.updated", "folder.deleted", "notes.batch"
+    owner_id: int
+    data: dict = field(default_factory=dict)
+
+class Subscription:
+    """One subscriber's queue of events for a fixed set of owners"""
+
+    def __init__(self, broker: "InProcessBroker", owner_ids: Iterable[int], queue_size: int):
+        self.owner_ids = frozenset(owner_ids)
+        self.evicted = False
+        self._broker = broker
+        self._queue = asyncio.Queue(maxsize=queue_size)
+
+    def offer(self, event: Event) -> bool:
+        """Queue `event` without waiting; False if the queue is full"""
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def evict(self):
+        # Drop the backlog and wake the consumer so it can end its stream
+        self.evicted = True
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Event]:
+        """Next event, or None on timeout or once evicted"""
+        if self.evicted and self._queue.empty():
+            return None
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self._broker.unsubscribe(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+class Broker(ABC):
+    """Interface between write endpoints and event streams"""
+
+    @abstractmethod
+    async def publish(self, event: Event):
+        raise NotImplementedError
+
+    @abstractmethod
+    def subscribe(self, owner_ids: Iterable[int]) -> Subscription:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+class InProcessBroker(Broker):
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.evictions = 0
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+
+    async def publish(self, event: Event):
+        self.deliver(event)
+
+    def deliver(self, event: Event):
+        """Fan `event` out to local subscribers. Only touched from the event loop, so no lock."""
+        for subscription in list(self._subscribers.get(event.owner_id, ())):
+            if not subscription.offer(event):
+                self.unsubscribe(subscription)
+                subscription.evict()
+                self.evictions += 1
+
+    def subscribe(self, owner_ids: Iterable[int]) -> Subscription:
+        subscription = Subscription(self, owner_ids, self.queue_size)
+        for owner_id in subscription.owner_ids:
+            self._subscribers.setdefault(owner_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for owner_id in subscription.owner_ids:
+            subscribers = self._subscribers.get(owner_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[owner_id]
+
+    @property
+    def subscriber_count(self) -> int:
+        return len({subscription for subscribers in self._subscribers.values() for subscription in subscribers})
+
+def note_event(action: str, note) -> Event:
+    """note.created / note.updated carry the note; note.deleted only its id"""
+    data = {"id": note.id} if action == "deleted" else {"note": NoteOut.model_validate(note).model_dump(mode="json")}
+    return Event(f"note.{action}", note.owner_id, data)
+
+def folder_event(action: str, folder) -> Event:
+    data = {"id": folder.id} if action == "deleted" else {"folder": FolderOut.model_validate(folder).model_dump(mode="json")}
+    return Event(f"folder.{action}", folder.owner_id, data)
+
+def batch_event(owner_id: int, results: List[dict], deleted: bool = False) -> Optional[Event]:
+    """One event per batch request, listing the ids that succeeded; clients fetch them with GET /sync"""
+    ids = [result["id"] for result in results if result["status"] == 200]
+    if not ids:
+        return None
+    return Event("notes.batch", owner_id, {"deleted" if deleted else "updated": ids})
+
+def format_sse(event_type: str, data: dict) -> bytes:
+    return b"event: " + event_type.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+async def event_stream(broker: Broker, owner_ids: Iterable[int], heartbeat: float = EVENT_HEARTBEAT):
+    """Server-sent event frames for `owner_ids` until the subscriber is evicted or goes away"""
+    # Subscribing here rather than in the endpoint ties the subscription to the open response
+    async with broker.subscribe(owner_ids) as subscription:
+        yield format_sse("ready", {"owner_ids": sorted(subscription.owner_ids)})
+        while True:
+            event = await subscription.get(heartbeat)
+            if subscription.evicted:
+                yield format_sse("evicted", {"reason": "Too far behind, resync with GET /sync"})
+                return
+            if event is None:
+                # Keeps proxies from closing an idle stream and surfaces dead clients
+                yield b": keep-alive\n\n"
+                continue
+            yield format_sse(event.type, {"owner_id": event.owner_id, **event.data})
+
+def create_broker(name: str = EVENT_BROKER) -> Broker:
+    if name == "memory":
+        return InProcessBroker()
+    module_name, _, class_name = name.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+broker = create_broker()
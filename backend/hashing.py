@@ -0,0 +1,77 @@
+"""
+Password hashing off the request path.
+
+bcrypt is deliberately CPU-bound, so hashes and verifications run on a small
+dedicated process pool instead of the threadpool that serves note reads. The
+pool admits at most HASH_WORKERS + HASH_QUEUE_SIZE jobs at once; anything
+beyond that fails fast with HashingBusy so the caller can shed load.
+"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))  # 0 hashes on the threadpool
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", "32"))
+HASH_RETRY_AFTER = int(os.getenv("HASH_RETRY_AFTER", "1"))  # Seconds, sent as Retry-After when busy
+
+@lru_cache(maxsize=None)
+def get_context():
+    """The CryptContext, built on first use so importing the app skips passlib"""
+    from passlib.context import CryptContext
+    
+    # Hashes made with a different cost factor are reported as needing an update,
+    # which verify_and_update turns into a transparent rehash on the next login
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool is saturated and the job was not admitted"""
+
+def hash_password(password: str) -> str:
+    return get_context().hash(password)
+
+def verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Return (valid, new_hash); new_hash is set when the stored hash should be replaced"""
+    return get_context().verify_and_update(password, hashed_password)
+
+class PasswordHasher:
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.capacity = max(workers, 1) + queue_size
+        self.in_flight = 0
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def _run(self, fn, *args):
+        # Only touched from the event loop, so a plain counter is enough
+        if self.in_flight >= self.capacity:
+            raise HashingBusy()
+        self.in_flight += 1
+        try:
+            if self.workers <= 0:
+                return await run_in_threadpool(fn, *args)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.in_flight -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return await self._run(verify_and_update, password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+password_hasher = PasswordHasher(HASH_WORKERS, HASH_QUEUE_SIZE)
@@ -0,0 +1,286 @@
+"""
+Durable background jobs for derived data, queued in the jobs table.
+
+A write enqueues a job in its own transaction, so the job exists if and only
+if the write committed. JobWorkers then run it shortly after, on the same
+database:
+
+- a worker claims up to JOB_CLAIM_SIZE ready jobs in one UPDATE, which bumps
+  each job's attempts and pushes its run_after out by JOB_LEASE_SECONDS
+- it runs each job's handler and deletes the job in the same transaction, but
+  only if the job still carries the attempt number it was claimed with. A
+  worker whose lease ran out and was reclaimed rolls back instead, so a
+  handler's effects are committed once however often the job is claimed. A
+  batch shares one transaction, and jobs of a kind in MERGE share one handler
+  call; if anything in the batch fails, each job is rerun on its own
+- a failed job is retried after JOB_BACKOFF_SECONDS, doubling with every
+  attempt, and dead-lettered (dead_at) after JOB_MAX_ATTEMPTS
+
+Nothing is held in memory between those steps: after a crash or restart, a
+claimed job becomes ready again once its lease expires.
+
+Commits that enqueue wake the workers for their database. A worker waits
+JOB_DELAY_MS before claiming, unless the queue is backed up, so the jobs of
+a burst of writes are merged and committed together rather than each taking
+the database's write lock between one write and the next. Every
+JOB_POLL_SECONDS the workers also look for jobs in every database, which
+picks up retries, expired leases and jobs enqueued by other processes.
+JOB_WORKERS=0 turns the workers off; run_jobs.py then drains the queues,
+e.g. from cron on serverless deployments.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import orjson
+from sqlalchemy import and_, case, delete, event, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from database import DB_SHARD_DIR, Job, current_family, enter_family, family_ids, read_session, write_session
+from metrics import metrics
+from tags import sync_note_tags
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_CLAIM_SIZE = int(os.getenv("JOB_CLAIM_SIZE", "50"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_BACKOFF_SECONDS = float(os.getenv("JOB_BACKOFF_SECONDS", "1"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+JOB_DELAY_MS = float(os.getenv("JOB_DELAY_MS", "200"))
+
+# Notes per note_tags job, well under SQLite's limit on bound parameters
+TAG_JOB_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+# kind -> async handler(db, **payload); it must not commit
+HANDLERS = {
+    "note_tags": sync_note_tags,
+}
+
+def _merge_note_tags(payloads):
+    note_ids = sorted({note_id for payload in payloads for note_id in payload["note_ids"]})
+    return [{"note_ids": note_ids[start:start + TAG_JOB_SIZE]} for start in range(0, len(note_ids), TAG_JOB_SIZE)]
+
+# Kinds whose jobs in one batch can share handler calls: kind -> merge(payloads) -> fewer payloads
+MERGE = {
+    "note_tags": _merge_note_tags,
+}
+
+def enqueue(db: AsyncSession, kind: str, owner_id: Optional[int], **payload):
+    """Add a job to the session; it is queued when the session commits"""
+    db.add(Job(kind=kind, owner_id=owner_id, payload=orjson.dumps(payload).decode()))
+    db.info["jobs_enqueued"] = True
+
+def enqueue_tag_sync(db: AsyncSession, owner_id: int, note_ids: List[int]):
+    """Queue a note_tags job for `note_ids`, whose tags changed or which were deleted"""
+    for start in range(0, len(note_ids), TAG_JOB_SIZE):
+        enqueue(db, "note_tags", owner_id, note_ids=note_ids[start:start + TAG_JOB_SIZE])
+
+async def claim(db: AsyncSession, limit: int = JOB_CLAIM_SIZE, lease: float = JOB_LEASE_SECONDS):
+    """Lease up to `limit` ready jobs, oldest first"""
+    now = datetime.utcnow()
+    ready = (
+        select(Job.id)
+        .where(Job.dead_at.is_(None), Job.run_after <= now)
+        .order_by(Job.run_after, Job.id)
+        .limit(limit)
+    )
+    statement = (
+        update(Job)
+        .where(Job.id.in_(ready))
+        .values(attempts=Job.attempts + 1, run_after=now + timedelta(seconds=lease))
+        .returning(Job.id, Job.kind, Job.payload, Job.attempts, Job.created_at)
+    )
+    jobs = (await db.execute(statement, execution_options={"synchronize_session": False})).all()
+    return sorted(jobs, key=lambda job: job.id)
+
+def _held(job):
+    # The claim that leased the job is the only one allowed to finish it
+    return and_(Job.id == job.id, Job.attempts == job.attempts)
+
+async def run_job(job) -> str:
+    """Apply a claimed job; returns "done", "retry", "dead" or "lost" (the lease ran out)"""
+    try:
+        async with write_session() as db:
+            await HANDLERS[job.kind](db, **orjson.loads(job.payload))
+            finished = await db.execute(delete(Job).where(_held(job)))
+            if finished.rowcount:
+                await db.commit()
+                outcome = "done"
+            else:
+                await db.rollback()
+                outcome = "lost"
+    except Exception as error:
+        logger.warning("Job %s (%s) failed on attempt %s: %r", job.id, job.kind, job.attempts, error)
+        outcome = await _fail(job, error)
+    metrics.observe_job(job.kind, outcome, (datetime.utcnow() - job.created_at).total_seconds())
+    return outcome
+
+async def run_jobs(jobs) -> List[str]:
+    """Apply claimed jobs in one transaction, falling back to run_job for each
+    if any of them fails or has lost its lease.
+
+    Jobs of a kind in MERGE share handler calls. A commit and a handful of
+    statements per batch rather than per job is most of the cost of small jobs.
+    """
+    by_kind = defaultdict(list)
+    for job in jobs:
+        by_kind[job.kind].append(orjson.loads(job.payload))
+    try:
+        async with write_session() as db:
+            for kind, payloads in by_kind.items():
+                if kind in MERGE:
+                    payloads = MERGE[kind](payloads)
+                for payload in payloads:
+                    await HANDLERS[kind](db, **payload)
+            finished = await db.execute(delete(Job).where(or_(*(_held(job) for job in jobs))))
+            if finished.rowcount != len(jobs):
+                raise LookupError("a lease expired before the batch finished")
+            await db.commit()
+    except Exception:
+        return [await run_job(job) for job in jobs]
+    now = datetime.utcnow()
+    for job in jobs:
+        metrics.observe_job(job.kind, "done", (now - job.created_at).total_seconds())
+    return ["done"] * len(jobs)
+
+async def _fail(job, error: Exception) -> str:
+    now = datetime.utcnow()
+    values = {"error": f"{type(error).__name__}: {error}"[:1000]}
+    if job.attempts >= JOB_MAX_ATTEMPTS:
+        outcome, values["dead_at"] = "dead", now
+    else:
+        outcome, values["run_after"] = "retry", now + timedelta(seconds=JOB_BACKOFF_SECONDS * 2 ** (job.attempts - 1))
+    async with write_session() as db:
+        failed = await db.execute(update(Job).where(_held(job)).values(**values))
+        await db.commit()
+    return outcome if failed.rowcount else "lost"
+
+async def has_ready_jobs(db: AsyncSession) -> bool:
+    now = datetime.utcnow()
+    return await db.scalar(select(Job.id).where(Job.dead_at.is_(None), Job.run_after <= now).limit(1)) is not None
+
+async def queue_stats(db: AsyncSession, owner_ids: List[int]) -> dict:
+    """Depth and lag of the jobs deriving from `owner_ids`' data"""
+    live = Job.dead_at.is_(None)
+    pending, retrying, dead, oldest = (await db.execute(
+        select(
+            func.count(case((live, 1))),
+            func.count(case((live & Job.error.isnot(None), 1))),
+            func.count(Job.dead_at),
+            func.min(case((live, Job.created_at))),
+        ).where(Job.owner_id.in_(owner_ids))
+    )).one()
+    lag = (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0
+    return {"pending": pending, "retrying": retrying, "dead": dead, "lag_seconds": round(max(lag, 0.0), 3)}
+
+class JobWorkers:
+    """A pool of asyncio tasks running jobs between start() and stop()"""
+
+    def __init__(self, workers: int = JOB_WORKERS, claim_size: int = JOB_CLAIM_SIZE, poll: float = JOB_POLL_SECONDS,
+                 delay_ms: float = JOB_DELAY_MS):
+        self.workers = workers
+        self.claim_size = claim_size
+        self.poll = poll
+        self.delay = delay_ms / 1000
+        self._tasks = []
+        self._ready = deque()  # Databases that may have ready jobs: family ids, or None for the single one
+        self._backlog = set()  # Databases whose last batch was full, which skip the delay
+        self._wakeup = None
+        self._loop = None
+        self._next_sweep = 0.0
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        # As with the maintenance scheduler, tasks left on an earlier event loop never run again
+        if self._tasks and self._tasks[0].get_loop() is loop:
+            return
+        self._loop, self._wakeup = loop, asyncio.Event()
+        self._next_sweep = 0.0  # Pick up whatever an earlier process left behind
+        self._tasks = [loop.create_task(self._work(self._wakeup)) for _ in range(self.workers)]
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            if task.get_loop() is asyncio.get_running_loop():
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+    def notify(self, database=None):
+        """Wake a worker for `database`; called when a commit there enqueued jobs"""
+        if database not in self._ready:
+            self._ready.append(database)
+        if self._wakeup is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._wakeup.set()
+        elif not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _work(self, wakeup: asyncio.Event):
+        while True:
+            if time.monotonic() >= self._next_sweep:
+                self._next_sweep = time.monotonic() + self.poll
+                try:
+                    await self._sweep()
+                except Exception:
+                    logger.exception("Looking for background jobs failed")
+            if not self._ready:
+                wakeup.clear()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), max(self._next_sweep - time.monotonic(), 0))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            database = self._ready.popleft()
+            if database not in self._backlog:
+                # Let the writes still coming in queue their jobs for the same batch
+                await asyncio.sleep(self.delay)
+            try:
+                await self.run_batch(database)
+            except Exception:
+                logger.exception("Background job batch failed")
+
+    async def _sweep(self):
+        for database in await family_ids() if DB_SHARD_DIR else [None]:
+            await enter_family(database)
+            async with read_session() as db:
+                if await has_ready_jobs(db):
+                    self.notify(database)
+
+    async def run_batch(self, database=None) -> int:
+        """Claim and run one batch of `database`'s jobs; returns how many were claimed"""
+        await enter_family(database)
+        async with write_session() as db:
+            jobs = await claim(db, self.claim_size)
+            await db.commit()
+        if len(jobs) == self.claim_size:
+            # There may be more; let another worker carry on meanwhile
+            self._backlog.add(database)
+            self.notify(database)
+        else:
+            self._backlog.discard(database)
+        if jobs:
+            await run_jobs(jobs)
+        return len(jobs)
+
+workers = JobWorkers()
+
+@event.listens_for(Session, "after_commit")
+def _wake_workers(session):
+    if session.info.pop("jobs_enqueued", False):
+        workers.notify(current_family.get() if DB_SHARD_DIR else None)
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Load test for the API against a freshly seeded throwaway database.
+
+Generates --users users with create_demo_data.generate_data (see its flags
+there), then runs --concurrency virtual users, each signed in as a user
+picked at random, against the app in-process (httpx's ASGI transport, no
+sockets) for --requests requests in total. Children list, create, update,
+complete and delete their notes; parents list their children's notes; both
+log in again now and then.
+
+Prints throughput and p50/p95/p99 latency per operation. --output writes the
+results as JSON. --baseline compares against an earlier --output and exits
+with status 1 if any operation's p95 grew, or its throughput fell, by more
+than --threshold.
+
+    python loadtest.py --output baseline.json
+    python loadtest.py --baseline baseline.json --threshold 0.25
+
+Set DB_PROFILE, BCRYPT_ROUNDS, HASH_WORKERS etc. as for the server.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+PASSWORD = "loadtest"
+TAGS = ["school", "homework", "reading", "math", "science", "art", "music", "sports", "friends", "ideas"]
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore magna aliqua".split()
+
+# (operation, weight) per role; operations are the functions named op_<operation> below
+CHILD_MIX = [("list_notes", 40), ("create_note", 15), ("update_note", 15), ("toggle_todo", 10), ("delete_note", 10), ("list_folders", 8), ("login", 2)]
+PARENT_MIX = [("list_child_notes", 60), ("list_notes", 30), ("list_folders", 8), ("login", 2)]
+
+ROUTES = {
+    "login": "POST /login",
+    "list_notes": "GET /notes",
+    "list_child_notes": "GET /notes?child_id=",
+    "list_folders": "GET /folders",
+    "create_note": "POST /notes",
+    "update_note": "PUT /notes/{id}",
+    "toggle_todo": "PUT /notes/{id} (is_completed)",
+    "delete_note": "DELETE /notes/{id}",
+}
+
+class Account:
+    def __init__(self, user_id, username, role, parent_id=None, child_ids=(), folder_ids=(), note_ids=()):
+        self.id = user_id
+        self.username = username
+        self.role = role
+        self.parent_id = parent_id
+        self.child_ids = list(child_ids)
+        self.folder_ids = list(folder_ids)
+        self.note_ids = list(note_ids)  # Shared by every virtual user on this account
+        self.headers = {}
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+
+    async def request(self, client, operation, method, url, **kwargs):
+        began = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies[operation].append(time.perf_counter() - began)
+        if response.status_code >= 400:
+            self.errors[operation] += 1
+        return response
+
+def note_body(rng):
+    return {
+        "title": " ".join(rng.choices(WORDS, k=rng.randint(2, 6))).capitalize(),
+        # Mostly short notes with a long tail, like real ones
+        "content": " ".join(rng.choices(WORDS, k=min(int(rng.expovariate(1 / 80)) + 5, 2000))),
+        "tags": ", ".join(rng.sample(TAGS, rng.randint(0, 3))),
+        "is_todo": rng.random() < 0.3,
+    }
+
+def seed(args):
+    """Generate the dataset and sign in one account per virtual user"""
+    from sqlalchemy import select
+    from auth import Principal, create_access_token
+    from create_demo_data import generate_data
+    from database import engine, User, Folder, Note
+
+    counts = generate_data(
+        users=args.users,
+        children_per_parent=args.children_per_parent,
+        folders_per_child=args.folders_per_child,
+        notes_per_folder=args.notes_per_folder,
+        seed=args.seed,
+        password=PASSWORD,
+    )
+    with engine.connect() as conn:
+        users = conn.execute(select(User.id, User.username, User.role, User.parent_id, User.family_id).order_by(User.id)).all()
+        # Distinct users while there are enough; extra virtual users share accounts, note ids included
+        picked = random.Random(args.seed).sample(users, min(args.concurrency, len(users)))
+        accounts = []
+        for row in picked:
+            account = Account(row.id, row.username, row.role, row.parent_id)
+            if account.role == "parent":
+                account.child_ids = conn.scalars(select(User.id).where(User.parent_id == account.id).order_by(User.id)).all()
+            account.folder_ids = conn.scalars(select(Folder.id).where(Folder.owner_id == account.id).order_by(Folder.id)).all()
+            account.note_ids = conn.scalars(select(Note.id).where(Note.owner_id == account.id).order_by(Note.id)).all()
+            principal = Principal(account.id, account.username, account.role, account.parent_id, tuple(account.child_ids), 1, family_id=row.family_id)
+            account.headers = {"Authorization": f"Bearer {create_access_token(principal)}"}
+            accounts.append(account)
+    return counts, [accounts[n % len(accounts)] for n in range(args.concurrency)]
+
+async def op_login(client, recorder, account, rng):
+    response = await recorder.request(client, "login", "POST", "/login", json={"username": account.username, "password": PASSWORD})
+    if response.status_code == 200:
+        account.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+async def op_list_notes(client, recorder, account, rng):
+    params = {"folder_id": rng.choice(account.folder_ids)} if account.folder_ids and rng.random() < 0.3 else {}
+    await recorder.request(client, "list_notes", "GET", "/notes", params=params, headers=account.headers)
+
+async def op_list_child_notes(client, recorder, account, rng):
+    await recorder.request(client, "list_child_notes", "GET", "/notes", params={"child_id": rng.choice(account.child_ids)}, headers=account.headers)
+
+async def op_list_folders(client, recorder, account, rng):
+    await recorder.request(client, "list_folders", "GET", "/folders", headers=account.headers)
+
+async def op_create_note(client, recorder, account, rng):
+    response = await recorder.request(client, "create_note", "POST", "/notes", json=note_body(rng), headers=account.headers)
+    if response.status_code == 200:
+        account.note_ids.append(response.json()["id"])
+
+async def op_update_note(client, recorder, account, rng):
+    if not account.note_ids:
+        return await op_create_note(client, recorder, account, rng)
+    body = note_body(rng)
+    await recorder.request(client, "update_note", "PUT", f"/notes/{rng.choice(account.note_ids)}", json={"title": body["title"], "content": body["content"]}, headers=account.headers)
+
+async def op_toggle_todo(client, recorder, account, rng):
+    if not account.note_ids:
+        return await op_create_note(client, recorder, account, rng)
+    await recorder.request(client, "toggle_todo", "PUT", f"/notes/{rng.choice(account.note_ids)}", json={"is_todo": True, "is_completed": rng.random() < 0.5}, headers=account.headers)
+
+async def op_delete_note(client, recorder, account, rng):
+    if not account.note_ids:
+        return await op_create_note(client, recorder, account, rng)
+    # Popped before the request so no other virtual user picks the same note
+    note_id = account.note_ids.pop(rng.randrange(len(account.note_ids)))
+    await recorder.request(client, "delete_note", "DELETE", f"/notes/{note_id}", headers=account.headers)
+
+async def virtual_user(client, recorder, account, requests, rng):
+    mix = CHILD_MIX if account.role == "child" else PARENT_MIX
+    operations, weights = zip(*mix)
+    for operation in rng.choices(operations, weights, k=requests):
+        await globals()[f"op_{operation}"](client, recorder, account, rng)
+
+async def drive(client, recorder, accounts, args, requests, seed):
+    per_user, extra = divmod(requests, args.concurrency)
+    await asyncio.gather(*(
+        virtual_user(client, recorder, account, per_user + (n < extra), random.Random(seed * 1000 + n))
+        for n, account in enumerate(accounts)
+    ))
+
+def percentile(sorted_values, q):
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+def summarize(recorder, elapsed):
+    operations = {}
+    for operation, latencies in sorted(recorder.latencies.items()):
+        values = sorted(latencies)
+        operations[operation] = {
+            "route": ROUTES[operation],
+            "requests": len(values),
+            "errors": recorder.errors[operation],
+            "throughput": len(values) / elapsed,
+            **{f"p{int(q * 100)}_ms": percentile(values, q) * 1000 for q in (0.5, 0.95, 0.99)},
+            "max_ms": values[-1] * 1000,
+        }
+    total = sum(len(latencies) for latencies in recorder.latencies.values())
+    return {"elapsed_s": elapsed, "requests": total, "errors": sum(recorder.errors.values()), "throughput": total / elapsed, "operations": operations}
+
+def compare(results, baseline, threshold):
+    """Regressions beyond `threshold` (a fraction) against a previous run"""
+    failures = []
+    for operation, before in baseline["operations"].items():
+        after = results["operations"].get(operation)
+        if after is None:
+            continue
+        if after["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            failures.append(f"{operation}: p95 {after['p95_ms']:.1f} ms, baseline {before['p95_ms']:.1f} ms")
+        if after["throughput"] < before["throughput"] * (1 - threshold):
+            failures.append(f"{operation}: {after['throughput']:.1f} req/s, baseline {before['throughput']:.1f} req/s")
+    return failures
+
+async def run(args):
+    import httpx
+    from main import app, shutdown
+
+    began = time.perf_counter()
+    counts, accounts = seed(args)
+    print(f"Generated {counts['users']:,} users and {counts['notes']:,} notes in {time.perf_counter() - began:.1f}s")
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app, raise_app_exceptions=False), base_url="http://loadtest", timeout=120) as client:
+
+            if args.warmup:
+                await drive(client, Recorder(), accounts, args, args.warmup, args.seed + 1)
+            recorder = Recorder()
+            began = time.perf_counter()
+            await drive(client, recorder, accounts, args, args.requests, args.seed)
+            return summarize(recorder, time.perf_counter() - began)
+    finally:
+        await shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--children-per-parent", type=int, default=2)
+    parser.add_argument("--folders-per-child", type=int, default=4)
+    parser.add_argument("--notes-per-folder", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8, help="virtual users")
+    parser.add_argument("--requests", type=int, default=2000, help="measured requests, across all virtual users")
+    parser.add_argument("--warmup", type=int, default=200, help="requests run before measuring")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p95 growth / throughput drop, as a fraction")
+    args = parser.parse_args()
+
+    output, baseline = [os.path.abspath(path) if path else None for path in (args.output, args.baseline)]
+    # database.py reads DATABASE_URL when it is first imported, so point it at a scratch
+    # file before seed() imports anything; the engines are only created on first use
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'loadtest.db')}"
+    # Virtual users share one client address; RATE_LIMIT_ENABLED=true puts the limiter in the test
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+    results = asyncio.run(run(args))
+    results["config"] = {
+        **{name: value for name, value in vars(args).items() if name not in ("output", "baseline", "threshold")},
+        "db_profile": os.getenv("DB_PROFILE", "default"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+    }
+
+    print(f"{'operation':>17} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for operation, stats in results["operations"].items():
+        print(f"{operation:>17} {stats['requests']:>9} {stats['errors']:>7} {stats['throughput']:>8.1f} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['max_ms']:>8.1f}")
+    print(f"{'total':>17} {results['requests']:>9} {results['errors']:>7} {results['throughput']:>8.1f}")
+
+    if output:
+        with open(output, "w") as file:
+            json.dump(results, file, indent=2)
+    if baseline:
+        with open(baseline) as file:
+            previous = json.load(file)
+        if previous.get("config") != results["config"]:
+            print("Warning: the baseline was recorded with a different configuration")
+        failures = compare(results, previous, args.threshold)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} of the baseline")
+
+if __name__ == "__main__":
+    main()
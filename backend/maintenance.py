@@ -0,0 +1,208 @@
+"""
+Database upkeep in the background, in small steps while the API is quiet.
+
+Deleted notes and folders stay behind as soft-deleted rows, and rows removed
+outright leave tombstones, until sync no longer needs them. A
+MaintenanceScheduler pass:
+
+- purges soft-deleted notes and folders, then tombstones, older than
+  TOMBSTONE_RETENTION_DAYS, PURGE_BATCH_SIZE rows per transaction
+- hands up to VACUUM_PAGES free pages per step back to the filesystem with
+  PRAGMA incremental_vacuum (databases created with auto_vacuum=INCREMENTAL)
+- refreshes the query planner's statistics every ANALYZE_INTERVAL_SECONDS
+  with an ANALYZE bounded by ANALYZE_LIMIT rows per index
+
+A round starts MAINTENANCE_INTERVAL_SECONDS after the previous one finished,
+once no request has been in flight for MAINTENANCE_QUIET_MS. A pass stops
+when it has used MAINTENANCE_TIME_BUDGET_MS or as soon as a request arrives,
+and the next quiet moment starts another pass where it stopped. Every step is
+its own short write transaction, so a request that arrives mid-pass waits
+for one batch at most.
+With DB_SHARD_DIR set, passes work through the family databases in turn.
+
+ActivityMiddleware tells the scheduler when requests are in flight. Both are
+per process and only touched from the event loop.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import DB_SHARD_DIR, Folder, Note, create_sync_engine, enter_family, family_ids, shard_url, write_session, SQLALCHEMY_DATABASE_URL
+from sync import compact_tombstones, purge_deleted
+
+MAINTENANCE_ENABLED = os.getenv("MAINTENANCE_ENABLED", "true").lower() in ("1", "true", "yes")
+MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("MAINTENANCE_INTERVAL_SECONDS", "60"))
+MAINTENANCE_QUIET_MS = float(os.getenv("MAINTENANCE_QUIET_MS", "50"))
+MAINTENANCE_TIME_BUDGET_MS = float(os.getenv("MAINTENANCE_TIME_BUDGET_MS", "100"))
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "100"))
+VACUUM_PAGES = int(os.getenv("VACUUM_PAGES", "256"))
+ANALYZE_INTERVAL_SECONDS = float(os.getenv("ANALYZE_INTERVAL_SECONDS", "3600"))
+ANALYZE_LIMIT = int(os.getenv("ANALYZE_LIMIT", "1000"))
+
+logger = logging.getLogger(__name__)
+
+class Activity:
+    """Requests in flight, and when the last one finished"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.idle_since = time.monotonic()
+
+    def quiet_for(self) -> float:
+        return 0.0 if self.in_flight else time.monotonic() - self.idle_since
+
+activity = Activity()
+
+class ActivityMiddleware:
+    """Pure ASGI middleware keeping `activity` up to date"""
+
+    def __init__(self, app, exempt=()):
+        self.app = app
+        # Open event streams would keep the API from ever looking quiet
+        self.exempt = frozenset(exempt)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt:
+            return await self.app(scope, receive, send)
+        activity.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            activity.in_flight -= 1
+            activity.idle_since = time.monotonic()
+
+class Budget:
+    """Time left for one pass; spent early once a request comes in"""
+
+    def __init__(self, seconds: float, activity: Activity = activity):
+        self.deadline = time.monotonic() + seconds
+        self.activity = activity
+
+    def left(self) -> bool:
+        return not self.activity.in_flight and time.monotonic() < self.deadline
+
+def incremental_vacuum(url: str, pages: int = VACUUM_PAGES) -> bool:
+    """Free up to `pages` pages of the database at `url`; True if more are left.
+
+    Runs on a connection of its own, off the event loop: the sqlite3 module
+    steps a statement that returns no rows only once, which frees a single
+    page, while executescript() runs it to completion.
+    """
+    vacuum_engine = create_sync_engine(url)
+    try:
+        with vacuum_engine.connect() as conn:
+            if conn.execute(text("PRAGMA auto_vacuum")).scalar() != 2:
+                return False
+            free = conn.execute(text("PRAGMA freelist_count")).scalar()
+            if free:
+                conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({min(free, pages)})")
+            return free > pages
+    finally:
+        vacuum_engine.dispose()
+
+async def analyze(db: AsyncSession, limit: int = ANALYZE_LIMIT):
+    await db.execute(text(f"PRAGMA analysis_limit={limit}"))
+    await db.execute(text("ANALYZE"))
+
+async def maintain_database(budget: Budget, family_id: Optional[int] = None, batch_size: int = PURGE_BATCH_SIZE,
+                            vacuum_pages: int = VACUUM_PAGES) -> bool:
+    """Purge and vacuum one database until done or out of budget; True if done"""
+    await enter_family(family_id)
+    url = shard_url(family_id) if family_id is not None else SQLALCHEMY_DATABASE_URL
+
+    def purge(model):
+        async def step(db):
+            return await purge_deleted(db, model, batch_size=batch_size) == batch_size
+        return step
+
+    async def compact(db):
+        return await compact_tombstones(db, batch_size=batch_size) >= batch_size
+
+    # Notes before folders: a folder's notes are deleted with it
+    for step in (purge(Note), purge(Folder), compact):
+        more = True
+        while more:
+            if not budget.left():
+                return False
+            async with write_session() as db:
+                more = await step(db)
+                await db.commit()
+    more = True
+    while more:
+        if not budget.left():
+            return False
+        more = await asyncio.to_thread(incremental_vacuum, url, vacuum_pages)
+    return True
+
+class MaintenanceScheduler:
+    """Runs maintenance passes from a background task between start() and stop()"""
+
+    def __init__(self, activity: Activity = activity, interval: float = MAINTENANCE_INTERVAL_SECONDS,
+                 quiet_ms: float = MAINTENANCE_QUIET_MS, budget_ms: float = MAINTENANCE_TIME_BUDGET_MS,
+                 analyze_interval: float = ANALYZE_INTERVAL_SECONDS):
+        self.activity = activity
+        self.interval = interval
+        self.quiet = quiet_ms / 1000
+        self.budget = budget_ms / 1000
+        self.analyze_interval = analyze_interval
+        self._task = None
+        self._pending = deque()  # Databases left in the current round: family ids, or None for the single one
+        self._analyzed = {}  # Database -> when it was last analyzed
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        # A task left on another loop (an app served by an earlier event loop) never runs again
+        if self._task is None or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        if task.get_loop() is asyncio.get_running_loop():
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        done = True
+        while True:
+            # A pass cut short carries on at the next quiet moment; a finished round waits for the interval
+            if done:
+                await asyncio.sleep(self.interval)
+            while (quiet_for := self.activity.quiet_for()) < self.quiet:
+                await asyncio.sleep(self.quiet - quiet_for)
+            try:
+                done = await self.run_pass()
+            except Exception:
+                logger.exception("Database maintenance pass failed")
+                done = True
+
+    async def run_pass(self, budget: Optional[Budget] = None) -> bool:
+        """Maintain as many databases as the budget allows; True once every database is done"""
+        budget = budget or Budget(self.budget, self.activity)
+        if not self._pending:
+            self._pending.extend(await family_ids() if DB_SHARD_DIR else [None])
+        while self._pending:
+            database = self._pending[0]
+            if not await maintain_database(budget, database):
+                return False
+            if time.monotonic() - self._analyzed.get(database, float("-inf")) >= self.analyze_interval:
+                if not budget.left():
+                    return False
+                async with write_session() as db:
+                    await analyze(db)
+                    await db.commit()
+                self._analyzed[database] = time.monotonic()
+            self._pending.popleft()
+        return True
+
+scheduler = MaintenanceScheduler()
@@ -0,0 +1,209 @@
+"""
+Request and SQL instrumentation, exposed in Prometheus text format at /metrics.
+
+MetricsMiddleware times every HTTP request by route template (/notes/{note_id},
+not the concrete path). Engine event hooks count the statements each request
+issues and the time spent in them, so an endpoint that starts issuing a query
+per row shows up in db_statements_per_request. Statements slower than
+SLOW_QUERY_MS are logged with their parameters redacted. With SERVER_TIMING
+on, responses carry a Server-Timing header with the same numbers.
+
+The histograms are plain per-process counters; with several workers, scrape
+each of them.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+logger = logging.getLogger(__name__)
+
+class RequestStats:
+    __slots__ = ("statements", "db_time")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = {}  # labels -> [count per bucket..., +Inf count], sum
+
+    def observe(self, labels: tuple, value: float):
+        counts, total = self.series.get(labels) or ([0] * (len(self.buckets) + 1), 0.0)
+        counts[bisect_left(self.buckets, value)] += 1
+        self.series[labels] = (counts, total + value)
+
+    def render(self, label_names):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self.series.items()):
+            base = _labels(label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{{{base},le=\"{bound}\"}} {cumulative}")
+            lines.append(f"{self.name}_sum{{{base}}} {total}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative}")
+        return lines
+
+def _labels(names, values):
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+
+class Metrics:
+    """Process-wide registry; observations may come from the event loop or worker threads"""
+
+    def __init__(self):
+        self.enabled = METRICS_ENABLED
+        self.lock = threading.Lock()
+        self.latency = Histogram("http_request_duration_seconds", "Request latency by route", LATENCY_BUCKETS)
+        self.statements = Histogram("db_statements_per_request", "SQL statements issued per request", STATEMENT_BUCKETS)
+        self.db_time = Histogram("db_time_per_request_seconds", "Time spent in SQL statements per request", LATENCY_BUCKETS)
+        self.job_lag = Histogram("job_lag_seconds", "Time from enqueueing a job to finishing it", LATENCY_BUCKETS)
+        self.jobs = {}  # (kind, outcome) -> count
+        self.responses = {}  # (method, route, status) -> count
+        self.statements_total = 0
+        self.slow_queries_total = 0
+
+    def observe_request(self, method: str, route: str, status: int, elapsed: float, stats: RequestStats):
+        with self.lock:
+            self.latency.observe((method, route), elapsed)
+            self.statements.observe((method, route), stats.statements)
+            self.db_time.observe((method, route), stats.db_time)
+            key = (method, route, status)
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+    def observe_statement(self, elapsed: float, slow: bool):
+        with self.lock:
+            self.statements_total += 1
+            self.slow_queries_total += slow
+
+    def observe_job(self, kind: str, outcome: str, lag: float):
+        with self.lock:
+            if outcome == "done":
+                self.job_lag.observe((kind,), lag)
+            self.jobs[(kind, outcome)] = self.jobs.get((kind, outcome), 0) + 1
+
+    def render(self) -> str:
+        with self.lock:
+            lines = []
+            for histogram in (self.latency, self.statements, self.db_time):
+                lines += histogram.render(("method", "route"))
+            lines += ["# HELP http_requests_total Responses by route and status", "# TYPE http_requests_total counter"]
+            for labels, count in sorted(self.responses.items()):
+                lines.append(f"http_requests_total{{{_labels(('method', 'route', 'status'), labels)}}} {count}")
+            lines += [
+                "# HELP db_statements_total SQL statements executed, in requests or not",
+                "# TYPE db_statements_total counter",
+                f"db_statements_total {self.statements_total}",
+                f"# HELP db_slow_queries_total SQL statements slower than {SLOW_QUERY_MS:g} ms",
+                "# TYPE db_slow_queries_total counter",
+                f"db_slow_queries_total {self.slow_queries_total}",
+            ]
+            lines += self.job_lag.render(("kind",))
+            lines += ["# HELP jobs_total Background jobs run, by kind and outcome", "# TYPE jobs_total counter"]
+            for labels, count in sorted(self.jobs.items()):
+                lines.append(f"jobs_total{{{_labels(('kind', 'outcome'), labels)}}} {count}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming responses pass through untouched"""
+
+    def __init__(self, app, server_timing: bool = SERVER_TIMING):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not metrics.enabled:
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    elapsed = (time.perf_counter() - started) * 1000
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing",
+                        f'app;dur={elapsed:.1f}, db;dur={stats.db_time * 1000:.1f};desc="{stats.statements} statements"',
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stats.reset(token)
+            # FastAPI records the matched route in the scope; unmatched paths share one series
+            route = scope.get("route")
+            metrics.observe_request(scope["method"], getattr(route, "path", "unmatched"), status, time.perf_counter() - started, stats)
+
+def redact(parameters):
+    """Describe bound parameters without their values"""
+    if isinstance(parameters, (list, tuple)) and parameters and isinstance(parameters[0], (list, tuple, dict)):
+        return f"<{len(parameters)} parameter sets>"
+    if isinstance(parameters, dict):
+        return {name: _describe(value) for name, value in parameters.items()}
+    return [_describe(value) for value in parameters or ()]
+
+def _describe(value):
+    if value is None or isinstance(value, (bool, int, float)):
+        return type(value).__name__
+    if isinstance(value, (str, bytes)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    if not metrics.enabled:
+        return
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_time += elapsed
+    slow = elapsed * 1000 >= SLOW_QUERY_MS
+    metrics.observe_statement(elapsed, slow)
+    if slow:
+        logger.warning("Slow query (%.1f ms): %s; parameters: %s", elapsed * 1000, " ".join(statement.split()), redact(parameters))
+
+def _handle_error(exception_context):
+    if exception_context.connection is not None:
+        started = exception_context.connection.info.get("query_started")
+        if started:
+            started.pop()
+
+def instrument(target):
+    event.listen(target, "before_cursor_execute", _before_cursor_execute)
+    event.listen(target, "after_cursor_execute", _after_cursor_execute)
+    event.listen(target, "handle_error", _handle_error)
+
+# Listening on the Engine class covers every engine, including ones database.py
+# has not created yet (async engines run their statements through a sync Engine)
+instrument(Engine)
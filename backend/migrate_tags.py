@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Script to backfill the tags/note_tags index from the comma-separated Note.tags strings
+
+With DB_SHARD_DIR set it backfills every family's database in turn.
+"""
+import asyncio
+from sqlalchemy import delete, select
+from database import AsyncSessionLocal, DB_SHARD_DIR, dispose_engines, enter_family, family_ids, Note, NoteTag
+from tags import update_note_tags
+
+BATCH_SIZE = 1000
+
+async def migrate_tags():
+    for family_id in await family_ids() if DB_SHARD_DIR else [None]:
+        await enter_family(family_id)
+        await migrate_database()
+
+async def migrate_database():
+    async with AsyncSessionLocal() as db:
+        # Start from a clean index so the backfill can be re-run safely
+        await db.execute(delete(NoteTag))
+        await db.commit()
+        
+        migrated = 0
+        last_id = 0
+        while True:
+            notes = (await db.scalars(select(Note).where(Note.id > last_id, Note.deleted_at.is_(None)).order_by(Note.id).limit(BATCH_SIZE))).all()
+            if not notes:
+                break
+            for note in notes:
+                await update_note_tags(db, note)
+            await db.commit()
+            migrated += len(notes)
+            last_id = notes[-1].id
+            db.expunge_all()
+    
+    print(f"Indexed tags for {migrated} notes")
+
+if __name__ == "__main__":
+    asyncio.run(migrate_tags())
+    asyncio.run(dispose_engines())
@@ -0,0 +1,87 @@
+"""
+Keyset (cursor) pagination helpers shared by the list endpoints.
+
+Pages are ordered newest first by (sort column, id). The cursor is an opaque
+token that encodes the sort key of the last row of the previous page, so every
+page is a single index range scan no matter how deep the client has paged.
+Pages over several owners' rows (a parent's view of all children) are a
+merge of one such scan per owner; see owners_page_statement.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select, tuple_, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(sort_value: datetime, row_id: int) -> str:
+    raw = json.dumps([sort_value.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def page_statement(statement, sort_column, id_column, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE):
+    """Order `statement` for keyset paging and restrict it to the page after `cursor`"""
+    statement = statement.order_by(sort_column.desc(), id_column.desc())
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        statement = statement.where(tuple_(sort_column, id_column) < tuple_(sort_value, row_id))
+    # Fetch one extra row to learn whether another page exists
+    return statement.limit(limit + 1)
+
+def owners_page_statement(statement, owner_column, owner_ids: List[int], sort_column, id_column,
+                          cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE):
+    """page_statement for the rows of several owners; `statement` must not filter on the owner.
+
+    With owner IN (...), SQLite reads every matching row of every owner and
+    sorts them all for each page. Instead, each owner's next limit + 1 keys
+    come from its own index range, already in order, and only those rows are
+    fetched by id and sorted: a k-way merge in one statement.
+    """
+    owner_ids = sorted(set(owner_ids))
+    if len(owner_ids) < 2:
+        return page_statement(statement.where(owner_column.in_(owner_ids)), sort_column, id_column, cursor, limit)
+    keys = statement.with_only_columns(sort_column, id_column)
+    newest = union_all(*(
+        select(page_statement(keys.where(owner_column == owner_id), sort_column, id_column, cursor, limit).subquery().c[id_column.key])
+        for owner_id in owner_ids
+    ))
+    return page_statement(statement.where(id_column.in_(newest)), sort_column, id_column, None, limit)
+
+def page_result(rows, sort_column, id_column, limit: int = DEFAULT_PAGE_SIZE):
+    rows = list(rows)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+    return {"items": rows, "next_cursor": next_cursor}
+
+async def paginate(db: AsyncSession, statement, sort_column, id_column, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE):
+    return await _page(db, page_statement(statement, sort_column, id_column, cursor, limit), sort_column, id_column, limit)
+
+async def paginate_owners(db: AsyncSession, statement, owner_column, owner_ids: List[int], sort_column, id_column,
+                          cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE):
+    paged = owners_page_statement(statement, owner_column, owner_ids, sort_column, id_column, cursor, limit)
+    return await _page(db, paged, sort_column, id_column, limit)
+
+async def _page(db: AsyncSession, statement, sort_column, id_column, limit: int):
+    result = await db.execute(statement)
+    if len(statement.column_descriptions) == 1:
+        return page_result(result.scalars().all(), sort_column, id_column, limit)
+    # Column projections are returned as plain dicts, which response models validate cheaply
+    page = page_result(result.all(), sort_column, id_column, limit)
+    page["items"] = [row._asdict() for row in page["items"]]
+    return page
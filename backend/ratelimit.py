@@ -0,0 +1,220 @@
+"""
+Per-client rate limits and load shedding.
+
+RateLimiter is a route dependency holding one token bucket per (rule,
+client). The client is the user id from a valid bearer token, or the client
+IP for anonymous requests such as /login and /signup. RATE_LIMITS sets the
+rules as comma-separated `METHOD /path=requests/seconds` entries, with paths
+as declared in routes.py (no /api prefix); `*` covers every route without
+its own rule, sharing one bucket per client. A bucket holds `requests` tokens
+and refills at requests/seconds, so a client may burst up to the limit and
+then sustain the average rate. Over the limit, requests get 429 with
+Retry-After.
+
+Buckets are kept in LRU order. One that has been idle long enough to refill
+is indistinguishable from a new one, so it is dropped on the next request,
+and at most RATE_LIMIT_MAX_KEYS are kept (evicting the least recently used
+early only makes that client's limit more lenient).
+
+LoadShedMiddleware caps the requests in flight. Requests beyond
+LOAD_SHED_MAX_CONCURRENCY wait in a FIFO queue; once LOAD_SHED_MAX_QUEUE are
+waiting, or the oldest has waited LOAD_SHED_MAX_WAIT_MS, new requests get 503
+with Retry-After straight away, and a queued request that is still waiting
+after that long gets the same 503 instead of running late.
+
+Both are per process and only touched from the event loop.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+from starlette.responses import JSONResponse
+
+from auth import token_user_id
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMITS = os.getenv("RATE_LIMITS", "POST /login=10/60, POST /signup=5/60, GET /available-children=30/60, GET /export=10/3600, *=600/60")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "10000"))
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() in ("1", "true", "yes")
+
+LOAD_SHED_MAX_CONCURRENCY = int(os.getenv("LOAD_SHED_MAX_CONCURRENCY", "64"))  # 0 turns load shedding off
+LOAD_SHED_MAX_QUEUE = int(os.getenv("LOAD_SHED_MAX_QUEUE", "128"))
+LOAD_SHED_MAX_WAIT_MS = float(os.getenv("LOAD_SHED_MAX_WAIT_MS", "1000"))
+LOAD_SHED_RETRY_AFTER = int(os.getenv("LOAD_SHED_RETRY_AFTER", "1"))
+
+DEFAULT_RULE = "*"
+
+@dataclass(frozen=True)
+class Limit:
+    requests: int
+    period: float
+
+    @property
+    def rate(self) -> float:
+        return self.requests / self.period
+
+def parse_limits(spec: str) -> Dict[str, Limit]:
+    """{"POST /login": Limit(10, 60), "*": Limit(600, 60)} from "POST /login=10/60, *=600/60" """
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        try:
+            rule, value = (part.strip() for part in entry.rsplit("=", 1))
+            requests, period = value.split("/")
+            limit = Limit(int(requests), float(period))
+        except ValueError:
+            raise ValueError(f"Bad rate limit {entry!r}; expected 'METHOD /path=requests/seconds' or '*=requests/seconds'")
+        if limit.requests <= 0 or limit.period <= 0:
+            raise ValueError(f"Bad rate limit {entry!r}; requests and seconds must be positive")
+        method, _, path = rule.partition(" ")
+        limits[rule if rule == DEFAULT_RULE else f"{method.upper()} {path.strip()}"] = limit
+    return limits
+
+class TokenBuckets:
+    """Bounded LRU of token buckets; a bucket is (tokens, last refill time, limit)"""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def take(self, key, limit: Limit, now: Optional[float] = None) -> float:
+        """Take a token for `key`; returns 0 if allowed, else seconds until one is available"""
+        now = time.monotonic() if now is None else now
+        self._evict_idle(now)
+        tokens, last, _ = self._buckets.pop(key, (limit.requests, now, limit))
+        tokens = min(limit.requests, tokens + (now - last) * limit.rate)
+        wait = 0.0 if tokens >= 1 else (1 - tokens) / limit.rate
+        self._buckets[key] = (tokens - 1 if wait == 0 else tokens, now, limit)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def _evict_idle(self, now: float):
+        # Least recently used first: stop at the first bucket that has not refilled yet
+        while self._buckets:
+            key, (tokens, last, limit) = next(iter(self._buckets.items()))
+            if tokens + (now - last) * limit.rate < limit.requests:
+                break
+            del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+def client_ip(request: Request) -> str:
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+def client_key(request: Request) -> Tuple[str, object]:
+    """("user", id) for a valid bearer token (header, or ?token= for EventSource), else ("ip", address)"""
+    authorization = request.headers.get("authorization", "")
+    token = authorization[7:] if authorization[:7].lower() == "bearer " else request.query_params.get("token")
+    user_id = token_user_id(token) if token else None
+    return ("user", user_id) if user_id is not None else ("ip", client_ip(request))
+
+class RateLimiter:
+    """Route dependency enforcing RATE_LIMITS; create_app installs one per app"""
+
+    def __init__(self, limits: Optional[Dict[str, Limit]] = None, prefix: str = "", max_keys: int = RATE_LIMIT_MAX_KEYS, enabled: bool = RATE_LIMIT_ENABLED):
+        self.limits = parse_limits(RATE_LIMITS) if limits is None else limits
+        self.prefix = prefix
+        self.enabled = enabled
+        self.buckets = TokenBuckets(max_keys)
+
+    def rule_for(self, method: str, path: str) -> Optional[str]:
+        rule = f"{method} {path[len(self.prefix):] if path.startswith(self.prefix) else path}"
+        if rule in self.limits:
+            return rule
+        return DEFAULT_RULE if DEFAULT_RULE in self.limits else None
+
+    async def __call__(self, request: Request):
+        if not self.enabled:
+            return
+        route = request.scope.get("route")
+        rule = self.rule_for(request.method, getattr(route, "path", request.url.path))
+        if rule is None:
+            return
+        wait = self.buckets.take((rule, client_key(request)), self.limits[rule])
+        if wait:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, please slow down",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+
+class LoadShedMiddleware:
+    """Pure ASGI middleware capping requests in flight, with a bounded wait queue"""
+
+    def __init__(self, app, max_concurrency: int = LOAD_SHED_MAX_CONCURRENCY, max_queue: int = LOAD_SHED_MAX_QUEUE,
+                 max_wait_ms: float = LOAD_SHED_MAX_WAIT_MS, retry_after: int = LOAD_SHED_RETRY_AFTER, exempt=()):
+        self.app = app
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait_ms / 1000
+        self.retry_after = retry_after
+        # Long-lived streams would hold a slot for their whole life, and scrapes should get through
+        self.exempt = frozenset(exempt)
+        self.active = 0
+        self.queued = 0
+        self.shed = 0
+        self._waiters = deque()  # (future, enqueued at), oldest first; abandoned futures are skipped
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_concurrency <= 0 or scope["path"] in self.exempt:
+            return await self.app(scope, receive, send)
+        if not await self._acquire():
+            self.shed += 1
+            response = JSONResponse(
+                {"detail": "Server is busy, please retry shortly"},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+            return await response(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self._release()
+
+    def queue_delay(self, now: float) -> float:
+        """How long the oldest queued request has been waiting"""
+        while self._waiters and self._waiters[0][0].done():
+            self._waiters.popleft()
+        return now - self._waiters[0][1] if self._waiters else 0.0
+
+    async def _acquire(self) -> bool:
+        now = time.monotonic()
+        if self.active < self.max_concurrency and not self.queued:
+            self.active += 1
+            return True
+        if self.queued >= self.max_queue or self.queue_delay(now) >= self.max_wait:
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((future, now))
+        self.queued += 1
+        try:
+            return await asyncio.wait_for(future, self.max_wait)
+        except asyncio.TimeoutError:
+            # A slot handed over just as the wait timed out is still ours
+            return future.done() and not future.cancelled()
+        except BaseException:
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+        finally:
+            self.queued -= 1
+
+    def _release(self):
+        # Hand the slot straight to the oldest live waiter, so active stays the same
+        while self._waiters:
+            future, _ = self._waiters.popleft()
+            if not future.done():
+                future.set_result(True)
+                return
+        self.active -= 1
@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+"""
+Script to (re)build the full-text search index from the notes table
+"""
+from database import engine, rebuild_search_index, SessionLocal, Note
+
+def rebuild():
+    rebuild_search_index(engine)
+    db = SessionLocal()
+    count = db.query(Note).count()
+    db.close()
+    print(f"Search index rebuilt for {count} notes")
+
+if __name__ == "__main__":
+    rebuild()
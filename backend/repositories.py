@@ -0,0 +1,386 @@
+"""
+Repositories: the folders and notes behind the core endpoints, and the
+parent's view of children, with two interchangeable backends.
+
+SqlRepository runs the queries those endpoints used to inline, on the
+request's session, together with everything a write implies in the same
+transaction (user_stats, the collection version, the tag job). MemoryRepository
+keeps the same data in dicts: __slots__ records with hash indexes by id,
+owner, folder, tag and parent, and no I/O at all. It is for deterministic
+checks and as a baseline for the API's own overhead; swap it in with
+
+    app.dependency_overrides[get_repository] = lambda: repository
+    app.dependency_overrides[get_read_repository] = lambda: repository
+
+Both return objects with the model's attribute names, so response models
+and events serialize either. tests/test_repositories.py runs one set of
+tests against both backends, and bench/bench_repositories.py compares them.
+
+Batch writes, content patches, search, tags, sync, the dashboard, export and
+import, and signup, login and token checks, still work on the session
+directly. They rely on SQL features (FTS5, change sequences, the job queue,
+family placement) that the memory backend does not model, so users are
+created there and MemoryRepository.add_user only seeds them.
+"""
+import heapq
+from abc import ABC, abstractmethod
+from bisect import bisect_left, insort
+from datetime import datetime
+from itertools import count, islice
+from typing import Dict, List, Optional, Set
+
+from fastapi import Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer
+
+from batch import soft_delete_folder
+from database import get_db, get_read_db, User, Folder, Note
+from etags import collection_versions
+from jobs import enqueue_tag_sync
+from pagination import paginate_owners, encode_cursor, decode_cursor, DEFAULT_PAGE_SIZE
+from stats import apply_stats_delta, note_counters, counter_delta
+from tags import parse_tags, tagged_note_ids
+
+class Repository(ABC):
+    """Data access for the core endpoints.
+
+    get_* return live rows only, or None. Write methods commit. Pages are
+    {"items", "next_cursor"}, newest first, with the cursors of pagination.py;
+    a `fields` projection returns items as dicts.
+    """
+
+    # Users
+    @abstractmethod
+    async def children(self, parent_id: int) -> list:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def unlinked_children(self) -> list:
+        """Children without a parent, which a new parent may claim"""
+        raise NotImplementedError
+
+    # Folders
+    @abstractmethod
+    async def folder_page(self, owner_ids: List[int], cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_folder(self, folder_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def add_folder(self, owner_id: int, name: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_folder(self, folder) -> List[dict]:
+        """Delete `folder` and the owner's notes in it; returns a result per deleted note, for batch_event"""
+        raise NotImplementedError
+
+    # Notes
+    @abstractmethod
+    async def note_page(self, owner_ids: List[int], folder_id: Optional[int] = None, tag: Optional[str] = None,
+                        fields: Optional[List[str]] = None, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_note(self, note_id: int, content: bool = True):
+        """`content=False` may leave the body unloaded, for writes that never return it"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def add_note(self, owner_id: int, title: str, content: str, tags: Optional[str] = "", is_todo: bool = False,
+                       folder_id: Optional[int] = None):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_note(self, note, **fields):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_note(self, note):
+        raise NotImplementedError
+
+    # ETags
+    @abstractmethod
+    async def collection_versions(self, owner_ids: List[int]) -> Dict[int, int]:
+        """Each owner's collection version, bumped by every note or folder write; 0 if never written"""
+        raise NotImplementedError
+
+class SqlRepository(Repository):
+    """The API's backend. get_folder and get_note reread the row even if the
+    session holds it, as set-based deletes bypass the session's copies."""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def children(self, parent_id: int) -> list:
+        return (await self.db.scalars(select(User).where(User.parent_id == parent_id).order_by(User.id))).all()
+
+    async def unlinked_children(self) -> list:
+        return (await self.db.scalars(select(User).where(User.role == "child", User.parent_id.is_(None)).order_by(User.id))).all()
+
+    async def folder_page(self, owner_ids: List[int], cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE) -> dict:
+        statement = select(Folder).where(Folder.deleted_at.is_(None))
+        return await paginate_owners(self.db, statement, Folder.owner_id, owner_ids, Folder.created_at, Folder.id, cursor, limit)
+
+    async def get_folder(self, folder_id: int):
+        folder = await self.db.get(Folder, folder_id, populate_existing=True)
+        return None if folder is None or folder.deleted_at else folder
+
+    async def add_folder(self, owner_id: int, name: str):
+        folder = Folder(name=name, owner_id=owner_id)
+        self.db.add(folder)
+        await apply_stats_delta(self.db, owner_id, folder_count=1)
+        await self.db.commit()
+        return folder
+
+    async def delete_folder(self, folder) -> List[dict]:
+        results = await soft_delete_folder(self.db, folder)
+        await self.db.commit()
+        return sorted(results, key=lambda result: result["id"])
+
+    async def note_page(self, owner_ids: List[int], folder_id: Optional[int] = None, tag: Optional[str] = None,
+                        fields: Optional[List[str]] = None, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE) -> dict:
+        columns = [getattr(Note, name) for name in fields] if fields else [Note]
+        statement = select(*columns).where(Note.deleted_at.is_(None))
+        if not fields:
+            statement = statement.options(undefer(Note.content))
+        if folder_id:
+            statement = statement.where(Note.folder_id == folder_id)
+        if tag:
+            statement = statement.where(Note.id.in_(tagged_note_ids(tag, owner_ids)))
+        return await paginate_owners(self.db, statement, Note.owner_id, owner_ids, Note.updated_at, Note.id, cursor, limit)
+
+    async def get_note(self, note_id: int, content: bool = True):
+        note = await self.db.get(Note, note_id, options=[undefer(Note.content)] if content else [], populate_existing=True)
+        return None if note is None or note.deleted_at else note
+
+    async def add_note(self, owner_id: int, title: str, content: str, tags: Optional[str] = "", is_todo: bool = False,
+                       folder_id: Optional[int] = None):
+        note = Note(title=title, content=content, tags=tags, is_todo=is_todo, folder_id=folder_id, owner_id=owner_id)
+        self.db.add(note)
+        await self.db.flush()
+        if parse_tags(note.tags):
+            enqueue_tag_sync(self.db, owner_id, [note.id])
+        await apply_stats_delta(self.db, owner_id, **note_counters(note))
+        await self.db.commit()
+        return note
+
+    async def update_note(self, note, **fields):
+        previous_tags = note.tags
+        previous_counters = note_counters(note)
+        for field, value in fields.items():
+            setattr(note, field, value)
+        if note.tags != previous_tags:
+            enqueue_tag_sync(self.db, note.owner_id, [note.id])
+
+        note.updated_at = datetime.utcnow()
+        if "content" in fields:
+            # Incremented in SQL so a concurrent content patch is never overwritten at the same version
+            note.content_version = Note.content_version + 1
+        await apply_stats_delta(self.db, note.owner_id, **counter_delta(previous_counters, note_counters(note)))
+        await self.db.flush()
+        if "content" in fields:
+            await self.db.refresh(note, ["content_version"])
+        await self.db.commit()
+        return note
+
+    async def delete_note(self, note):
+        note.deleted_at = datetime.utcnow()
+        if parse_tags(note.tags):
+            enqueue_tag_sync(self.db, note.owner_id, [note.id])
+        await apply_stats_delta(self.db, note.owner_id, **counter_delta(before=note_counters(note)))
+        await self.db.commit()
+
+    async def collection_versions(self, owner_ids: List[int]) -> Dict[int, int]:
+        return await collection_versions(self.db, owner_ids)
+
+class Record:
+    """A row of the memory backend: attributes only, no per-instance __dict__"""
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name))
+
+    def __repr__(self):
+        return f"{type(self).__name__}(id={self.id!r})"
+
+class UserRecord(Record):
+    __slots__ = ("id", "username", "email", "hashed_password", "role", "parent_id", "auth_version", "family_id", "created_at")
+
+class FolderRecord(Record):
+    __slots__ = ("id", "name", "owner_id", "created_at")
+
+class NoteRecord(Record):
+    __slots__ = ("id", "title", "content", "content_version", "tags", "is_todo", "is_completed", "folder_id", "owner_id",
+                 "created_at", "updated_at")
+
+# Memory indexes map a key (owner, folder) to its rows' (sort value, id) pairs in ascending order
+def _add_key(index: dict, name, key):
+    insort(index.setdefault(name, []), key)
+
+def _remove_key(index: dict, name, key):
+    keys = index[name]
+    del keys[bisect_left(keys, key)]
+
+def _newest(key_lists, rows: dict, cursor: Optional[str], limit: int, keep=None):
+    """Keyset page over sorted key lists: the newest limit rows below the cursor that `keep` accepts.
+
+    Each list is read backwards from the cursor's position and the lists are
+    merged lazily, so without a filter a page reads limit + 1 keys per list.
+    """
+    after = decode_cursor(cursor) if cursor else None
+
+    def descending(keys):
+        end = bisect_left(keys, after) if after else len(keys)
+        return (keys[position] for position in range(end - 1, -1, -1))
+
+    keys = heapq.merge(*(descending(keys) for keys in key_lists), reverse=True)
+    if keep is not None:
+        keys = (key for key in keys if keep(rows[key[1]]))
+    keys = list(islice(keys, limit + 1))
+    next_cursor = None
+    if len(keys) > limit:
+        keys = keys[:limit]
+        next_cursor = encode_cursor(*keys[-1])
+    return {"items": [rows[row_id] for _, row_id in keys], "next_cursor": next_cursor}
+
+class MemoryRepository(Repository):
+    """Everything in process memory, gone when the process exits. Not safe to share across threads.
+
+    Records are found by id with a dict lookup, and by owner, folder, tag or
+    parent through hash indexes. The owner and folder indexes keep their
+    rows in page order, so a page costs a bisect and `limit` steps rather
+    than time in the number of rows. `clock` stamps created_at and
+    updated_at; pass a fake one for reproducible timestamps.
+    """
+
+    def __init__(self, clock=datetime.utcnow):
+        self.clock = clock
+        self._ids = {"user": count(1), "folder": count(1), "note": count(1)}
+        self._children: Dict[Optional[int], Dict[int, UserRecord]] = {}  # parent_id -> children
+        self._folders: Dict[int, FolderRecord] = {}
+        self._folders_by_owner: Dict[int, list] = {}  # owner_id -> [(created_at, id)]
+        self._notes: Dict[int, NoteRecord] = {}
+        self._notes_by_owner: Dict[int, list] = {}  # owner_id -> [(updated_at, id)]
+        self._notes_by_folder: Dict[int, list] = {}  # folder_id -> [(updated_at, id)]
+        self._notes_by_tag: Dict[str, Set[int]] = {}
+        self._versions: Dict[int, int] = {}
+
+    def _bump(self, owner_id: int):
+        self._versions[owner_id] = self._versions.get(owner_id, 0) + 1
+
+    async def add_user(self, username: str, email: str, hashed_password: str, role: str = "child", parent_id: Optional[int] = None):
+        """Seed a user as-is, for tests and benchmarks; the API creates users on the SQL side only"""
+        user = UserRecord(id=next(self._ids["user"]), username=username, email=email, hashed_password=hashed_password,
+                          role=role, parent_id=parent_id, auth_version=1, created_at=self.clock())
+        self._children.setdefault(parent_id, {})[user.id] = user
+        return user
+
+    async def children(self, parent_id: int) -> list:
+        return sorted(self._children.get(parent_id, {}).values(), key=lambda user: user.id)
+
+    async def unlinked_children(self) -> list:
+        return [user for user in await self.children(None) if user.role == "child"]
+
+    async def folder_page(self, owner_ids: List[int], cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE) -> dict:
+        key_lists = [self._folders_by_owner.get(owner_id, []) for owner_id in set(owner_ids)]
+        return _newest(key_lists, self._folders, cursor, limit)
+
+    async def get_folder(self, folder_id: int):
+        return self._folders.get(folder_id)
+
+    async def add_folder(self, owner_id: int, name: str):
+        folder = FolderRecord(id=next(self._ids["folder"]), name=name, owner_id=owner_id, created_at=self.clock())
+        self._folders[folder.id] = folder
+        _add_key(self._folders_by_owner, owner_id, (folder.created_at, folder.id))
+        self._bump(owner_id)
+        return folder
+
+    async def delete_folder(self, folder) -> List[dict]:
+        del self._folders[folder.id]
+        _remove_key(self._folders_by_owner, folder.owner_id, (folder.created_at, folder.id))
+        notes = [self._notes[note_id] for _, note_id in self._notes_by_folder.get(folder.id, [])]
+        notes = sorted((note for note in notes if note.owner_id == folder.owner_id), key=lambda note: note.id)
+        for note in notes:
+            self._unindex(note)
+        self._bump(folder.owner_id)
+        return [{"id": note.id, "status": 200} for note in notes]
+
+    def _index(self, note: NoteRecord):
+        key = (note.updated_at, note.id)
+        self._notes[note.id] = note
+        _add_key(self._notes_by_owner, note.owner_id, key)
+        if note.folder_id is not None:
+            _add_key(self._notes_by_folder, note.folder_id, key)
+        for name in parse_tags(note.tags):
+            self._notes_by_tag.setdefault(name, set()).add(note.id)
+
+    def _unindex(self, note: NoteRecord):
+        key = (note.updated_at, note.id)
+        del self._notes[note.id]
+        _remove_key(self._notes_by_owner, note.owner_id, key)
+        if note.folder_id is not None:
+            _remove_key(self._notes_by_folder, note.folder_id, key)
+        for name in parse_tags(note.tags):
+            self._notes_by_tag[name].discard(note.id)
+
+    async def note_page(self, owner_ids: List[int], folder_id: Optional[int] = None, tag: Optional[str] = None,
+                        fields: Optional[List[str]] = None, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE) -> dict:
+        owners = set(owner_ids)
+        tagged = self._notes_by_tag.get(tag.strip().lower(), set()) if tag else None
+        if folder_id:
+            key_lists = [self._notes_by_folder.get(folder_id, [])]
+            if tagged is None:
+                keep = lambda note: note.owner_id in owners
+            else:
+                keep = lambda note: note.owner_id in owners and note.id in tagged
+        else:
+            key_lists = [self._notes_by_owner.get(owner_id, []) for owner_id in owners]
+            keep = None if tagged is None else lambda note: note.id in tagged
+        page = _newest(key_lists, self._notes, cursor, limit, keep)
+        if fields:
+            page["items"] = [{name: getattr(note, name) for name in fields} for note in page["items"]]
+        return page
+
+    async def get_note(self, note_id: int, content: bool = True):
+        return self._notes.get(note_id)
+
+    async def add_note(self, owner_id: int, title: str, content: str, tags: Optional[str] = "", is_todo: bool = False,
+                       folder_id: Optional[int] = None):
+        now = self.clock()
+        note = NoteRecord(id=next(self._ids["note"]), title=title, content=content, content_version=1, tags=tags,
+                          is_todo=is_todo, is_completed=False, folder_id=folder_id, owner_id=owner_id,
+                          created_at=now, updated_at=now)
+        self._index(note)
+        self._bump(owner_id)
+        return note
+
+    async def update_note(self, note, **fields):
+        # Out of the indexes while its sort key and tags change
+        self._unindex(note)
+        for field, value in fields.items():
+            setattr(note, field, value)
+        note.updated_at = self.clock()
+        if "content" in fields:
+            note.content_version += 1
+        self._index(note)
+        self._bump(note.owner_id)
+        return note
+
+    async def delete_note(self, note):
+        self._unindex(note)
+        self._bump(note.owner_id)
+
+    async def collection_versions(self, owner_ids: List[int]) -> Dict[int, int]:
+        return {owner_id: self._versions[owner_id] for owner_id in owner_ids if owner_id in self._versions}
+
+# Repository dependencies, like get_db and get_read_db: get_repository for endpoints that write
+async def get_repository(db: AsyncSession = Depends(get_db)) -> Repository:
+    return SqlRepository(db)
+
+async def get_read_repository(db: AsyncSession = Depends(get_read_db)) -> Repository:
+    return SqlRepository(db)
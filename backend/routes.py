@@ -0,0 +1,462 @@
+"""
+The NoteNext API: every endpoint on one router, and create_app to serve it.
+
+Importing this module only defines routes. Engines, the schema check, bcrypt
+and the JWT backend are set up on first use, so a cold start can answer its
+first request without paying for work that request does not need.
+"""
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, Query, Request, Response, status
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime
+
+from database import get_db, get_read_db, write_session, dispose_engines, User, Note
+from auth import create_access_token, get_current_user, visible_owner_ids, get_stream_user, load_principal, invalidate_principals, principal_cache, hashing_busy_exception, Principal
+from hashing import password_hasher, HashingBusy
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from search import search_notes, DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT
+from tags import tag_counts
+from stats import apply_stats_delta, dashboard
+from batch import create_notes, patch_notes, delete_notes, MAX_BATCH_SIZE
+from schemas import NoteOut, ContentVersionOut, FolderOut, UserSummary, NotePage, FolderPage, BatchResult, SyncOut, ImportJobOut, JobQueueOut, parse_fields
+from etags import make_etag, collection_etag, conditional_response
+from repositories import Repository, get_repository, get_read_repository
+from sync import changes_since, DEFAULT_SYNC_LIMIT, MAX_SYNC_LIMIT
+from edits import patch_content, MAX_EDITS
+from backup import export_ndjson, export_zip, start_import, run_import, import_status, ImportConflict
+from events import broker, event_stream, note_event, folder_event, batch_event
+from metrics import MetricsMiddleware, metrics
+from ratelimit import RateLimiter, LoadShedMiddleware
+from maintenance import ActivityMiddleware, scheduler, MAINTENANCE_ENABLED
+from jobs import queue_stats, workers
+from shards import place_user, finish_moves
+
+router = APIRouter(default_response_class=ORJSONResponse)
+
+DEFAULT_CORS_ORIGINS = ["http://localhost:3000", "http://127.0.0.1:3000"]
+
+# Pydantic models
+class UserCreate(BaseModel):
+    username: str
+    email: str
+    password: str
+    role: str = "child"
+    parent_id: Optional[int] = None
+    child_ids: Optional[List[int]] = []
+
+class UserLogin(BaseModel):
+    username: str
+    password: str
+
+class FolderCreate(BaseModel):
+    name: str
+
+class NoteCreate(BaseModel):
+    title: str
+    content: str
+    tags: Optional[str] = ""
+    is_todo: bool = False
+    folder_id: Optional[int] = None
+
+class NoteUpdate(BaseModel):
+    title: Optional[str] = None
+    content: Optional[str] = None
+    tags: Optional[str] = None
+    is_todo: Optional[bool] = None
+    is_completed: Optional[bool] = None
+
+class NotePatch(NoteUpdate):
+    id: int
+    folder_id: Optional[int] = None
+
+class NoteBatchCreate(BaseModel):
+    notes: List[NoteCreate] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+class NoteBatchPatch(BaseModel):
+    notes: List[NotePatch] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+class NoteBatchDelete(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+class ContentEdit(BaseModel):
+    start: int = Field(ge=0)
+    end: int = Field(ge=0)
+    text: str = ""
+
+class ContentPatch(BaseModel):
+    base_version: int
+    edits: List[ContentEdit] = Field(min_length=1, max_length=MAX_EDITS)
+
+# Auth endpoints
+@router.post("/signup")
+async def signup(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    # Check if user exists
+    if await db.scalar(select(User.id).where(User.username == user.username)):
+        raise HTTPException(status_code=400, detail="Username already registered")
+    if await db.scalar(select(User.id).where(User.email == user.email)):
+        raise HTTPException(status_code=400, detail="Email already registered")
+    
+    # Create user
+    await db.rollback()  # Don't hold a pooled connection while bcrypt runs
+    try:
+        hashed_password = await password_hasher.hash(user.password)
+    except HashingBusy:
+        raise hashing_busy_exception()
+    db_user = User(
+        username=user.username,
+        email=user.email,
+        hashed_password=hashed_password,
+        role=user.role,
+        parent_id=user.parent_id
+    )
+    db.add(db_user)
+    await db.flush()
+    
+    # Parents whose set of children changes must not keep serving cached claims
+    stale_user_ids = [user.parent_id] if user.parent_id else []
+    
+    # If parent, link selected children
+    linked_children = []
+    if user.role == "parent" and user.child_ids:
+        for child_id in user.child_ids:
+            child = await db.scalar(select(User).where(User.id == child_id, User.role == "child"))
+            if child:
+                stale_user_ids.extend(filter(None, [child.id, child.parent_id]))
+                child.parent_id = db_user.id
+                linked_children.append(child)
+    
+    # With partitioned storage, the new user joins a family and linked children's data moves into it
+    moves = await place_user(db, db_user, linked_children)
+    if stale_user_ids:
+        await invalidate_principals(db, *stale_user_ids)
+    await db.commit()
+    await finish_moves(moves)
+    
+    return {"message": "User created successfully"}
+
+@router.post("/login")
+async def login(user: UserLogin, db: AsyncSession = Depends(get_read_db)):
+    db_user = await db.scalar(select(User).where(User.username == user.username))
+    if not db_user:
+        raise HTTPException(status_code=400, detail="Incorrect username or password")
+    
+    # Hand the connection back to the pool while bcrypt runs
+    db.expunge(db_user)
+    await db.rollback()
+    try:
+        valid, new_hash = await password_hasher.verify_and_update(user.password, db_user.hashed_password)
+    except HashingBusy:
+        raise hashing_busy_exception()
+    if not valid:
+        raise HTTPException(status_code=400, detail="Incorrect username or password")
+    if new_hash:
+        # Stored hash used an old cost factor; upgrade it now that we know the password
+        async with write_session() as write_db:
+            await write_db.execute(update(User).where(User.id == db_user.id).values(hashed_password=new_hash))
+            await write_db.commit()
+    
+    principal = await load_principal(db, db_user)
+    principal_cache.put(principal)
+    access_token = create_access_token(principal)
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "user": {
+            "id": db_user.id,
+            "username": db_user.username,
+            "role": db_user.role
+        }
+    }
+
+# Folder endpoints
+@router.get("/folders", response_model=FolderPage)
+async def get_folders(request: Request, response: Response, child_id: Optional[int] = None, cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), current_user: Principal = Depends(get_current_user), repository: Repository = Depends(get_read_repository)):
+    # Parents see their children's folders (optionally one child), children only their own
+    owner_ids = visible_owner_ids(current_user, child_id)
+    conditional_response(request, response, collection_etag(request, owner_ids, await repository.collection_versions(owner_ids)))
+    return await repository.folder_page(owner_ids, cursor, limit)
+
+@router.post("/folders", response_model=FolderOut)
+async def create_folder(folder: FolderCreate, current_user: Principal = Depends(get_current_user), repository: Repository = Depends(get_repository)):
+    if current_user.role == "parent":
+        raise HTTPException(status_code=403, detail="Parents cannot create folders")
+    
+    db_folder = await repository.add_folder(current_user.id, folder.name)
+    await broker.publish(folder_event("created", db_folder))
+    return db_folder
+
+@router.delete("/folders/{folder_id}")
+async def delete_folder(folder_id: int, current_user: Principal = Depends(get_current_user), repository: Repository = Depends(get_repository)):
+    folder = await repository.get_folder(folder_id)
+    if not folder:
+        raise HTTPException(status_code=404, detail="Folder not found")
+    if current_user.role == "parent" or folder.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    # The folder's notes are deleted with it
+    results = await repository.delete_folder(folder)
+    await broker.publish(folder_event("deleted", folder))
+    event = batch_event(current_user.id, results, deleted=True)
+    if event:
+        await broker.publish(event)
+    return {"message": "Folder deleted"}
+
+# Note endpoints
+@router.get("/notes", response_model=NotePage, response_model_exclude_unset=True)
+async def get_notes(request: Request, response: Response, folder_id: Optional[int] = None, child_id: Optional[int] = None, tag: Optional[str] = None, fields: Optional[str] = None, cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), current_user: Principal = Depends(get_current_user), repository: Repository = Depends(get_read_repository)):
+    # Parents see their children's notes (optionally one child), children only their own
+    owner_ids = visible_owner_ids(current_user, child_id)
+    # 304 if nothing in scope changed, before any note rows are read
+    conditional_response(request, response, collection_etag(request, owner_ids, await repository.collection_versions(owner_ids)))
+    # ?fields=title,tags selects only those columns (plus id and updated_at for the cursor)
+    return await repository.note_page(owner_ids, folder_id, tag, parse_fields(fields) if fields else None, cursor, limit)
+
+@router.get("/notes/search")
+async def search(q: str, folder_id: Optional[int] = None, child_id: Optional[int] = None, limit: int = Query(DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_SEARCH_LIMIT), current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    # Same visibility rules as get_notes
+    owner_ids = visible_owner_ids(current_user, child_id)
+    return await search_notes(db, owner_ids, q, folder_id, limit)
+
+@router.post("/notes", response_model=NoteOut)
+async def create_note(note: NoteCreate, current_user: Principal = Depends(get_current_user), repository: Repository = Depends(get_repository)):
+    if current_user.role == "parent":
+        raise HTTPException(status_code=403, detail="Parents cannot create notes")
+    
+    db_note = await repository.add_note(
+        current_user.id,
+        title=note.title,
+        content=note.content,
+        tags=note.tags,
+        is_todo=note.is_todo,
+        folder_id=note.folder_id
+    )
+    await broker.publish(note_event("created", db_note))
+    return db_note
+
+# Batch endpoints: one transaction and one ownership check per request.
+# Registered before /notes/{note_id} so "batch" is never parsed as an id.
+@router.post("/notes/batch", response_model=List[BatchResult], response_model_exclude_unset=True)
+async def create_notes_batch(batch: NoteBatchCreate, current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    if current_user.role == "parent":
+        raise HTTPException(status_code=403, detail="Parents cannot create notes")
+    
+    results = await create_notes(db, current_user.id, [note.model_dump() for note in batch.notes])
+    await db.commit()
+    event = batch_event(current_user.id, results)
+    if event:
+        await broker.publish(event)
+    return results
+
+@router.patch("/notes/batch", response_model=List[BatchResult], response_model_exclude_unset=True)
+async def patch_notes_batch(batch: NoteBatchPatch, current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    if current_user.role == "parent":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    results = await patch_notes(db, current_user.id, [note.model_dump(exclude_unset=True) for note in batch.notes])
+    await db.commit()
+    event = batch_event(current_user.id, results)
+    if event:
+        await broker.publish(event)
+    return results
+
+@router.delete("/notes/batch", response_model=List[BatchResult], response_model_exclude_unset=True)
+async def delete_notes_batch(batch: NoteBatchDelete, current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    if current_user.role == "parent":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    results = await delete_notes(db, current_user.id, batch.ids)
+    await db.commit()
+    event = batch_event(current_user.id, results, deleted=True)
+    if event:
+        await broker.publish(event)
+    return results
+
+@router.put("/notes/{note_id}", response_model=NoteOut)
+async def update_note(note_id: int, note: NoteUpdate, current_user: Principal = Depends(get_current_user), repository: Repository = Depends(get_repository)):
+    db_note = await repository.get_note(note_id)
+    if not db_note:
+        raise HTTPException(status_code=404, detail="Note not found")
+    if current_user.role == "parent" or db_note.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    db_note = await repository.update_note(db_note, **note.model_dump(exclude_unset=True))
+    await broker.publish(note_event("updated", db_note))
+    return db_note
+
+# Autosave: range edits against the content version the editor last saw
+@router.patch("/notes/{note_id}/content", response_model=ContentVersionOut)
+async def patch_note_content(note_id: int, patch: ContentPatch, current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    db_note = await db.get(Note, note_id, options=[undefer(Note.content)])
+    if not db_note or db_note.deleted_at:
+        raise HTTPException(status_code=404, detail="Note not found")
+    if current_user.role == "parent" or db_note.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    stale = HTTPException(status_code=409, detail="Note content has changed since base_version; reload it and reapply the edits")
+    if db_note.content_version != patch.base_version:
+        raise stale
+    try:
+        version = await patch_content(db, db_note, patch.base_version, [(edit.start, edit.end, edit.text) for edit in patch.edits])
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    if version is None:
+        raise stale
+    # Counters are unchanged, but the listing and its ETag are not
+    await apply_stats_delta(db, db_note.owner_id)
+    await db.commit()
+    await broker.publish(note_event("updated", db_note))
+    return db_note
+
+@router.delete("/notes/{note_id}")
+async def delete_note(note_id: int, current_user: Principal = Depends(get_current_user), repository: Repository = Depends(get_repository)):
+    note = await repository.get_note(note_id, content=False)
+    if not note:
+        raise HTTPException(status_code=404, detail="Note not found")
+    if current_user.role == "parent" or note.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    await repository.delete_note(note)
+    await broker.publish(note_event("deleted", note))
+    return {"message": "Note deleted"}
+
+# Tag endpoints
+@router.get("/tags")
+async def get_tags(child_id: Optional[int] = None, current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    return await tag_counts(db, visible_owner_ids(current_user, child_id))
+
+# Background jobs still pending for the visible notes (tag index updates)
+@router.get("/jobs", response_model=JobQueueOut)
+async def get_jobs(child_id: Optional[int] = None, current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    return await queue_stats(db, visible_owner_ids(current_user, child_id))
+
+# Dashboard endpoint
+@router.get("/dashboard")
+async def get_dashboard(current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    # Served from user_stats; nothing is counted at request time
+    return await dashboard(db, visible_owner_ids(current_user))
+
+# Sync endpoint
+@router.get("/sync", response_model=SyncOut)
+async def sync(since: Optional[str] = None, child_id: Optional[int] = None, limit: int = Query(DEFAULT_SYNC_LIMIT, ge=1, le=MAX_SYNC_LIMIT), current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    # Same visibility rules as get_notes; pass the returned cursor back as `since`
+    return await changes_since(db, visible_owner_ids(current_user, child_id), since, limit)
+
+# Event stream
+@router.get("/events")
+async def events(child_id: Optional[int] = None, current_user: Principal = Depends(get_stream_user)):
+    # Same visibility rules as get_notes; the stream itself never touches the database
+    return StreamingResponse(
+        event_stream(broker, visible_owner_ids(current_user, child_id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Backup: the stream endpoints authenticate like /events and open their own sessions
+@router.get("/export")
+async def export_notes(format: str = Query("ndjson", pattern="^(ndjson|zip)$"), child_id: Optional[int] = None, current_user: Principal = Depends(get_stream_user)):
+    owner_ids = visible_owner_ids(current_user, child_id)
+    filename = f"notenext-{datetime.utcnow():%Y%m%d-%H%M%S}.{format}"
+    return StreamingResponse(
+        export_zip(owner_ids) if format == "zip" else export_ndjson(owner_ids),
+        media_type="application/zip" if format == "zip" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.post("/import", response_model=ImportJobOut)
+async def import_notes(request: Request, job_id: Optional[int] = None, current_user: Principal = Depends(get_stream_user)):
+    # The body is an NDJSON export, read as it arrives; ?job_id= resumes a failed upload
+    if current_user.role == "parent":
+        raise HTTPException(status_code=403, detail="Parents cannot import notes")
+    
+    job = await start_import(current_user.id, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    if job.status == "complete":
+        raise HTTPException(status_code=409, detail="Import job is already complete")
+    try:
+        job = await run_import(job, request.stream())
+    except ImportConflict:
+        raise HTTPException(status_code=409, detail="Another upload of this import job is in progress")
+    if job.status == "failed":
+        raise HTTPException(status_code=400, detail=f"Import job {job.id} stopped after {job.lines_done} lines: {job.error}")
+    return job
+
+@router.get("/import/{job_id}", response_model=ImportJobOut)
+async def get_import(job_id: int, current_user: Principal = Depends(get_current_user)):
+    job = await import_status(current_user.id, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+@router.get("/children", response_model=List[UserSummary])
+async def get_children(request: Request, response: Response, current_user: Principal = Depends(get_current_user), repository: Repository = Depends(get_read_repository)):
+    if current_user.role != "parent":
+        raise HTTPException(status_code=403, detail="Only parents can access this endpoint")
+    
+    # The set of children only changes when the auth version is bumped
+    conditional_response(request, response, make_etag(request.url.path, current_user.id, current_user.version, current_user.child_ids))
+    return await repository.children(current_user.id)
+
+@router.get("/available-children", response_model=List[UserSummary])
+async def get_available_children(repository: Repository = Depends(get_read_repository)):
+    # Get children without parents
+    return await repository.unlinked_children()
+
+async def startup():
+    if MAINTENANCE_ENABLED:
+        scheduler.start()
+    workers.start()
+
+async def shutdown():
+    await workers.stop()
+    await scheduler.stop()
+    password_hasher.shutdown()
+    await broker.close()
+    await dispose_engines()
+
+# Prometheus scrape endpoint
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def create_app(prefix: str = "", cors_origins: List[str] = DEFAULT_CORS_ORIGINS, root_message: str = "NoteNext API is running") -> FastAPI:
+    """Build the API with every route under `prefix`.
+
+    main.py serves it at the root for local development; vercel_main.py mounts
+    it under /api, where Vercel routes the backend.
+    """
+    app = FastAPI(title="NoteNext API", default_response_class=ORJSONResponse)
+    
+    # Innermost, so shed requests still get CORS headers and show up in /metrics
+    app.add_middleware(LoadShedMiddleware, exempt=[prefix + "/events", prefix + "/metrics"])
+    
+    # Lets background maintenance wait for a quiet moment; queued requests count as busy
+    app.add_middleware(ActivityMiddleware, exempt=[prefix + "/events", prefix + "/metrics"])
+    
+    # CORS middleware for the React frontend
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=cors_origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    
+    # Per-route latency and SQL statement counts, served at /metrics
+    app.add_middleware(MetricsMiddleware)
+    
+    # Token buckets per user (or per IP before sign-in), configured per route
+    app.include_router(router, prefix=prefix, dependencies=[Depends(RateLimiter(prefix=prefix))])
+    app.add_event_handler("startup", startup)
+    app.add_event_handler("shutdown", shutdown)
+    
+    @app.get(prefix + "/")
+    async def root():
+        return {"message": root_message}
+    
+    return app
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Script to run every ready background job until the queues are empty.
+
+The API runs jobs itself (JOB_WORKERS); run this where it does not, e.g. from
+cron on serverless deployments with JOB_WORKERS=0. Jobs that are leased by a
+running worker, or waiting to be retried, are left to a later run. With
+DB_SHARD_DIR set it drains every family's database in turn.
+
+--retry-dead first puts dead-lettered jobs back in the queue with a fresh
+set of attempts, e.g. once the bug that killed them is fixed.
+
+    python run_jobs.py [--retry-dead]
+"""
+import argparse
+import asyncio
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import update
+from database import DB_SHARD_DIR, Job, dispose_engines, enter_family, family_ids, write_session
+from jobs import claim, run_jobs
+
+async def retry_dead():
+    async with write_session() as db:
+        result = await db.execute(
+            update(Job).where(Job.dead_at.isnot(None)).values(dead_at=None, attempts=0, run_after=datetime.utcnow())
+        )
+        await db.commit()
+    return result.rowcount
+
+async def drain():
+    outcomes = Counter()
+    while True:
+        async with write_session() as db:
+            jobs = await claim(db)
+            await db.commit()
+        if not jobs:
+            return outcomes
+        outcomes.update(await run_jobs(jobs))
+
+async def main(requeue):
+    outcomes, requeued = Counter(), 0
+    for family_id in await family_ids() if DB_SHARD_DIR else [None]:
+        await enter_family(family_id)
+        if requeue:
+            requeued += await retry_dead()
+        outcomes += await drain()
+    await dispose_engines()
+    if requeue:
+        print(f"Requeued {requeued} dead jobs")
+    print(f"Ran {sum(outcomes.values())} jobs: " + (", ".join(f"{count} {outcome}" for outcome, count in sorted(outcomes.items())) or "none ready"))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--retry-dead", action="store_true", help="requeue dead-lettered jobs first")
+    args = parser.parse_args()
+    asyncio.run(main(args.retry_dead))
@@ -0,0 +1,104 @@
+"""
+Response models shared by the API modules.
+
+Endpoints declare these as response_model so FastAPI serializes rows through
+pydantic-core instead of walking SQLAlchemy instances with jsonable_encoder.
+"""
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import HTTPException
+from pydantic import BaseModel, ConfigDict
+
+class NoteOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    # Everything but id is optional so GET /notes?fields= can return a projection
+    id: int
+    title: Optional[str] = None
+    content: Optional[str] = None
+    content_version: Optional[int] = None
+    tags: Optional[str] = None
+    is_todo: Optional[bool] = None
+    is_completed: Optional[bool] = None
+    folder_id: Optional[int] = None
+    owner_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class ContentVersionOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    content_version: int
+    updated_at: datetime
+
+class FolderOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: Optional[str] = None
+    owner_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+class UserSummary(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    username: str
+    email: Optional[str] = None
+
+class NotePage(BaseModel):
+    items: List[NoteOut]
+    next_cursor: Optional[str] = None
+
+class FolderPage(BaseModel):
+    items: List[FolderOut]
+    next_cursor: Optional[str] = None
+
+class ImportJobOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    status: str
+    lines_done: int
+    folders_imported: int
+    notes_imported: int
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+class JobQueueOut(BaseModel):
+    pending: int  # Not yet applied, including ones waiting to be retried
+    retrying: int  # Pending after at least one failure
+    dead: int  # Gave up after JOB_MAX_ATTEMPTS
+    lag_seconds: float  # Age of the oldest pending job
+
+class SyncOut(BaseModel):
+    notes: List[NoteOut]
+    folders: List[FolderOut]
+    deleted_notes: List[int]
+    deleted_folders: List[int]
+    cursor: str
+    has_more: bool
+    reset: bool
+
+class BatchResult(BaseModel):
+    id: Optional[int] = None
+    status: int
+    note: Optional[NoteOut] = None
+    detail: Optional[str] = None
+
+# Columns GET /notes?fields= may ask for
+NOTE_FIELDS = tuple(NoteOut.model_fields)
+
+def parse_fields(fields: str):
+    """Validate a comma-separated ?fields= list of note columns.
+
+    id and updated_at are always included because the page cursor is built from them.
+    """
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in NOTE_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return [name for name in NOTE_FIELDS if name in names or name in ("id", "updated_at")]
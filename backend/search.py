@@ -0,0 +1,56 @@
+"""
+Ranked full-text search over the notes_fts index
+"""
+import re
+from typing import List, Optional
+
+from sqlalchemy import bindparam, text, Boolean, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+# bm25 column weights for (title, content, tags): title and tag hits rank higher
+BM25_WEIGHTS = "10.0, 1.0, 5.0"
+
+SEARCH_SQL = f"""
+    SELECT notes.id, notes.title, notes.tags, notes.is_todo, notes.is_completed,
+           notes.folder_id, notes.owner_id, notes.created_at, notes.updated_at,
+           highlight(notes_fts, 0, '<mark>', '</mark>') AS title_highlight,
+           snippet(notes_fts, -1, '<mark>', '</mark>', '…', 16) AS snippet,
+           bm25(notes_fts, {BM25_WEIGHTS}) AS rank
+    FROM notes_fts
+    JOIN notes ON notes.id = notes_fts.rowid
+    WHERE notes_fts MATCH :match
+      AND notes.owner_id IN :owner_ids
+      AND notes.deleted_at IS NULL
+      {{folder_filter}}
+    ORDER BY rank
+    LIMIT :limit
+"""
+
+def build_match_query(q: str) -> Optional[str]:
+    """Turn free text into an FTS5 query: every word must match, as a prefix.
+
+    Words are quoted so user input can never be parsed as FTS5 syntax.
+    """
+    words = re.findall(r"\w+", q)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+async def search_notes(db: AsyncSession, owner_ids: List[int], q: str, folder_id: Optional[int] = None, limit: int = DEFAULT_SEARCH_LIMIT):
+    match = build_match_query(q)
+    if not match or not owner_ids:
+        return []
+
+    folder_filter = "AND notes.folder_id = :folder_id" if folder_id else ""
+    statement = (
+        text(SEARCH_SQL.format(folder_filter=folder_filter))
+        .bindparams(bindparam("owner_ids", expanding=True))
+        .columns(is_todo=Boolean, is_completed=Boolean, created_at=DateTime, updated_at=DateTime)
+    )
+    params = {"match": match, "owner_ids": owner_ids, "limit": limit}
+    if folder_id:
+        params["folder_id"] = folder_id
+    return [dict(row) for row in (await db.execute(statement, params)).mappings()]
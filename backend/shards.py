@@ -0,0 +1,163 @@
+"""
+Family placement for partitioned storage (DB_SHARD_DIR).
+
+Every user belongs to one family: a parent and their children, or a child
+who has not been linked to a parent yet. The directory's users.family_id
+names it, and the family's folders, notes, tags, stats and import jobs live
+in DB_SHARD_DIR/family-<id>.db together with a copy of its members' user
+rows (without password hashes) for the queries that join on users.
+
+A family takes the id of its first member. A child who signs up alone
+starts their own; a parent who links children joins the first child's
+family, and every other linked child's data moves into it. Each family
+numbers its rows independently, so moved folders and notes get new ids,
+and the target's change sequence and sync horizon are raised past both
+databases' so every client of the family gets a full snapshot on its next
+GET /sync. Import jobs are not moved. Queued tag index jobs are: they are
+queued again in the target under the notes' new ids.
+
+A move copies first, then the directory change is committed, then the old
+copy is deleted, so a failure at any point leaves the data readable where
+the directory says it is. A copy that never got committed is replaced by
+the next attempt.
+"""
+import asyncio
+from typing import Dict, List, Tuple
+
+import orjson
+from sqlalchemy import insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import DB_SHARD_DIR, create_sync_engine, ensure_family_schema, shard_path, shard_url, User, Folder, Job, Note, UserStats
+from jobs import TAG_JOB_SIZE
+
+# Mirrored into the family database; credentials stay in the directory only
+MIRRORED_COLUMNS = [column.name for column in User.__table__.columns if column.name != "hashed_password"]
+
+def mirrored(user: User) -> Dict:
+    return {name: getattr(user, name) for name in MIRRORED_COLUMNS}
+
+def mirror_users(conn, members: List[Dict]):
+    """Insert or refresh family members' user rows in the family database `conn` is on"""
+    columns = ", ".join(MIRRORED_COLUMNS)
+    values = ", ".join(f":{name}" for name in MIRRORED_COLUMNS)
+    for member in members:
+        conn.execute(text(f"INSERT OR REPLACE INTO users ({columns}) VALUES ({values})"), member)
+
+def _copy_statement(table, owner_column: str, replace: Dict[str, str]) -> str:
+    # Every column but change_seq, which the target's triggers stamp afresh
+    columns = [column.name for column in table.columns if column.name != "change_seq"]
+    values = ", ".join(replace.get(name, name) for name in columns)
+    return f"INSERT INTO main.{table.name} ({', '.join(columns)}) SELECT {values} FROM src.{table.name} WHERE {owner_column} = :owner_id"
+
+def delete_owner(conn, owner_id: int, schema: str = "main"):
+    """Delete an owner's data and user row from one family database"""
+    params = {"owner_id": owner_id}
+    conn.execute(text(f"DELETE FROM {schema}.import_folders WHERE job_id IN (SELECT id FROM {schema}.import_jobs WHERE owner_id = :owner_id)"), params)
+    for table, owner_column in (("import_jobs", "owner_id"), ("jobs", "owner_id"), ("note_tags", "owner_id"), ("notes", "owner_id"),
+                                ("folders", "owner_id"), ("user_stats", "user_id"), ("users", "id")):
+        conn.execute(text(f"DELETE FROM {schema}.{table} WHERE {owner_column} = :owner_id"), params)
+
+def copy_owner(conn, owner_id: int, source_family: int):
+    """Copy an owner's folders, notes, tags, stats and tag jobs from `source_family` into the database `conn` is on.
+
+    Ids are offset past the target's highest, and the change sequence and
+    sync horizon move past both databases'. Commits; SQLite only attaches
+    the source outside a transaction.
+    """
+    conn.execute(text("ATTACH DATABASE :path AS src"), {"path": shard_path(source_family)})
+    try:
+        # Leftovers of an earlier copy whose move was never committed
+        delete_owner(conn, owner_id)
+        params = {
+            "owner_id": owner_id,
+            "folder_offset": conn.scalar(text("SELECT coalesce(max(id), 0) FROM main.folders")),
+            "note_offset": conn.scalar(text("SELECT coalesce(max(id), 0) FROM main.notes")),
+        }
+        conn.execute(text(_copy_statement(Folder.__table__, "owner_id", {"id": "id + :folder_offset"})), params)
+        conn.execute(text(_copy_statement(Note.__table__, "owner_id", {"id": "id + :note_offset", "folder_id": "folder_id + :folder_offset"})), params)
+
+        # Tags are matched by name; each database has its own tag ids
+        conn.execute(text("""
+            INSERT OR IGNORE INTO main.tags (name)
+            SELECT DISTINCT tags.name FROM src.note_tags JOIN src.tags ON tags.id = note_tags.tag_id
+            WHERE note_tags.owner_id = :owner_id"""), params)
+        conn.execute(text("""
+            INSERT INTO main.note_tags (note_id, tag_id, owner_id)
+            SELECT note_tags.note_id + :note_offset, target.id, note_tags.owner_id
+            FROM src.note_tags JOIN src.tags ON tags.id = note_tags.tag_id JOIN main.tags AS target ON target.name = tags.name
+            WHERE note_tags.owner_id = :owner_id"""), params)
+        # Tag syncs still queued, retrying or dead name the old note ids; queue them afresh under the new ones
+        note_ids = sorted({
+            note_id + params["note_offset"]
+            for payload in conn.scalars(text("SELECT payload FROM src.jobs WHERE owner_id = :owner_id AND kind = 'note_tags'"), params)
+            for note_id in orjson.loads(payload)["note_ids"]
+        })
+        if note_ids:
+            conn.execute(insert(Job.__table__), [
+                {"kind": "note_tags", "owner_id": owner_id, "payload": orjson.dumps({"note_ids": note_ids[start:start + TAG_JOB_SIZE]}).decode()}
+                for start in range(0, len(note_ids), TAG_JOB_SIZE)
+            ])
+        # The ids changed, so ETags issued for the old listings must not match
+        conn.execute(text(_copy_statement(UserStats.__table__, "user_id", {"collection_version": "collection_version + 1"})), params)
+
+        conn.execute(text("""
+            UPDATE main.change_sequence
+            SET value = max(value, (SELECT value FROM src.change_sequence WHERE id = 1)) + 1 WHERE id = 1"""))
+        conn.execute(text("UPDATE main.change_sequence SET horizon = value WHERE id = 1"))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute(text("DETACH DATABASE src"))
+
+def join_family(family_id: int, members: List[Dict], moves: List[Tuple[int, int]]):
+    """Copy each moving (owner id, old family) into `family_id` and mirror its members there"""
+    for _, source_family in moves:
+        ensure_family_schema(source_family)
+    ensure_family_schema(family_id)
+    family_engine = create_sync_engine(shard_url(family_id))
+    try:
+        with family_engine.connect() as conn:
+            for owner_id, source_family in moves:
+                copy_owner(conn, owner_id, source_family)
+            mirror_users(conn, members)
+            conn.commit()
+    finally:
+        family_engine.dispose()
+
+def leave_family(moves: List[Tuple[int, int]]):
+    """Delete moved owners' old copies once the directory points at their new family"""
+    for owner_id, source_family in moves:
+        source_engine = create_sync_engine(shard_url(source_family))
+        try:
+            with source_engine.begin() as conn:
+                delete_owner(conn, owner_id)
+        finally:
+            source_engine.dispose()
+
+async def place_user(db: AsyncSession, user: User, children: List[User]) -> List[Tuple[int, int]]:
+    """Give a new user a family; `children` are the existing children they link.
+
+    Sets family_id on the user and the children, copies the data of children
+    from other families and mirrors the members into the family database.
+    Returns the moves to pass to finish_moves() once `db` is committed; does
+    nothing without DB_SHARD_DIR.
+    """
+    if not DB_SHARD_DIR:
+        return []
+    family_id = None
+    if user.parent_id:
+        family_id = await db.scalar(select(User.family_id).where(User.id == user.parent_id))
+    family_id = family_id or next((child.family_id for child in children if child.family_id), user.id)
+
+    moves = [(child.id, child.family_id) for child in children if child.family_id not in (None, family_id)]
+    for member in (user, *children):
+        member.family_id = family_id
+    await asyncio.to_thread(join_family, family_id, [mirrored(member) for member in (user, *children)], moves)
+    return moves
+
+async def finish_moves(moves: List[Tuple[int, int]]):
+    if moves:
+        await asyncio.to_thread(leave_family, moves)
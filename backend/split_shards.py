@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Script to split a single database into a directory and one database per family.
+
+Reads the database at DATABASE_URL, bringing its schema up to date first,
+and writes --directory, holding every user with family_id set, and one
+family-<id>.db per family under --shard-dir. A family is a parent and
+their children, or a child without a parent. Ids, change sequence numbers,
+tombstones, import jobs and queued background jobs are copied as they are,
+so tokens, note ids, ETags, sync cursors, resumable imports and pending tag
+index updates all stay valid.
+
+Stop the app first, then start it with DATABASE_URL pointing at the new
+directory and DB_SHARD_DIR at --shard-dir. The single database is left as
+it was.
+
+    python split_shards.py --directory directory.db --shard-dir shards
+"""
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+
+from sqlalchemy import insert, select, text
+
+from database import Base, User, create_schema, create_sync_engine, SQLALCHEMY_DATABASE_URL
+from shards import MIRRORED_COLUMNS
+
+# Tables copied per family, and how each one's rows are matched to the family's members
+FAMILY_TABLES = [
+    ("folders", "owner_id IN ({members})"),
+    ("notes", "owner_id IN ({members})"),
+    ("tags", "id IN (SELECT tag_id FROM src.note_tags WHERE owner_id IN ({members}))"),
+    ("note_tags", "owner_id IN ({members})"),
+    ("user_stats", "user_id IN ({members})"),
+    ("tombstones", "owner_id IN ({members})"),
+    ("import_jobs", "owner_id IN ({members})"),
+    ("import_folders", "job_id IN (SELECT id FROM src.import_jobs WHERE owner_id IN ({members}))"),
+    ("jobs", "owner_id IN ({members})"),
+    ("change_sequence", "id = 1"),
+]
+
+def family_of(user, roles):
+    if user.role == "parent":
+        return user.id
+    return user.parent_id if roles.get(user.parent_id) == "parent" else user.id
+
+def copy_family(source_path, shard_path, member_ids):
+    members = ", ".join(str(member_id) for member_id in sorted(member_ids))
+    family_engine = create_sync_engine("sqlite:///" + shard_path)
+    try:
+        # Tables first and the triggers after the copy, so rows keep their change_seq
+        with family_engine.connect() as conn:
+            conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+            Base.metadata.create_all(bind=conn)
+            conn.commit()
+            conn.execute(text("ATTACH DATABASE :path AS src"), {"path": source_path})
+            for table_name, where in FAMILY_TABLES:
+                columns = ", ".join(column.name for column in Base.metadata.tables[table_name].columns)
+                conn.execute(text(f"INSERT INTO main.{table_name} ({columns}) SELECT {columns} FROM src.{table_name} WHERE {where.format(members=members)}"))
+            mirrored = ", ".join(MIRRORED_COLUMNS)
+            conn.execute(text(f"INSERT INTO main.users ({mirrored}) SELECT {mirrored} FROM src.users WHERE id IN ({members})"))
+            conn.commit()
+            conn.execute(text("DETACH DATABASE src"))
+        create_schema(family_engine)
+    finally:
+        family_engine.dispose()
+
+def split(directory_path, shard_dir):
+    source_path = SQLALCHEMY_DATABASE_URL.split("///", 1)[1]
+    for path in (directory_path, shard_dir):
+        if os.path.exists(path) and (os.path.isfile(path) or os.listdir(path)):
+            sys.exit(f"{path} already exists; split into a new directory database and an empty shard directory")
+    os.makedirs(shard_dir, exist_ok=True)
+
+    source_engine = create_sync_engine()
+    create_schema(source_engine)
+    with source_engine.connect() as conn:
+        users = conn.execute(select(User.__table__)).all()
+    source_engine.dispose()
+
+    roles = {user.id: user.role for user in users}
+    families = defaultdict(list)
+    for user in users:
+        families[family_of(user, roles)].append(user.id)
+    family_ids = {member_id: family_id for family_id, member_ids in families.items() for member_id in member_ids}
+
+    directory_engine = create_sync_engine("sqlite:///" + directory_path)
+    create_schema(directory_engine)
+    with directory_engine.begin() as conn:
+        rows = [{**user._mapping, "family_id": family_ids[user.id]} for user in users]
+        if rows:
+            conn.execute(insert(User.__table__), rows)
+    directory_engine.dispose()
+    print(f"Wrote {len(users)} users in {len(families)} families to {directory_path}")
+
+    began = time.perf_counter()
+    for done, (family_id, member_ids) in enumerate(sorted(families.items()), 1):
+        copy_family(source_path, os.path.join(shard_dir, f"family-{family_id}.db"), member_ids)
+        if done % 1000 == 0 or done == len(families):
+            print(f"  {done}/{len(families)} family databases ({time.perf_counter() - began:.0f} s)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--directory", required=True, help="path of the directory database to create")
+    parser.add_argument("--shard-dir", required=True, help="empty directory for the family databases")
+    args = parser.parse_args()
+    split(args.directory, args.shard_dir)
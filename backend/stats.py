@@ -0,0 +1,120 @@
+"""
+Per-user counters behind the parent dashboard.
+
+Every write that changes a user's notes or folders applies a delta to that
+user's user_stats row in the same transaction, so the dashboard is a single
+primary-key lookup per child instead of counting notes on every request.
+check_stats.py recomputes the counters from scratch to catch drift.
+"""
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import and_, case, func, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import User, Folder, Note, UserStats
+
+COUNTERS = ("note_count", "folder_count", "open_todo_count", "completed_todo_count")
+
+def note_counters(note):
+    """The counters a single note contributes to its owner's stats"""
+    return {
+        "note_count": 1,
+        "open_todo_count": int(bool(note.is_todo) and not note.is_completed),
+        "completed_todo_count": int(bool(note.is_todo) and bool(note.is_completed)),
+    }
+
+def counter_delta(before=None, after=None):
+    """Difference between two counter dicts; a missing side counts as zero"""
+    before, after = before or {}, after or {}
+    return {name: after.get(name, 0) - before.get(name, 0) for name in COUNTERS}
+
+def total_delta(pairs):
+    """Sum of counter_delta over (before, after) pairs, for writes that touch many notes"""
+    total = dict.fromkeys(COUNTERS, 0)
+    for before, after in pairs:
+        for name, change in counter_delta(before, after).items():
+            total[name] += change
+    return total
+
+async def apply_stats_delta(db: AsyncSession, user_id: int, **delta):
+    """Add `delta` to the user's counters, stamp their last activity and bump
+    their collection version.
+
+    Runs as one upsert, so concurrent writers never lose an increment and the
+    row is created on the user's first write.
+    """
+    values = {name: delta.get(name, 0) for name in COUNTERS}
+    statement = insert(UserStats).values(user_id=user_id, last_activity_at=datetime.utcnow(), collection_version=1, **values)
+    statement = statement.on_conflict_do_update(
+        index_elements=[UserStats.user_id],
+        set_={
+            **{name: getattr(UserStats, name) + statement.excluded[name] for name in COUNTERS},
+            "last_activity_at": statement.excluded.last_activity_at,
+            "collection_version": UserStats.collection_version + 1,
+        },
+    )
+    await db.execute(statement)
+
+async def bump_collection_versions(db: AsyncSession, user_ids):
+    """Bump the users' collection versions without touching their counters or
+    last activity, for background changes to what their listings return"""
+    if user_ids:
+        await db.execute(
+            update(UserStats)
+            .where(UserStats.user_id.in_(sorted(user_ids)))
+            .values(collection_version=UserStats.collection_version + 1)
+        )
+
+def computed_stats():
+    """Counters recomputed from the live notes and folders, one row per user"""
+    note_totals = (
+        select(
+            Note.owner_id,
+            func.count().label("note_count"),
+            func.sum(case((and_(Note.is_todo, ~Note.is_completed), 1), else_=0)).label("open_todo_count"),
+            func.sum(case((and_(Note.is_todo, Note.is_completed), 1), else_=0)).label("completed_todo_count"),
+            func.max(Note.updated_at).label("last_note_at"),
+        )
+        .where(Note.deleted_at.is_(None))
+        .group_by(Note.owner_id)
+        .subquery()
+    )
+    folder_totals = (
+        select(Folder.owner_id, func.count().label("folder_count"), func.max(Folder.created_at).label("last_folder_at"))
+        .where(Folder.deleted_at.is_(None))
+        .group_by(Folder.owner_id)
+        .subquery()
+    )
+    return (
+        select(
+            User.id.label("user_id"),
+            func.coalesce(note_totals.c.note_count, 0).label("note_count"),
+            func.coalesce(folder_totals.c.folder_count, 0).label("folder_count"),
+            func.coalesce(note_totals.c.open_todo_count, 0).label("open_todo_count"),
+            func.coalesce(note_totals.c.completed_todo_count, 0).label("completed_todo_count"),
+            # Scalar max() is NULL if either side is, so fall back to the other side
+            func.max(
+                func.coalesce(note_totals.c.last_note_at, folder_totals.c.last_folder_at),
+                func.coalesce(folder_totals.c.last_folder_at, note_totals.c.last_note_at),
+            ).label("last_activity_at"),
+        )
+        .outerjoin(note_totals, note_totals.c.owner_id == User.id)
+        .outerjoin(folder_totals, folder_totals.c.owner_id == User.id)
+        .order_by(User.id)
+    )
+
+async def dashboard(db: AsyncSession, owner_ids: List[int]):
+    rows = await db.execute(
+        select(User.id, User.username, UserStats)
+        .outerjoin(UserStats, UserStats.user_id == User.id)
+        .where(User.id.in_(owner_ids))
+        .order_by(User.username)
+    )
+    return [{
+        "id": user_id,
+        "username": username,
+        **{name: getattr(stats, name) if stats else 0 for name in COUNTERS},
+        "last_activity_at": stats.last_activity_at if stats else None,
+    } for user_id, username, stats in rows]
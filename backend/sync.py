@@ -0,0 +1,130 @@
+"""
+Delta sync over the change_seq columns and the tombstone log.
+
+A client keeps the opaque cursor returned by GET /sync and sends it back as
+`since`; the response holds only the notes and folders written, and the ids
+deleted, after that point. Deletes are soft: a deleted row stays behind with
+deleted_at set and a fresh change_seq, and is reported by id. Soft-deleted
+rows, and the tombstones of rows removed outright, are purged once they are
+older than TOMBSTONE_RETENTION_DAYS. A cursor from before the purge horizon,
+or one issued for a different set of owners (a parent linked another child),
+gets a full snapshot with `reset: true` so the client replaces its local copy.
+"""
+import base64
+import binascii
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer
+
+from database import ChangeSequence, Folder, Note, Tombstone
+
+DEFAULT_SYNC_LIMIT = 500
+MAX_SYNC_LIMIT = 5000
+TOMBSTONE_RETENTION_DAYS = float(os.getenv("TOMBSTONE_RETENTION_DAYS", "30"))
+
+def _owners_key(owner_ids: List[int]) -> str:
+    return hashlib.blake2b(repr(sorted(owner_ids)).encode(), digest_size=6).hexdigest()
+
+def encode_sync_cursor(seq: int, owner_ids: List[int]) -> str:
+    raw = json.dumps([seq, _owners_key(owner_ids)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_sync_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        seq, owners_key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return int(seq), str(owners_key)
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def changes_since(db: AsyncSession, owner_ids: List[int], since: Optional[str] = None, limit: int = DEFAULT_SYNC_LIMIT):
+    # Read the sequence first: writes committed after this point get higher numbers
+    # and are left for the next call, even if the queries below already see them
+    current, horizon = (await db.execute(select(ChangeSequence.value, ChangeSequence.horizon).where(ChangeSequence.id == 1))).one()
+    seq, reset = 0, True
+    if since:
+        seq, owners_key = decode_sync_cursor(since)
+        reset = owners_key != _owners_key(owner_ids) or seq < horizon
+        if reset:
+            seq = 0
+
+    # Each stream is read in change_seq order from its (owner_id, change_seq) index
+    def window(model):
+        statement = select(model).where(model.owner_id.in_(owner_ids), model.change_seq > seq, model.change_seq <= current)
+        if reset and model is not Tombstone:
+            # A snapshot has nothing to delete on the client
+            statement = statement.where(model.deleted_at.is_(None))
+        return statement.order_by(model.change_seq).limit(limit + 1)
+    notes = (await db.scalars(window(Note).options(undefer(Note.content)))).all()
+    folders = (await db.scalars(window(Folder))).all()
+    tombstones = [] if reset else (await db.scalars(window(Tombstone))).all()
+
+    changes = sorted([*notes, *folders, *tombstones], key=lambda row: row.change_seq)
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    seq = changes[-1].change_seq if has_more else max(seq, current)
+
+    # (kind, id) of every change: tombstones and soft-deleted rows are deletes
+    def key(row):
+        if isinstance(row, Tombstone):
+            return row.kind, row.object_id, True
+        return "note" if isinstance(row, Note) else "folder", row.id, row.deleted_at is not None
+    keyed = [key(row) for row in changes]
+    # Ids are reused after the highest row is purged; a live row always postdates its tombstone
+    live = {(kind, object_id) for kind, object_id, deleted in keyed if not deleted}
+    deleted = [(kind, object_id) for kind, object_id, deleted in keyed if deleted and (kind, object_id) not in live]
+    return {
+        "notes": [row for row in changes if isinstance(row, Note) and row.deleted_at is None],
+        "folders": [row for row in changes if isinstance(row, Folder) and row.deleted_at is None],
+        "deleted_notes": [object_id for kind, object_id in deleted if kind == "note"],
+        "deleted_folders": [object_id for kind, object_id in deleted if kind == "folder"],
+        "cursor": encode_sync_cursor(seq, owner_ids),
+        "has_more": has_more,
+        "reset": reset,
+    }
+
+async def _raise_horizon(db: AsyncSession, horizon: int):
+    await db.execute(update(ChangeSequence).where(ChangeSequence.id == 1).values(horizon=func.max(ChangeSequence.horizon, horizon)))
+
+async def compact_tombstones(db: AsyncSession, retention_days: float = TOMBSTONE_RETENTION_DAYS, batch_size: Optional[int] = None):
+    """Drop tombstones past the retention window and advance the horizon.
+
+    Removes at most `batch_size` tombstones, oldest first, if given. Returns
+    the number removed. Call inside a write session and commit.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    expired = select(Tombstone.change_seq).where(Tombstone.deleted_at < cutoff).order_by(Tombstone.change_seq).limit(batch_size)
+    horizon = await db.scalar(select(func.max(expired.subquery().c.change_seq)))
+    if horizon is None:
+        return 0
+    result = await db.execute(delete(Tombstone).where(Tombstone.change_seq <= horizon))
+    await _raise_horizon(db, horizon)
+    return result.rowcount
+
+async def purge_deleted(db: AsyncSession, model, retention_days: float = TOMBSTONE_RETENTION_DAYS, batch_size: Optional[int] = None):
+    """Remove soft-deleted notes or folders (`model`) past the retention window and advance the horizon.
+
+    Clients that synced after the soft delete already dropped the rows; older
+    cursors now predate the horizon and get a snapshot. Same batching and
+    return value as compact_tombstones.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    expired = (
+        select(model.id, model.change_seq)
+        .where(model.deleted_at.isnot(None), model.deleted_at < cutoff)
+        .order_by(model.change_seq)
+        .limit(batch_size)
+    )
+    rows = (await db.execute(expired)).all()
+    if not rows:
+        return 0
+    await db.execute(delete(model).where(model.id.in_([row.id for row in rows])), execution_options={"synchronize_session": False})
+    await _raise_horizon(db, max(row.change_seq for row in rows))
+    return len(rows)
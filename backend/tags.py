@@ -0,0 +1,109 @@
+"""
+Normalized tag index maintained alongside the comma-separated Note.tags string.
+
+Writes no longer touch the index themselves: they enqueue a note_tags job
+(jobs.py) and a worker runs sync_note_tags shortly after the write commits.
+"""
+from collections import defaultdict
+from typing import List, Optional
+
+from sqlalchemy import bindparam, delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import Note, Tag, NoteTag
+from stats import bump_collection_versions
+
+def parse_tags(tags: Optional[str]) -> List[str]:
+    """Split a comma-separated tag string into unique, normalized names"""
+    names = []
+    for name in (tags or "").split(","):
+        name = name.strip().lower()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+async def _tag_ids(db: AsyncSession, names: List[str]):
+    await db.execute(insert(Tag).on_conflict_do_nothing(index_elements=["name"]), [{"name": name} for name in names])
+    return dict((await db.execute(select(Tag.name, Tag.id).where(Tag.name.in_(names)))).all())
+
+async def update_note_tags(db: AsyncSession, note, previous_tags: Optional[str] = None):
+    """Bring note_tags in line with note.tags, touching only the tags that changed.
+
+    `previous_tags` is the note's tag string before the write (None for a new note).
+    The note must already have an id, so flush before calling this for new notes.
+    """
+    await update_notes_tags(db, [(note.id, note.owner_id, previous_tags, note.tags)])
+
+async def update_notes_tags(db: AsyncSession, changes):
+    """update_note_tags for many notes with a fixed number of statements.
+
+    `changes` holds (note_id, owner_id, previous_tags, tags) tuples.
+    """
+    removed, added = [], []
+    for note_id, owner_id, previous_tags, tags in changes:
+        old = set(parse_tags(previous_tags))
+        new = set(parse_tags(tags))
+        removed += [(note_id, name) for name in old - new]
+        added += [(note_id, owner_id, name) for name in new - old]
+    if removed:
+        tag_ids = dict((await db.execute(select(Tag.name, Tag.id).where(Tag.name.in_({name for _, name in removed})))).all())
+        pairs = [{"note": note_id, "tag": tag_ids[name]} for note_id, name in removed if name in tag_ids]
+        if pairs:
+            await db.execute(
+                delete(NoteTag.__table__).where(NoteTag.note_id == bindparam("note"), NoteTag.tag_id == bindparam("tag")),
+                pairs,
+            )
+    if added:
+        tag_ids = await _tag_ids(db, sorted({name for _, _, name in added}))
+        await db.execute(
+            insert(NoteTag).on_conflict_do_nothing(),
+            [{"note_id": note_id, "tag_id": tag_ids[name], "owner_id": owner_id} for note_id, owner_id, name in added],
+        )
+
+async def sync_note_tags(db: AsyncSession, note_ids: List[int]):
+    """Bring note_tags in line with the notes' tags as they are now.
+
+    Compares against the index rather than a previous tag string, so running
+    it twice, late or out of order gives the same result. Deleted and purged
+    notes lose all their tags. Owners whose live notes' tags changed get a new
+    collection version, since their ?tag= listings changed with the index.
+    """
+    notes = {note.id: note for note in await db.execute(
+        select(Note.id, Note.owner_id, Note.tags).where(Note.id.in_(note_ids), Note.deleted_at.is_(None))
+    )}
+    indexed = defaultdict(list)
+    for note_id, name in await db.execute(
+        select(NoteTag.note_id, Tag.name).join(Tag, Tag.id == NoteTag.tag_id).where(NoteTag.note_id.in_(note_ids))
+    ):
+        indexed[note_id].append(name)
+    changes = [
+        (note_id, notes[note_id].owner_id if note_id in notes else None, ",".join(indexed[note_id]),
+         notes[note_id].tags if note_id in notes else None)
+        for note_id in set(note_ids)
+    ]
+    await update_notes_tags(db, changes)
+    # Deleted notes already left their owners' listings, and bumped the version, when they were deleted
+    await bump_collection_versions(db, {
+        owner_id for _, owner_id, previous_tags, tags in changes
+        if owner_id is not None and set(parse_tags(previous_tags)) != set(parse_tags(tags))
+    })
+
+def tagged_note_ids(tag: str, owner_ids: List[int]):
+    """Subquery of the ids of visible notes carrying `tag`"""
+    return (
+        select(NoteTag.note_id)
+        .join(Tag, Tag.id == NoteTag.tag_id)
+        .where(Tag.name == tag.strip().lower(), NoteTag.owner_id.in_(owner_ids))
+    )
+
+async def tag_counts(db: AsyncSession, owner_ids: List[int]):
+    rows = await db.execute(
+        select(Tag.name, func.count(NoteTag.note_id).label("count"))
+        .select_from(NoteTag)
+        .join(Tag, Tag.id == NoteTag.tag_id)
+        .where(NoteTag.owner_id.in_(owner_ids))
+        .group_by(Tag.name)
+        .order_by(func.count(NoteTag.note_id).desc(), Tag.name)
+    )
+    return [{"name": name, "count": count} for name, count in rows]
@@ -0,0 +1,88 @@
+"""
+Shared fixtures: every test gets its own scratch database and, through
+`client`, the app served in-process by TestClient.
+
+Settings are fixed before the backend modules are imported, because they
+read their environment at import time. Background workers, maintenance and
+rate limits are off so tests control when things happen; tests that need
+them build their own. Queued jobs are run with `client.run_jobs()`.
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+for name, value in {
+    "DATABASE_URL": "sqlite:///:memory:",  # Replaced per test by fresh_database
+    "BCRYPT_ROUNDS": "4",
+    "HASH_WORKERS": "0",
+    "JOB_WORKERS": "0",
+    "MAINTENANCE_ENABLED": "false",
+    "RATE_LIMIT_ENABLED": "false",
+    "SLOW_QUERY_MS": "100000",
+}.items():
+    os.environ.setdefault(name, value)
+
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+from auth import principal_cache
+
+@pytest.fixture(autouse=True)
+def fresh_database(tmp_path, monkeypatch):
+    """Point the engines at an empty database file in this test's directory"""
+    url = f"sqlite:///{tmp_path / 'notes.db'}"
+    monkeypatch.setattr(database, "SQLALCHEMY_DATABASE_URL", url)
+    monkeypatch.setattr(database, "ASYNC_DATABASE_URL", url.replace("sqlite://", "sqlite+aiosqlite://", 1))
+    monkeypatch.setattr(database, "_database", None)
+    monkeypatch.setattr(database, "_schema_ready", False)
+    monkeypatch.chdir(tmp_path)
+    # User ids start from 1 again, so principals cached by an earlier test would match
+    principal_cache.clear()
+    yield url
+    if database._database is not None:
+        database._database.engine.dispose()
+
+class Client(TestClient):
+    """TestClient with shortcuts for signing up and running queued jobs"""
+
+    def signup(self, username, role="child", child_ids=None, password="pw"):
+        """Sign `username` up and log in; returns their Authorization header"""
+        body = {"username": username, "email": f"{username}@example.com", "password": password, "role": role}
+        if child_ids:
+            body["child_ids"] = child_ids
+        assert self.post("/signup", json=body).status_code == 200
+        return self.login(username, password)
+
+    def login(self, username, password="pw"):
+        response = self.post("/login", json={"username": username, "password": password})
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    def run(self, fn, *args):
+        """Run async `fn(*args)` on the app's event loop, where its engines live"""
+        return self.portal.call(fn, *args)
+
+    def run_jobs(self):
+        """Apply every ready job, as the workers would; returns how many ran"""
+        from jobs import claim, run_jobs
+
+        async def drain():
+            count = 0
+            while True:
+                async with database.write_session() as db:
+                    jobs = await claim(db)
+                    await db.commit()
+                if not jobs:
+                    return count
+                count += len(await run_jobs(jobs))
+        return self.run(drain)
+
+@pytest.fixture
+def client():
+    from main import app
+
+    with Client(app) as test_client:
+        yield test_client
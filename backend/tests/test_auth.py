@@ -0,0 +1,66 @@
+from sqlalchemy import event
+
+import database
+from auth import Principal, create_access_token, principal_cache
+
+def user_queries(client, method, path, headers):
+    """Send a request; returns its response and the statements it ran against users"""
+    statements = []
+    def record(conn, cursor, statement, *args):
+        if "FROM users" in statement:
+            statements.append(" ".join(statement.split()))
+    engine = database.get_database().read_engine.sync_engine
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        response = client.request(method, path, headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return response, statements
+
+def test_cached_principal_needs_no_query(client):
+    kid = client.signup("kid")
+    client.get("/notes", headers=kid)
+    response, statements = user_queries(client, "GET", "/notes", kid)
+    assert response.status_code == 200 and statements == []
+
+def test_a_miss_trusts_current_claims_after_a_version_check(client):
+    client.signup("kid1"), client.signup("kid2")
+    parent = client.signup("mom", role="parent", child_ids=[1, 2])
+    principal_cache.clear()
+
+    response, statements = user_queries(client, "GET", "/folders", parent)
+    assert response.status_code == 200
+    # Only the version check: no user row by username, no children query
+    assert len(statements) == 1 and statements[0].startswith("SELECT users.auth_version FROM users WHERE users.id =")
+    assert user_queries(client, "GET", "/notes", parent)[1] == []
+
+def test_stale_tokens_hit_the_reloaded_principal(client):
+    client.signup("kid1")
+    mom = client.signup("mom", role="parent", child_ids=[1])
+    # Linking kid1 to another parent retires mom's claims
+    client.signup("dad", role="parent", child_ids=[1])
+
+    response, statements = user_queries(client, "GET", "/folders", mom)
+    assert response.status_code == 200 and statements
+    # The old token keeps being served from the cache instead of reloading every time
+    response, statements = user_queries(client, "GET", "/folders", mom)
+    assert response.status_code == 200 and statements == []
+    # And what it is served is current: mom no longer sees kid1
+    assert client.get("/children", headers=mom).json() == []
+    assert client.get("/notes", params={"child_id": 1}, headers=mom).json()["items"] == []
+
+def test_tokens_without_every_claim_are_loaded_from_the_database(client):
+    client.signup("kid")
+    principal_cache.clear()
+    token = create_access_token(Principal(id=1, username="kid", role="child", parent_id=None, child_ids=(), version=1))
+    from jose import jwt
+    claims = jwt.get_unverified_claims(token)
+    del claims["fam"], claims["parent"]
+    old = {"Authorization": "Bearer " + jwt.encode(claims, "your-secret-key-change-in-production", algorithm="HS256")}
+
+    response, statements = user_queries(client, "GET", "/notes", old)
+    assert response.status_code == 200 and any("users.username =" in statement for statement in statements)
+
+def test_deleted_user_is_rejected(client):
+    token = create_access_token(Principal(id=99, username="ghost", role="child", parent_id=None, child_ids=(), version=1))
+    assert client.get("/notes", headers={"Authorization": f"Bearer {token}"}).status_code == 401
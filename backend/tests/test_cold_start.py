@@ -0,0 +1,75 @@
+"""
+Cold start: importing either app must fit the import-time budget, must not
+create the database and must not load modules that wait for first use.
+
+COLD_START_BUDGET_MS sets the budget (650 ms by default) and COLD_START_RUNS
+how many fresh interpreters to take the best of. On failure the message lists
+the slowest modules to import, from a run under -X importtime.
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+BUDGET_MS = float(os.getenv("COLD_START_BUDGET_MS", "650"))
+RUNS = int(os.getenv("COLD_START_RUNS", "5"))
+
+# Loaded on first use; importing the app must not pull these in
+DEFERRED_MODULES = ("jose.jwt", "passlib.context", "aiosqlite")
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def measure(module):
+    """Child side: import `module` and print the results as JSON"""
+    began = time.perf_counter()
+    # __import__ rather than importlib, which -X importtime does not log
+    __import__(module)
+    print(json.dumps({
+        "import_ms": (time.perf_counter() - began) * 1000,
+        "deferred_loaded": [name for name in DEFERRED_MODULES if name in sys.modules],
+        "database_created": any(name.endswith(".db") for name in os.listdir(".")),
+    }))
+
+def run_child(module, cwd, *flags):
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR)
+    env.pop("DATABASE_URL", None)
+    completed = subprocess.run(
+        [sys.executable, *flags, os.path.abspath(__file__), module],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1]), completed.stderr
+
+def slowest_imports(importtime_output, module, count=10):
+    """(self ms, name) for the `count` slowest modules imported along with `module`"""
+    rows = []
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us) / 1000, name.strip()))
+        # Imports are logged as they finish, so the app module closes its own tree
+        if name == f" {module}":
+            break
+    return sorted(rows, reverse=True)[:count]
+
+@pytest.mark.parametrize("module", ["main", "vercel_main"])
+def test_import_fits_the_budget(module, tmp_path):
+    runs = []
+    for n in range(RUNS):
+        scratch = tmp_path / str(n)
+        scratch.mkdir()
+        runs.append(run_child(module, scratch)[0])
+        assert not runs[-1]["deferred_loaded"], f"importing {module} loaded {', '.join(runs[-1]['deferred_loaded'])}"
+        assert not runs[-1]["database_created"], f"importing {module} created the database"
+
+    best = min(run["import_ms"] for run in runs)
+    if best > BUDGET_MS:
+        _, importtime_output = run_child(module, tmp_path, "-X", "importtime")
+        slowest = "\n".join(f"{self_ms:>8.1f} ms  {name}" for self_ms, name in slowest_imports(importtime_output, module))
+        pytest.fail(f"importing {module} took {best:.0f} ms, budget is {BUDGET_MS:.0f} ms; slowest imports:\n{slowest}")
+
+if __name__ == "__main__":
+    measure(sys.argv[1])
@@ -0,0 +1,60 @@
+import pytest
+
+from edits import apply_edits
+
+@pytest.mark.parametrize("content, edits, expected", [
+    ("hello world", [(0, 5, "howdy")], "howdy world"),
+    ("hello world", [(0, 0, ">"), (5, 6, ""), (11, 11, "!")], ">helloworld!"),
+    # The emoji is two UTF-16 code units, so "b" starts at 3 as in JavaScript
+    ("a😀b", [(3, 4, "c")], "a😀c"),
+    ("a😀b", [(1, 3, "")], "ab"),
+    ("é😀日本", [(1, 3, "🎉"), (4, 5, "")], "é🎉日"),
+    ("", [(0, 0, "new")], "new"),
+])
+def test_offsets_count_utf16_code_units(content, edits, expected):
+    assert apply_edits(content, edits) == expected
+
+@pytest.mark.parametrize("content, edits", [
+    ("abc", [(2, 1, "")]),  # Backwards
+    ("abc", [(0, 2, ""), (1, 3, "")]),  # Overlapping
+    ("abc", [(2, 3, ""), (0, 1, "")]),  # Unsorted
+    ("abc", [(0, 4, "")]),  # Past the end
+    ("a😀b", [(2, 2, "x")]),  # Inside a surrogate pair
+])
+def test_invalid_edits(content, edits):
+    with pytest.raises(ValueError):
+        apply_edits(content, edits)
+
+def patch(client, headers, note_id, base_version, *edits):
+    return client.patch(f"/notes/{note_id}/content", headers=headers, json={
+        "base_version": base_version,
+        "edits": [{"start": start, "end": end, "text": text} for start, end, text in edits],
+    })
+
+def test_patch_applies_against_the_base_version(client):
+    kid = client.signup("kid")
+    note = client.post("/notes", json={"title": "t", "content": "a😀b"}, headers=kid).json()
+    assert note["content_version"] == 1
+
+    response = patch(client, kid, note["id"], 1, (3, 4, "c!"))
+    assert response.status_code == 200 and response.json()["content_version"] == 2
+    assert client.get("/notes", headers=kid).json()["items"][0]["content"] == "a😀c!"
+
+    # A second tab still at version 1 is refused, not merged
+    assert patch(client, kid, note["id"], 1, (0, 1, "z")).status_code == 409
+    assert patch(client, kid, note["id"], 2, (0, 1, "z")).json()["content_version"] == 3
+
+def test_put_and_patch_share_the_version(client):
+    kid = client.signup("kid")
+    note = client.post("/notes", json={"title": "t", "content": "abc"}, headers=kid).json()
+    assert client.put(f"/notes/{note['id']}", json={"content": "xyz"}, headers=kid).json()["content_version"] == 2
+    assert patch(client, kid, note["id"], 1, (0, 1, "q")).status_code == 409
+    # A PUT that leaves content alone keeps the version
+    assert client.put(f"/notes/{note['id']}", json={"title": "u"}, headers=kid).json()["content_version"] == 2
+
+def test_bad_patches(client):
+    kid, other = client.signup("kid"), client.signup("kid2")
+    note = client.post("/notes", json={"title": "t", "content": "a😀b"}, headers=kid).json()
+    assert patch(client, kid, note["id"], 1, (2, 2, "x")).status_code == 400
+    assert patch(client, other, note["id"], 1, (0, 0, "x")).status_code == 403
+    assert patch(client, kid, 10 ** 6, 1, (0, 0, "x")).status_code == 404
@@ -0,0 +1,22 @@
+from sqlalchemy import func, insert, select
+
+import database
+from create_demo_data import clear_data
+from database import Folder, ImportFolder, ImportJob, Job, User, create_schema, create_sync_engine
+
+def test_clear_data_leaves_no_imports_or_jobs():
+    engine = create_sync_engine(database.SQLALCHEMY_DATABASE_URL)
+    create_schema(engine)
+    try:
+        with engine.begin() as conn:
+            conn.execute(insert(User.__table__), [{"id": 1, "username": "kid", "email": "kid@example.com", "role": "child"}])
+            conn.execute(insert(Folder.__table__).values(id=1, name="School", owner_id=1))
+            job_id = conn.execute(insert(ImportJob.__table__).values(owner_id=1).returning(ImportJob.id)).scalar()
+            conn.execute(insert(ImportFolder.__table__).values(job_id=job_id, source_id=1, folder_id=1))
+            conn.execute(insert(Job.__table__).values(kind="note_tags", owner_id=1, payload='{"note_ids": [1]}'))
+        with engine.begin() as conn:
+            clear_data(conn)
+            for model in (User, ImportJob, ImportFolder, Job):
+                assert conn.scalar(select(func.count()).select_from(model)) == 0, model.__tablename__
+    finally:
+        engine.dispose()
@@ -0,0 +1,113 @@
+from sqlalchemy import event
+
+import database
+
+def conditional_get(client, path, headers, etag, **params):
+    return client.get(path, params=params, headers={**headers, "If-None-Match": etag})
+
+def test_unchanged_collection_is_not_modified(client):
+    kid = client.signup("kid")
+    client.post("/notes", json={"title": "a", "content": "x"}, headers=kid)
+    response = client.get("/notes", headers=kid)
+    etag = response.headers["etag"]
+    assert etag.startswith('"') and response.headers["cache-control"] == "private, no-cache"
+
+    again = conditional_get(client, "/notes", kid, etag)
+    assert again.status_code == 304 and again.content == b"" and again.headers["etag"] == etag
+    assert conditional_get(client, "/notes", kid, f'"other", W/{etag}').status_code == 304
+    assert conditional_get(client, "/notes", kid, "*").status_code == 304
+
+def test_not_modified_reads_no_notes(client):
+    kid = client.signup("kid")
+    client.post("/notes", json={"title": "a", "content": "x"}, headers=kid)
+    etag = client.get("/notes", headers=kid).headers["etag"]
+
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    engine = database.get_database().read_engine.sync_engine
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        assert conditional_get(client, "/notes", kid, etag).status_code == 304
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert statements and not any("FROM notes" in statement for statement in statements)
+
+def test_query_string_is_part_of_the_etag(client):
+    kid = client.signup("kid")
+    etag = client.get("/notes", headers=kid).headers["etag"]
+    assert conditional_get(client, "/notes", kid, etag, limit=2).status_code == 200
+
+def test_writes_change_the_etag(client):
+    kid = client.signup("kid")
+    note = client.post("/notes", json={"title": "a", "content": "x"}, headers=kid).json()
+    folder = client.post("/folders", json={"name": "School"}, headers=kid).json()
+    notes, folders = client.get("/notes", headers=kid).headers["etag"], client.get("/folders", headers=kid).headers["etag"]
+
+    client.put(f"/notes/{note['id']}", json={"title": "b"}, headers=kid)
+    assert conditional_get(client, "/notes", kid, notes).status_code == 200
+    folders_after_note = client.get("/folders", headers=kid).headers["etag"]
+    assert folders_after_note != folders  # One version covers notes and folders
+
+    client.delete(f"/folders/{folder['id']}", headers=kid)
+    assert conditional_get(client, "/folders", kid, folders_after_note).status_code == 200
+
+def test_parent_etag_covers_each_child(client):
+    first, second = client.signup("kid1"), client.signup("kid2")
+    parent = client.signup("mom", role="parent", child_ids=[1, 2])
+    everyone = client.get("/notes", headers=parent).headers["etag"]
+    only_first = client.get("/notes", params={"child_id": 1}, headers=parent).headers["etag"]
+    assert everyone != only_first
+
+    client.post("/notes", json={"title": "a", "content": "x"}, headers=second)
+    assert conditional_get(client, "/notes", parent, everyone).status_code == 200
+    assert conditional_get(client, "/notes", parent, only_first, child_id=1).status_code == 304
+
+    client.post("/notes", json={"title": "b", "content": "x"}, headers=first)
+    assert conditional_get(client, "/notes", parent, only_first, child_id=1).status_code == 200
+
+def test_children_etag_follows_the_auth_version(client):
+    client.signup("kid1")
+    parent = client.signup("mom", role="parent", child_ids=[1])
+    etag = client.get("/children", headers=parent).headers["etag"]
+    assert conditional_get(client, "/children", parent, etag).status_code == 304
+
+    client.signup("dad", role="parent", child_ids=[1])
+    parent = client.login("mom")
+    assert conditional_get(client, "/children", parent, etag).status_code == 200
+
+def test_tag_listing_etag_changes_when_tags_are_indexed(client):
+    kid = client.signup("kid")
+    note = client.post("/notes", json={"title": "a", "content": "x", "tags": "math"}, headers=kid).json()
+    # The index is built by a background job, so the listing is empty until it runs
+    before = client.get("/notes", params={"tag": "math"}, headers=kid)
+    assert before.json()["items"] == []
+
+    assert client.run_jobs() == 1
+    after = conditional_get(client, "/notes", kid, before.headers["etag"], tag="math")
+    assert after.status_code == 200 and [item["id"] for item in after.json()["items"]] == [note["id"]]
+
+    # Running the job again changes nothing, so the ETag holds
+    client.put(f"/notes/{note['id']}", json={"title": "b"}, headers=kid)
+    etag = client.get("/notes", params={"tag": "math"}, headers=kid).headers["etag"]
+    client.run(_sync_tags, [note["id"]])
+    assert conditional_get(client, "/notes", kid, etag, tag="math").status_code == 304
+
+async def _sync_tags(note_ids):
+    from tags import sync_note_tags
+
+    async with database.write_session() as db:
+        await sync_note_tags(db, note_ids)
+        await db.commit()
+
+def test_content_patch_changes_the_etag(client):
+    kid = client.signup("kid")
+    note = client.post("/notes", json={"title": "a", "content": "abc"}, headers=kid).json()
+    etag = client.get("/notes", headers=kid).headers["etag"]
+
+    patched = client.patch(f"/notes/{note['id']}/content", headers=kid, json={
+        "base_version": 1, "edits": [{"start": 0, "end": 1, "text": "z"}],
+    })
+    assert patched.status_code == 200
+    after = conditional_get(client, "/notes", kid, etag)
+    assert after.status_code == 200 and after.json()["items"][0]["content"] == "zbc"
@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from events import Broker, Event, InProcessBroker, create_broker
+
+def test_broker_is_abstract():
+    with pytest.raises(TypeError):
+        Broker()
+
+    class PublishOnly(Broker):
+        async def publish(self, event):
+            pass
+    with pytest.raises(TypeError):
+        PublishOnly()
+    assert isinstance(create_broker("memory"), InProcessBroker)
+
+def test_events_reach_only_their_owners_subscribers():
+    async def run():
+        broker = InProcessBroker(queue_size=10)
+        async with broker.subscribe([1, 2]) as both, broker.subscribe([2]) as second:
+            await broker.publish(Event("note.created", 1, {"id": 5}))
+            await broker.publish(Event("note.deleted", 2, {"id": 6}))
+            received = [await both.get(0.1), await both.get(0.1)], [await second.get(0.1), await second.get(0.1)]
+        return received, broker.subscriber_count
+
+    (both, second), remaining = asyncio.run(run())
+    assert [event.data["id"] for event in both] == [5, 6]
+    assert second[0].data["id"] == 6 and second[1] is None
+    assert remaining == 0
+
+def test_a_subscriber_that_falls_behind_is_evicted():
+    async def run():
+        broker = InProcessBroker(queue_size=2)
+        slow = broker.subscribe([1])
+        for n in range(3):
+            await broker.publish(Event("note.updated", 1, {"id": n}))
+        return slow, broker
+
+    slow, broker = asyncio.run(run())
+    assert slow.evicted and broker.evictions == 1 and broker.subscriber_count == 0
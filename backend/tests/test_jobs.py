@@ -0,0 +1,146 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+import jobs
+from database import Job, dispose_engines, read_session, write_session
+
+def run(coroutine):
+    async def scoped():
+        try:
+            return await coroutine
+        finally:
+            await dispose_engines()
+    return asyncio.run(scoped())
+
+@pytest.fixture
+def applied(monkeypatch):
+    """Payloads applied by the "record" and "boom" job kinds; "boom" always fails"""
+    calls = []
+
+    async def record(db, **payload):
+        calls.append(payload)
+
+    async def boom(db, **payload):
+        raise RuntimeError("boom")
+    monkeypatch.setitem(jobs.HANDLERS, "record", record)
+    monkeypatch.setitem(jobs.HANDLERS, "boom", boom)
+    return calls
+
+async def enqueue(*kinds):
+    async with write_session() as db:
+        for n, kind in enumerate(kinds):
+            jobs.enqueue(db, kind, 1, n=n)
+        await db.commit()
+
+async def remaining():
+    async with read_session() as db:
+        return (await db.scalars(select(Job).order_by(Job.id))).all()
+
+async def claim(**kwargs):
+    async with write_session() as db:
+        claimed = await jobs.claim(db, **kwargs)
+        await db.commit()
+    return claimed
+
+def test_a_claim_leases_jobs(applied):
+    async def scenario():
+        await enqueue("record", "record")
+        first = await claim()
+        assert [job.attempts for job in first] == [1, 1]
+        # Leased jobs are not handed out again
+        assert await claim() == []
+        assert await jobs.run_jobs(first) == ["done", "done"]
+        assert await remaining() == []
+    run(scenario())
+    assert applied == [{"n": 0}, {"n": 1}]
+
+def test_an_expired_lease_is_reclaimed_and_the_old_holder_loses(applied):
+    async def scenario():
+        await enqueue("record")
+        stale = await claim(lease=-1)  # Expired as soon as it is taken
+        fresh = await claim()
+        assert [job.attempts for job in fresh] == [2]
+        assert await jobs.run_job(stale[0]) == "lost"
+        assert applied == [{"n": 0}] and len(await remaining()) == 1
+        assert await jobs.run_job(fresh[0]) == "done"
+        assert await remaining() == []
+    run(scenario())
+    # The stale holder's handler ran, but its transaction was rolled back
+    assert applied == [{"n": 0}, {"n": 0}]
+
+def test_a_batch_with_a_lost_lease_falls_back_to_single_jobs(applied):
+    async def scenario():
+        await enqueue("record", "record")
+        batch = await claim()
+        async with write_session() as db:
+            await db.execute(update(Job).where(Job.id == batch[0].id).values(attempts=Job.attempts + 1))
+            await db.commit()
+        assert await jobs.run_jobs(batch) == ["lost", "done"]
+        assert [job.id for job in await remaining()] == [batch[0].id]
+    run(scenario())
+
+def test_failures_back_off_then_dead_letter(applied, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(jobs, "JOB_BACKOFF_SECONDS", 30)
+
+    async def scenario():
+        await enqueue("boom", "record")
+        assert await jobs.run_jobs(await claim()) == ["retry", "done"]
+        job, = await remaining()
+        assert job.error == "RuntimeError: boom" and job.dead_at is None
+        assert job.run_after > datetime.utcnow() + timedelta(seconds=25)
+        assert await claim() == []
+
+        async with write_session() as db:
+            await db.execute(update(Job).values(run_after=datetime.utcnow()))
+            await db.commit()
+        assert await jobs.run_jobs(await claim()) == ["dead"]
+        job, = await remaining()
+        assert job.dead_at is not None and job.attempts == 2
+        async with read_session() as db:
+            assert await jobs.queue_stats(db, [1]) == {"pending": 0, "retrying": 0, "dead": 1, "lag_seconds": 0.0}
+        # Dead jobs are never claimed again
+        async with write_session() as db:
+            await db.execute(update(Job).values(run_after=datetime.utcnow() - timedelta(days=1)))
+            await db.commit()
+        assert await claim() == []
+    run(scenario())
+
+def test_merged_tag_jobs_share_one_call(monkeypatch):
+    calls = []
+
+    async def sync_note_tags(db, note_ids):
+        calls.append(note_ids)
+    monkeypatch.setitem(jobs.HANDLERS, "note_tags", sync_note_tags)
+    monkeypatch.setattr(jobs, "TAG_JOB_SIZE", 3)
+
+    async def scenario():
+        async with write_session() as db:
+            for note_ids in ([5, 1], [2], [1, 3], [4]):
+                jobs.enqueue_tag_sync(db, 1, note_ids)
+            await db.commit()
+        assert await jobs.run_jobs(await claim()) == ["done"] * 4
+    run(scenario())
+    assert calls == [[1, 2, 3], [4, 5]]
+
+def test_workers_run_jobs_after_commit(applied, monkeypatch):
+    workers = jobs.JobWorkers(workers=1, poll=60, delay_ms=0)
+    # The commit hook wakes the module's pool
+    monkeypatch.setattr(jobs, "workers", workers)
+
+    async def scenario():
+        workers.start()
+        try:
+            await enqueue("record")
+            for _ in range(100):
+                if not await remaining():
+                    break
+                await asyncio.sleep(0.02)
+        finally:
+            await workers.stop()
+        assert await remaining() == []
+    run(scenario())
+    assert applied == [{"n": 0}]
@@ -0,0 +1,53 @@
+import sqlite3
+
+from sqlalchemy import event
+
+import database
+
+def note_ids(client, headers, limit, **params):
+    """Every note id GET /notes pages through, in order"""
+    collected, cursor = [], None
+    while True:
+        page = client.get("/notes", params={**params, "limit": limit, **({"cursor": cursor} if cursor else {})}, headers=headers).json()
+        collected += [note["id"] for note in page["items"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            return collected
+
+def test_parent_pages_merge_every_child_newest_first(client):
+    kids = [client.signup(f"kid{n}") for n in range(3)]
+    parent = client.signup("mom", role="parent", child_ids=[1, 2, 3])
+    created = [client.post("/notes", json={"title": f"n{n}", "content": "x"}, headers=kids[n % 3 if n < 9 else 0]).json()["id"] for n in range(11)]
+    client.put(f"/notes/{created[4]}", json={"title": "edited"}, headers=kids[1])
+    expected = [created[4]] + [note_id for note_id in reversed(created) if note_id != created[4]]
+
+    for limit in (1, 2, 4, 5, 100):
+        assert note_ids(client, parent, limit) == expected
+    assert note_ids(client, parent, 3, child_id=2) == [created[4], created[7], created[1]]
+
+def test_parent_pages_read_each_child_in_index_order(client):
+    kids = [client.signup(f"kid{n}") for n in range(2)]
+    parent = client.signup("mom", role="parent", child_ids=[1, 2])
+    for n in range(4):
+        client.post("/notes", json={"title": f"n{n}", "content": "x"}, headers=kids[n % 2])
+
+    statements = []
+    def record(conn, cursor, statement, parameters, *args):
+        if "FROM notes" in statement:
+            statements.append((statement, parameters))
+    engine = database.get_database().read_engine.sync_engine
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        client.get("/notes", params={"limit": 2}, headers=parent)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    (statement, parameters), = statements
+    with sqlite3.connect(database.SQLALCHEMY_DATABASE_URL.split("///", 1)[1]) as conn:
+        plan = {(parent_id, detail) for _, parent_id, _, detail in conn.execute("EXPLAIN QUERY PLAN " + statement, parameters)}
+    # Each child's newest rows come from its own index range, without a sort
+    searches = [detail for _, detail in plan if detail.startswith("SEARCH notes USING INDEX ix_notes_live_owner_updated")]
+    assert len(searches) == 2
+    # Only the merged rows are fetched by id; no child's notes are all read and sorted
+    assert (0, "SEARCH notes USING INTEGER PRIMARY KEY (rowid=?)") in plan
+    assert not any(detail.startswith("SCAN notes") for _, detail in plan)
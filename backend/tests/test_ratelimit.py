@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from ratelimit import Limit, LoadShedMiddleware, RateLimiter, TokenBuckets, parse_limits
+
+def test_parse_limits():
+    assert parse_limits("post /login=10/60, *=600/60") == {"POST /login": Limit(10, 60), "*": Limit(600, 60)}
+    for bad in ("POST /login", "POST /login=10", "POST /login=0/60", "*=ten/60"):
+        with pytest.raises(ValueError):
+            parse_limits(bad)
+
+def test_bucket_bursts_then_refills():
+    buckets, limit = TokenBuckets(max_keys=10), Limit(3, 60)
+    assert [buckets.take("a", limit, now=0) for _ in range(3)] == [0, 0, 0]
+    assert buckets.take("a", limit, now=0) == pytest.approx(20)
+    assert buckets.take("a", limit, now=10) == pytest.approx(10)
+    assert buckets.take("a", limit, now=20) == 0
+    # Clients have their own buckets
+    assert buckets.take("b", limit, now=20) == 0
+
+def test_full_buckets_are_dropped_and_size_is_bounded():
+    buckets, limit = TokenBuckets(max_keys=2), Limit(1, 1)
+    buckets.take("a", limit, now=0)
+    buckets.take("b", limit, now=0)
+    buckets.take("c", limit, now=0)
+    assert len(buckets) == 2
+    buckets.take("d", limit, now=100)
+    assert len(buckets) == 1
+
+def limited_app(spec):
+    app = FastAPI()
+    limiter = RateLimiter(limits=parse_limits(spec), enabled=True)
+
+    @app.get("/ping", dependencies=[Depends(limiter)])
+    async def ping():
+        return {}
+
+    @app.get("/other", dependencies=[Depends(limiter)])
+    async def other():
+        return {}
+    return app
+
+def test_over_the_limit_gets_429_with_retry_after():
+    client = TestClient(limited_app("GET /ping=2/60, *=5/60"))
+    assert [client.get("/ping").status_code for _ in range(3)] == [200, 200, 429]
+    assert client.get("/ping").headers["retry-after"] == "30"
+    # Routes without a rule share the default bucket
+    assert [client.get("/other").status_code for _ in range(6)] == [200] * 5 + [429]
+
+def test_load_shedding_refuses_beyond_the_queue():
+    release = asyncio.Event()
+
+    async def slow(scope, receive, send):
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def run():
+        middleware = LoadShedMiddleware(slow, max_concurrency=1, max_queue=1, max_wait_ms=1000)
+        statuses = []
+
+        async def request():
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    statuses.append(message["status"])
+            await middleware({"type": "http", "path": "/notes"}, None, send)
+
+        tasks = [asyncio.create_task(request()) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        assert statuses == [503] and middleware.active == 1 and middleware.queued == 1
+        release.set()
+        await asyncio.gather(*tasks)
+        return statuses, middleware
+
+    statuses, middleware = asyncio.run(run())
+    assert sorted(statuses) == [200, 200, 503]
+    assert middleware.active == 0 and middleware.shed == 1
+
+def test_queued_request_times_out():
+    async def run():
+        gate = asyncio.Event()
+
+        async def slow(scope, receive, send):
+            await gate.wait()
+
+        middleware = LoadShedMiddleware(slow, max_concurrency=1, max_queue=5, max_wait_ms=50)
+        statuses = []
+
+        async def send(message):
+            statuses.append(message.get("status"))
+        first = asyncio.create_task(middleware({"type": "http", "path": "/notes"}, None, send))
+        await asyncio.sleep(0)
+        await middleware({"type": "http", "path": "/notes"}, None, send)
+        gate.set()
+        await first
+        return statuses
+
+    assert 503 in asyncio.run(run())
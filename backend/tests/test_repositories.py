@@ -0,0 +1,212 @@
+"""
+The same tests against every repository backend. They rely only on what the
+Repository interface promises: ordering and cursors, live rows only,
+projections, and versions that change with every write, never on exact
+timestamps or ids.
+
+Users are seeded outside the interface, and the SQL backend maintains the
+tag index with background jobs, so each test gets `add_user` and `settle`
+from the backend: settle() drains the job queue for SQL and does nothing for
+memory.
+"""
+import asyncio
+
+import pytest
+
+from database import User, dispose_engines, write_session
+from jobs import claim, run_jobs
+from repositories import MemoryRepository, Repository, SqlRepository
+
+def ids(page):
+    return [item["id"] if isinstance(item, dict) else item.id for item in page["items"]]
+
+async def all_pages(fetch, limit):
+    """Every id `fetch(cursor, limit)` pages through, in order"""
+    collected, cursor = [], None
+    while True:
+        page = await fetch(cursor, limit)
+        assert len(page["items"]) <= limit
+        collected += ids(page)
+        cursor = page["next_cursor"]
+        if not cursor:
+            return collected
+
+async def run_memory(scenario):
+    repository = MemoryRepository()
+
+    async def add_user(username, role="child", parent_id=None):
+        return await repository.add_user(username, f"{username}@example.com", "hash", role=role, parent_id=parent_id)
+
+    async def settle():
+        pass
+    await scenario(repository, add_user, settle)
+
+async def run_sql(scenario):
+    async def settle():
+        while True:
+            async with write_session() as db:
+                jobs = await claim(db)
+                await db.commit()
+            if not jobs:
+                return
+            await run_jobs(jobs)
+
+    try:
+        async with write_session() as db:
+            async def add_user(username, role="child", parent_id=None):
+                user = User(username=username, email=f"{username}@example.com", hashed_password="hash", role=role, parent_id=parent_id)
+                db.add(user)
+                await db.commit()
+                return user
+            await scenario(SqlRepository(db), add_user, settle)
+    finally:
+        await dispose_engines()
+
+@pytest.fixture(params=[run_memory, run_sql], ids=["memory", "sql"])
+def check(request):
+    """check(scenario) runs `scenario(repository, add_user, settle)` against one backend"""
+    return lambda scenario: asyncio.run(request.param(scenario))
+
+def test_repository_is_abstract():
+    with pytest.raises(TypeError):
+        Repository()
+
+def test_users(check):
+    async def scenario(repository, add_user, settle):
+        parent = await add_user("parent", role="parent")
+        first = await add_user("kid1", parent_id=parent.id)
+        second = await add_user("kid2", parent_id=parent.id)
+        orphan = await add_user("orphan")
+
+        assert [user.id for user in await repository.children(parent.id)] == [first.id, second.id]
+        assert await repository.children(orphan.id) == []
+        unlinked = [user.id for user in await repository.unlinked_children()]
+        assert orphan.id in unlinked and first.id not in unlinked and parent.id not in unlinked
+    check(scenario)
+
+def test_folders(check):
+    async def scenario(repository, add_user, settle):
+        owner, other = await add_user("kid"), await add_user("kid2")
+        folders = [await repository.add_folder(owner.id, f"Folder {n}") for n in range(5)]
+        theirs = await repository.add_folder(other.id, "Theirs")
+
+        newest_first = [folder.id for folder in reversed(folders)]
+        fetch = lambda cursor, limit: repository.folder_page([owner.id], cursor, limit)
+        assert await all_pages(fetch, 2) == newest_first
+        assert (await repository.folder_page([owner.id], limit=5))["next_cursor"] is None
+        assert sorted(ids(await repository.folder_page([owner.id, other.id]))) == sorted(newest_first + [theirs.id])
+        assert (await repository.get_folder(theirs.id)).name == "Theirs"
+        assert await repository.get_folder(10 ** 9) is None
+
+        # Deleting a folder takes its notes with it, and nothing else
+        inside = [await repository.add_note(owner.id, f"In {n}", "x", folder_id=folders[0].id) for n in range(3)]
+        outside = await repository.add_note(owner.id, "Outside", "x")
+        results = await repository.delete_folder(folders[0])
+        assert results == [{"id": note.id, "status": 200} for note in inside]
+        assert await repository.get_folder(folders[0].id) is None
+        assert folders[0].id not in ids(await repository.folder_page([owner.id]))
+        assert all([await repository.get_note(note.id) is None for note in inside])
+        assert ids(await repository.note_page([owner.id])) == [outside.id]
+    check(scenario)
+
+async def add_notes(repository, owner, other, folder):
+    notes = [
+        await repository.add_note(owner.id, f"Note {n}", f"Body {n}", tags="Math, homework" if n % 2 else "art",
+                                  is_todo=n % 3 == 0, folder_id=folder.id if n < 4 else None)
+        for n in range(9)
+    ]
+    return notes, await repository.add_note(other.id, "Theirs", "Body", tags="art")
+
+def test_note_pages(check):
+    async def scenario(repository, add_user, settle):
+        owner, other = await add_user("kid"), await add_user("kid2")
+        folder = await repository.add_folder(owner.id, "School")
+        notes, theirs = await add_notes(repository, owner, other, folder)
+
+        created = notes[0]
+        assert (created.title, created.content, created.tags, created.content_version) == ("Note 0", "Body 0", "art", 1)
+        assert (created.is_todo, created.is_completed, created.folder_id, created.owner_id) == (True, False, folder.id, owner.id)
+        assert created.created_at is not None and created.updated_at is not None
+
+        newest_first = [note.id for note in reversed(notes)]
+        for limit in (1, 2, 4, 100):
+            assert await all_pages(lambda cursor, limit: repository.note_page([owner.id], cursor=cursor, limit=limit), limit) == newest_first
+        assert ids(await repository.note_page([owner.id], folder_id=folder.id)) == [note.id for note in reversed(notes[:4])]
+        everyone = await all_pages(lambda cursor, limit: repository.note_page([owner.id, other.id], cursor=cursor, limit=limit), 3)
+        assert everyone == [theirs.id] + newest_first
+
+        # Projections carry the requested fields plus the cursor's
+        page = await repository.note_page([owner.id], fields=["id", "title", "updated_at"], limit=2)
+        assert [sorted(item) for item in page["items"]] == [["id", "title", "updated_at"]] * 2
+        assert page["items"][0]["title"] == "Note 8" and page["next_cursor"]
+
+        with pytest.raises(Exception) as raised:
+            await repository.note_page([owner.id], cursor="not a cursor")
+        assert getattr(raised.value, "status_code", None) == 400
+    check(scenario)
+
+def test_note_writes(check):
+    async def scenario(repository, add_user, settle):
+        owner, other = await add_user("kid"), await add_user("kid2")
+        folder = await repository.add_folder(owner.id, "School")
+        notes, theirs = await add_notes(repository, owner, other, folder)
+        created = notes[0]
+
+        # An update moves the note to the front of the list
+        updated = await repository.update_note(created, content="Edited", is_completed=True)
+        assert (updated.content, updated.content_version, updated.is_completed) == ("Edited", 2, True)
+        assert (await repository.get_note(created.id)).content == "Edited"
+        assert ids(await repository.note_page([owner.id], limit=1)) == [created.id]
+        await repository.update_note(created, title="Renamed")
+        assert (await repository.get_note(created.id)).content_version == 2
+
+        await repository.delete_note(notes[3])
+        assert await repository.get_note(notes[3].id) is None
+        assert notes[3].id not in ids(await repository.note_page([owner.id]))
+        assert await repository.get_note(10 ** 9) is None
+    check(scenario)
+
+def test_tag_filters(check):
+    async def scenario(repository, add_user, settle):
+        owner, other = await add_user("kid"), await add_user("kid2")
+        folder = await repository.add_folder(owner.id, "School")
+        notes, theirs = await add_notes(repository, owner, other, folder)
+
+        await settle()
+        tagged = [note.id for note in reversed(notes[1::2])]
+        assert ids(await repository.note_page([owner.id], tag="math")) == tagged
+        assert ids(await repository.note_page([owner.id], tag=" MATH ")) == tagged
+        assert ids(await repository.note_page([owner.id], tag="math", folder_id=folder.id)) == [notes[3].id, notes[1].id]
+        assert ids(await repository.note_page([owner.id], tag="unknown")) == []
+        assert ids(await repository.note_page([other.id], tag="art")) == [theirs.id]
+
+        # Retagging and deleting leave the tag index
+        await repository.update_note(notes[1], tags="art")
+        await repository.delete_note(notes[3])
+        await settle()
+        assert notes[1].id not in ids(await repository.note_page([owner.id], tag="math"))
+        assert notes[1].id in ids(await repository.note_page([owner.id], tag="art"))
+        assert notes[3].id not in ids(await repository.note_page([owner.id], tag="math"))
+    check(scenario)
+
+def test_collection_versions(check):
+    async def scenario(repository, add_user, settle):
+        owner, other = await add_user("kid"), await add_user("kid2")
+        assert await repository.collection_versions([owner.id, other.id]) == {}
+
+        async def version():
+            return (await repository.collection_versions([owner.id]))[owner.id]
+        seen = []
+        folder = await repository.add_folder(owner.id, "Folder")
+        seen.append(await version())
+        note = await repository.add_note(owner.id, "Note", "Body")
+        seen.append(await version())
+        await repository.update_note(note, title="Renamed")
+        seen.append(await version())
+        await repository.delete_note(note)
+        seen.append(await version())
+        await repository.delete_folder(folder)
+        seen.append(await version())
+        assert len(set(seen)) == len(seen), seen
+        assert other.id not in await repository.collection_versions([owner.id, other.id])
+    check(scenario)
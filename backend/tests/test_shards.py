@@ -0,0 +1,73 @@
+import asyncio
+
+import orjson
+import pytest
+from sqlalchemy import insert, select
+
+import auth
+import database
+import shards
+from auth import Principal, authenticate, create_access_token, principal_cache
+from database import Job, Note, User, create_schema, create_sync_engine
+from split_shards import copy_family
+
+@pytest.fixture
+def shard_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_SHARD_DIR", str(tmp_path / "shards"))
+    monkeypatch.setattr(database, "_family_schema_ready", set())
+    return tmp_path / "shards"
+
+def seed(path, owner_id, note_ids, queued):
+    """An owner with notes `note_ids` and note_tags jobs for each list in `queued`"""
+    engine = create_sync_engine(f"sqlite:///{path}")
+    create_schema(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [{"id": owner_id, "username": f"kid{owner_id}", "email": f"kid{owner_id}@example.com", "role": "child"}])
+        conn.execute(insert(Note.__table__), [{"id": note_id, "title": "t", "content": "x", "tags": "math", "owner_id": owner_id} for note_id in note_ids])
+        conn.execute(insert(Job.__table__), [{"kind": "note_tags", "owner_id": owner_id, "payload": orjson.dumps({"note_ids": ids}).decode()} for ids in queued])
+    engine.dispose()
+
+def queued(path):
+    engine = create_sync_engine(f"sqlite:///{path}")
+    with engine.connect() as conn:
+        jobs = [(job.owner_id, orjson.loads(job.payload)["note_ids"]) for job in conn.execute(select(Job.__table__).order_by(Job.id))]
+    engine.dispose()
+    return jobs
+
+def test_moving_a_child_requeues_its_tag_jobs_under_the_new_ids(shard_dir):
+    shard_dir.mkdir()
+    seed(database.shard_path(1), 1, [1, 2], [[1], [1, 2]])
+    seed(database.shard_path(3), 3, [1, 2, 3], [[3]])
+
+    moves = [(1, 1)]
+    shards.join_family(3, [], moves)
+    # Child 1's notes 1 and 2 become 4 and 5 next to family 3's notes 1 to 3
+    assert queued(database.shard_path(3)) == [(3, [3]), (1, [4, 5])]
+
+    shards.leave_family(moves)
+    assert queued(database.shard_path(1)) == []
+
+def test_split_copies_queued_jobs(tmp_path):
+    source = tmp_path / "single.db"
+    seed(source, 1, [7], [[7]])
+    seed(source, 2, [8], [[8]])
+    copy_family(str(source), str(tmp_path / "family-1.db"), [1])
+    assert queued(tmp_path / "family-1.db") == [(1, [7])]
+
+def test_tokens_from_before_a_split_load_their_family(monkeypatch):
+    """split_shards.py keeps auth versions, so a token issued by the single database
+    is still current but has no family to route to"""
+    async def run():
+        try:
+            async with database.write_session() as db:
+                db.add(User(id=1, username="kid", email="kid@example.com", hashed_password="hash", role="child", family_id=1))
+                await db.commit()
+            token = create_access_token(Principal(id=1, username="kid", role="child", parent_id=None, child_ids=(), version=1))
+            principal_cache.clear()
+            async with database.read_session() as db:
+                return await authenticate(token, db)
+        finally:
+            await database.dispose_engines()
+
+    monkeypatch.setattr(auth, "DB_SHARD_DIR", "shards")
+    assert asyncio.run(run()).family_id == 1
@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+import database
+from database import Note
+from sync import purge_deleted
+
+def sync(client, headers, since=None, **params):
+    response = client.get("/sync", params={**params, **({"since": since} if since else {})}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def create(client, headers, title, **fields):
+    return client.post("/notes", json={"title": title, "content": "x", **fields}, headers=headers).json()
+
+def test_first_sync_is_a_snapshot(client):
+    kid = client.signup("kid")
+    notes = [create(client, kid, f"n{n}") for n in range(3)]
+    client.delete(f"/notes/{notes[0]['id']}", headers=kid)
+    folder = client.post("/folders", json={"name": "School"}, headers=kid).json()
+
+    snapshot = sync(client, kid)
+    assert snapshot["reset"] is True and snapshot["has_more"] is False
+    assert [note["id"] for note in snapshot["notes"]] == [notes[1]["id"], notes[2]["id"]]
+    assert [f["id"] for f in snapshot["folders"]] == [folder["id"]]
+    assert snapshot["deleted_notes"] == []
+
+def test_delta_has_only_later_changes_and_deletes(client):
+    kid = client.signup("kid")
+    kept, changed, removed = (create(client, kid, title) for title in ("kept", "changed", "removed"))
+    cursor = sync(client, kid)["cursor"]
+    assert sync(client, kid, cursor)["notes"] == []
+
+    client.put(f"/notes/{changed['id']}", json={"title": "edited"}, headers=kid)
+    client.delete(f"/notes/{removed['id']}", headers=kid)
+    added = create(client, kid, "added")
+    delta = sync(client, kid, cursor)
+    assert delta["reset"] is False
+    assert [(note["id"], note["title"]) for note in delta["notes"]] == [(changed["id"], "edited"), (added["id"], "added")]
+    assert delta["deleted_notes"] == [removed["id"]]
+    assert kept["id"] not in [note["id"] for note in delta["notes"]]
+
+    # The next delta starts after everything already reported
+    assert sync(client, kid, delta["cursor"])["notes"] == []
+    assert sync(client, kid, delta["cursor"])["deleted_notes"] == []
+
+def test_folder_delete_reports_its_notes(client):
+    kid = client.signup("kid")
+    folder = client.post("/folders", json={"name": "School"}, headers=kid).json()
+    inside = create(client, kid, "inside", folder_id=folder["id"])
+    cursor = sync(client, kid)["cursor"]
+    client.delete(f"/folders/{folder['id']}", headers=kid)
+    delta = sync(client, kid, cursor)
+    assert delta["deleted_folders"] == [folder["id"]] and delta["deleted_notes"] == [inside["id"]]
+
+def test_pages_follow_the_limit(client):
+    kid = client.signup("kid")
+    ids = [create(client, kid, f"n{n}")["id"] for n in range(5)]
+    seen, cursor = [], None
+    while True:
+        page = sync(client, kid, cursor, limit=2)
+        seen += [note["id"] for note in page["notes"]]
+        cursor = page["cursor"]
+        if not page["has_more"]:
+            break
+    assert seen == ids
+
+def test_cursor_before_the_purge_horizon_resets(client):
+    kid = client.signup("kid")
+    kept, removed = create(client, kid, "kept"), create(client, kid, "removed")
+    cursor = sync(client, kid)["cursor"]
+    client.delete(f"/notes/{removed['id']}", headers=kid)
+
+    async def purge():
+        async with database.write_session() as db:
+            await db.execute(update(Note).where(Note.id == removed["id"]).values(deleted_at=datetime.utcnow() - timedelta(days=365)))
+            purged = await purge_deleted(db, Note)
+            await db.commit()
+        return purged
+    assert client.run(purge) == 1
+
+    # The delete was never reported to this cursor and its row is gone, so it gets a snapshot
+    after = sync(client, kid, cursor)
+    assert after["reset"] is True
+    assert [note["id"] for note in after["notes"]] == [kept["id"]] and after["deleted_notes"] == []
+
+def test_cursor_for_other_owners_resets(client):
+    client.signup("kid1"), client.signup("kid2")
+    parent = client.signup("mom", role="parent", child_ids=[1, 2])
+    cursor = sync(client, parent, child_id=1)["cursor"]
+    assert sync(client, parent, cursor, child_id=1)["reset"] is False
+    assert sync(client, parent, cursor)["reset"] is True
+
+def test_invalid_cursor(client):
+    kid = client.signup("kid")
+    assert client.get("/sync", params={"since": "not a cursor"}, headers=kid).status_code == 400
@@ -1,5 +1,5 @@
 import axios from 'axios';
-import { Folder, Note } from './types';
+import { BatchResult, ChildStats, ContentEdit, ContentVersion, Folder, ImportJob, Note, NoteSearchResult, SyncResponse, TagCount } from './types';
 
 const API_BASE_URL = process.env.NODE_ENV === 'production' ? '/api' : 'http://localhost:8000';
 
@@ -17,6 +17,16 @@ api.interceptors.request.use((config) => {
   return config;
 });
 
+// List endpoints return keyset-paginated pages; pass next_cursor back for the next one,
+// only when the user asks for more
+export interface Page<T> {
+  items: T[];
+  next_cursor: string | null;
+}
+
+const getPage = <T,>(url: string, params: Record<string, unknown>, cursor?: string) =>
+  api.get<Page<T>>(url, { params: { ...params, cursor } });
+
 // Auth API
 export const authAPI = {
   signup: (username: string, email: string, password: string, role: string, parent_id?: number, child_ids?: number[]) =>
@@ -38,9 +48,9 @@ export const childrenAPI = {
 
 // Folders API
 export const foldersAPI = {
-  getAll: (childId?: number) => {
+  getPage: (childId?: number, cursor?: string) => {
     const token = localStorage.getItem('token');
-    return api.get<Folder[]>('/folders', { params: { child_id: childId, token } });
+    return getPage<Folder>('/folders', { child_id: childId, token }, cursor);
   },
   create: (name: string) => api.post<Folder>('/folders', { name }),
   delete: (id: number) => api.delete(`/folders/${id}`),
@@ -48,14 +58,63 @@ export const foldersAPI = {
 
 // Notes API
 export const notesAPI = {
-  getAll: (folderId?: number, childId?: number) => {
+  getPage: (folderId?: number, childId?: number, cursor?: string) => {
     const token = localStorage.getItem('token');
-    return api.get<Note[]>('/notes', { params: { folder_id: folderId, child_id: childId, token } });
+    return getPage<Note>('/notes', { folder_id: folderId, child_id: childId, token }, cursor);
   },
   create: (note: { title: string; content: string; tags?: string; is_todo?: boolean; folder_id?: number }) => {
     const token = localStorage.getItem('token');
     return api.post<Note>('/notes', { ...note, token });
   },
+  search: (q: string, folderId?: number, childId?: number) =>
+    api.get<NoteSearchResult[]>('/notes/search', { params: { q, folder_id: folderId, child_id: childId } }),
   update: (id: number, note: Partial<Note>) => api.put<Note>(`/notes/${id}`, note),
+  // Autosave: 409 means the note changed since baseVersion; reload it before retrying
+  patchContent: (id: number, baseVersion: number, edits: ContentEdit[]) =>
+    api.patch<ContentVersion>(`/notes/${id}/content`, { base_version: baseVersion, edits }),
   delete: (id: number) => api.delete(`/notes/${id}`),
-};
\ No newline at end of file
+  createMany: (notes: { title: string; content: string; tags?: string; is_todo?: boolean; folder_id?: number }[]) =>
+    api.post<BatchResult[]>('/notes/batch', { notes }),
+  updateMany: (notes: (Partial<Note> & { id: number })[]) => api.patch<BatchResult[]>('/notes/batch', { notes }),
+  deleteMany: (ids: number[]) => api.delete<BatchResult[]>('/notes/batch', { data: { ids } }),
+};
+
+// Tags API
+export const tagsAPI = {
+  getCounts: (childId?: number) => api.get<TagCount[]>('/tags', { params: { child_id: childId } }),
+};
+
+// Dashboard API
+export const dashboardAPI = {
+  get: () => api.get<ChildStats[]>('/dashboard'),
+};
+
+// Backup API: downloads and uploads stream, so pass files rather than parsed notes
+export const backupAPI = {
+  // A plain link works too: the token can go in the query string, as for events
+  exportUrl: (format: 'ndjson' | 'zip' = 'ndjson', childId?: number) => {
+    const params = new URLSearchParams({ format, token: localStorage.getItem('token') ?? '' });
+    if (childId) params.set('child_id', String(childId));
+    return `${API_BASE_URL}/export?${params}`;
+  },
+  // Resend the same file with the failed job's id to resume after its last committed batch
+  importNotes: (file: Blob, jobId?: number) =>
+    api.post<ImportJob>('/import', file, { params: { job_id: jobId }, headers: { 'Content-Type': 'application/x-ndjson' } }),
+  importStatus: (jobId: number) => api.get<ImportJob>(`/import/${jobId}`),
+};
+
+// Sync API
+export const syncAPI = {
+  // Pass the previous response's cursor; repeat while has_more is true
+  changes: (since?: string, childId?: number) =>
+    api.get<SyncResponse>('/sync', { params: { since, child_id: childId } }),
+};
+
+// Events API: EventSource cannot send headers, so the token goes in the query string
+export const eventsAPI = {
+  subscribe: (childId?: number) => {
+    const params = new URLSearchParams({ token: localStorage.getItem('token') ?? '' });
+    if (childId) params.set('child_id', String(childId));
+    return new EventSource(`${API_BASE_URL}/events?${params}`);
+  },
+};
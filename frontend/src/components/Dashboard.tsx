@@ -10,6 +10,9 @@ interface DashboardProps {
 const Dashboard: React.FC<DashboardProps> = ({ user, onLogout }) => {
   const [folders, setFolders] = useState<Folder[]>([]);
   const [notes, setNotes] = useState<Note[]>([]);
+  // Cursors of the next pages; null once the list is complete
+  const [foldersCursor, setFoldersCursor] = useState<string | null>(null);
+  const [notesCursor, setNotesCursor] = useState<string | null>(null);
   const [children, setChildren] = useState<Child[]>([]);
   const [selectedChild, setSelectedChild] = useState<Child | null>(null);
   const [selectedFolder, setSelectedFolder] = useState<number | null>(null);
@@ -36,10 +39,12 @@ const Dashboard: React.FC<DashboardProps> = ({ user, onLogout }) => {
           if (response.data.length > 0) {
             const firstChild = response.data[0];
             setSelectedChild(firstChild);
-            const foldersResponse = await foldersAPI.getAll(firstChild.id);
-            setFolders(foldersResponse.data);
-            const notesResponse = await notesAPI.getAll(undefined, firstChild.id);
-            setNotes(notesResponse.data);
+            const foldersResponse = await foldersAPI.getPage(firstChild.id);
+            setFolders(foldersResponse.data.items);
+            setFoldersCursor(foldersResponse.data.next_cursor);
+            const notesResponse = await notesAPI.getPage(undefined, firstChild.id);
+            setNotes(notesResponse.data.items);
+            setNotesCursor(notesResponse.data.next_cursor);
           }
         } catch (error) {
           console.error('Error loading parent data:', error);
@@ -47,11 +52,13 @@ const Dashboard: React.FC<DashboardProps> = ({ user, onLogout }) => {
       } else {
         try {
           const [foldersResponse, notesResponse] = await Promise.all([
-            foldersAPI.getAll(),
-            notesAPI.getAll()
+            foldersAPI.getPage(),
+            notesAPI.getPage()
           ]);
-          setFolders(foldersResponse.data);
-          setNotes(notesResponse.data);
+          setFolders(foldersResponse.data.items);
+          setFoldersCursor(foldersResponse.data.next_cursor);
+          setNotes(notesResponse.data.items);
+          setNotesCursor(notesResponse.data.next_cursor);
         } catch (error) {
           console.error('Error loading child data:', error);
         }
@@ -63,19 +70,22 @@ const Dashboard: React.FC<DashboardProps> = ({ user, onLogout }) => {
 
 
 
-  const loadFolders = async (childId?: number) => {
+  // Without a cursor these load the first page afresh; with one they append the next page
+  const loadFolders = async (childId?: number, cursor?: string) => {
     try {
-      const response = await foldersAPI.getAll(childId);
-      setFolders(response.data);
+      const response = await foldersAPI.getPage(childId, cursor);
+      setFolders(previous => cursor ? [...previous, ...response.data.items] : response.data.items);
+      setFoldersCursor(response.data.next_cursor);
     } catch (error) {
       console.error('Error loading folders:', error);
     }
   };
 
-  const loadNotes = async (folderId?: number, childId?: number) => {
+  const loadNotes = async (folderId?: number, childId?: number, cursor?: string) => {
     try {
-      const response = await notesAPI.getAll(folderId, childId);
-      setNotes(response.data);
+      const response = await notesAPI.getPage(folderId, childId, cursor);
+      setNotes(previous => cursor ? [...previous, ...response.data.items] : response.data.items);
+      setNotesCursor(response.data.next_cursor);
     } catch (error) {
       console.error('Error loading notes:', error);
     }
@@ -201,6 +211,14 @@ const Dashboard: React.FC<DashboardProps> = ({ user, onLogout }) => {
                   📁 {folder.name}
                 </button>
               ))}
+              {foldersCursor && (
+                <button
+                  className="load-more-btn"
+                  onClick={() => loadFolders(user.role === 'parent' ? selectedChild?.id : undefined, foldersCursor)}
+                >
+                  More folders
+                </button>
+              )}
             </div>
             {user.role === 'child' && (
               <div className="add-folder-section">
@@ -231,12 +249,12 @@ const Dashboard: React.FC<DashboardProps> = ({ user, onLogout }) => {
                 {selectedFolder ? (
                   <>
                     📁 {folders.find(f => f.id === selectedFolder)?.name}
-                    <span className="note-count">({notes.length} notes)</span>
+                    <span className="note-count">({notes.length}{notesCursor ? '+' : ''} notes)</span>
                   </>
                 ) : (
                   <>
                     📋 All Notes
-                    <span className="note-count">({notes.length} notes)</span>
+                    <span className="note-count">({notes.length}{notesCursor ? '+' : ''} notes)</span>
                   </>
                 )}
               </h2>
@@ -310,6 +328,14 @@ const Dashboard: React.FC<DashboardProps> = ({ user, onLogout }) => {
               ))
             )}
           </div>
+          {notesCursor && (
+            <button
+              className="load-more-btn"
+              onClick={() => loadNotes(selectedFolder || undefined, user.role === 'parent' ? selectedChild?.id : undefined, notesCursor)}
+            >
+              Load more notes
+            </button>
+          )}
         </main>
       </div>
 
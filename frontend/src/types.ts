@@ -22,6 +22,7 @@ export interface Note {
   id: number;
   title: string;
   content: string;
+  content_version: number;
   tags: string;
   is_todo: boolean;
   is_completed: boolean;
@@ -29,4 +30,66 @@ export interface Note {
   owner_id: number;
   created_at: string;
   updated_at: string;
-}
\ No newline at end of file
+}
+
+// Replaces [start, end) of the base content; offsets are string indices
+export interface ContentEdit {
+  start: number;
+  end: number;
+  text: string;
+}
+
+export interface ContentVersion {
+  id: number;
+  content_version: number;
+  updated_at: string;
+}
+
+export interface ImportJob {
+  id: number;
+  status: 'running' | 'failed' | 'complete';
+  lines_done: number;
+  folders_imported: number;
+  notes_imported: number;
+  error?: string;
+  created_at: string;
+  updated_at: string;
+}
+
+export interface NoteSearchResult extends Omit<Note, 'content' | 'content_version'> {
+  title_highlight: string;
+  snippet: string;
+  rank: number;
+}
+
+export interface BatchResult {
+  id: number | null;
+  status: number;
+  note?: Note;
+  detail?: string;
+}
+
+export interface TagCount {
+  name: string;
+  count: number;
+}
+
+export interface ChildStats {
+  id: number;
+  username: string;
+  note_count: number;
+  folder_count: number;
+  open_todo_count: number;
+  completed_todo_count: number;
+  last_activity_at?: string;
+}
+
+export interface SyncResponse {
+  notes: Note[];
+  folders: Folder[];
+  deleted_notes: number[];
+  deleted_folders: number[];
+  cursor: string;
+  has_more: boolean;
+  reset: boolean;
+}